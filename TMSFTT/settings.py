@@ -41,8 +41,8 @@ INSTALLED_APPS = [
     'auth.apps.AuthConfig',
     'infra',
     'training_program',
-    'training_event',
-    'training_record',
+    'training_event.apps.TrainingEventConfig',
+    'training_record.apps.TrainingRecordConfig',
     'training_review',
     'data_warehouse',
     'tiny_url',
@@ -63,8 +63,11 @@ MIDDLEWARE = [
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
     'django_cas.backends.CASBackend',
-    'guardian.backends.ObjectPermissionBackend',
+    'auth.backends.ObjectPermissionBackend',
 ]
+# auth.backends.ObjectPermissionBackend extends the guardian backend, which
+# guardian can't detect.
+SILENCED_SYSTEM_CHECKS = ['guardian.W001']
 
 AUTH_USER_MODEL = 'tmsftt_auth.User'
 
@@ -136,6 +139,7 @@ STATIC_URL = '/static/'
 JWT_AUTH = {
     'JWT_AUTH_HEADER_PREFIX': 'Bearer',
     'JWT_GET_USER_SECRET_KEY': 'auth.utils.get_user_secret_key',
+    'JWT_DECODE_HANDLER': 'auth.jwt_handlers.jwt_decode_handler',
     'JWT_AUDIENCE': 'TMSFTT clients',
     'JWT_ISSUER': 'TMSFTT server',
     'JWT_AUTH_COOKIE': 'ACCESS_TOKEN',
@@ -164,3 +168,6 @@ SOAP_AUTH_INTERFACE_METHOD = 'unknown'
 
 # Site settings
 SITE_ID = 1
+
+# Id of the school admin who is notified of events and records to review.
+SCHOOL_ADMIN_REVIEWER_ID = 10977
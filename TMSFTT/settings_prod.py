@@ -148,7 +148,12 @@ CELERY_TIMEZONE = 'Asia/Shanghai'
 CELERY_BEAT_SCHEDULE = {
     'update_teachers_and_departments_information': {
         'task': 'auth.tasks.update_teachers_and_departments_information',
-        'schedule': crontab(minute=0, hour=0)  # Daily at midnight.
+        'schedule': crontab(minute=30)  # Hourly, changed rows only.
+    },
+    'force_update_teachers_and_departments_information': {
+        'task': 'auth.tasks.update_teachers_and_departments_information',
+        'schedule': crontab(minute=0, hour=0),  # Daily at midnight.
+        'kwargs': {'force': True},
     },
     'generate_user_rankings': {
         'task': 'data_warehouse.tasks.generate_user_rankings',
@@ -162,9 +167,26 @@ CELERY_BEAT_SCHEDULE = {
     'send_mail_to_users_with_events_next_day': {
         'task': 'data_warehouse.tasks.send_mail_to_users_with_events_next_day',
         'schedule': crontab(minute=0, hour=7)  # Daily at morning.
-    }
+    },
+    'warm_up_caches': {
+        'task': 'drf_cache.tasks.warm_up_caches',
+        'schedule': crontab(minute='*/10'),  # Every 10 minutes.
+    },
+    'reconcile_num_enrolled': {
+        'task': 'training_event.tasks.reconcile_num_enrolled',
+        'schedule': crontab(minute=20, hour=0),  # Daily at 00:20.
+    },
 }
 
+# Warm up caches in the background after they are invalidated.
+DRF_CACHE_WARMUP_AFTER_INVALIDATION = True
+# Scheme and host of real requests as seen by Django, which cache keys of
+# warm-up requests are built from.
+DRF_CACHE_WARMUP_URL_SCHEME = os.environ.get(
+    'DRF_CACHE_WARMUP_URL_SCHEME', 'http')
+DRF_CACHE_WARMUP_HOST = os.environ.get(
+    'DRF_CACHE_WARMUP_HOST', 'ctfdpeixun.dlut.edu.cn')
+
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
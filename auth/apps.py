@@ -1,5 +1,6 @@
 '''Define how our app behave under different configs.'''
 from django.apps import AppConfig
+from django.db.models import signals
 
 
 class AuthConfig(AppConfig):
@@ -7,3 +8,57 @@ class AuthConfig(AppConfig):
     name = 'auth'
     label = 'tmsftt_auth'
     verbose_name = '权限'
+
+    def ready(self):
+        '''Drop loaded roles of users whose groups are changed, cached
+        permission templates once groups or their permissions are changed,
+        cached snapshots of users once users or their groups are changed,
+        and cached well-known objects once well-known users are changed.'''
+        from django.contrib.auth.models import Group
+        from auth.models import (
+            User, UserGroup, refresh_role_context_on_groups_change
+        )
+        from auth.permission_templates import invalidate_permission_templates
+        from auth.registry import invalidate_well_known_users_on_user_change
+        from auth.user_snapshots import (
+            invalidate_user_snapshot_on_user_change,
+            invalidate_user_snapshot_on_user_group_change,
+            invalidate_user_snapshots_on_groups_change,
+        )
+        signals.m2m_changed.connect(
+            refresh_role_context_on_groups_change,
+            sender=User.groups.through,
+            dispatch_uid='auth_refresh_role_context')
+        signals.m2m_changed.connect(
+            invalidate_permission_templates,
+            sender=Group.permissions.through,
+            dispatch_uid='auth_invalidate_permission_templates_m2m_changed')
+        signals.post_save.connect(
+            invalidate_permission_templates, sender=Group,
+            dispatch_uid='auth_invalidate_permission_templates_post_save')
+        signals.post_delete.connect(
+            invalidate_permission_templates, sender=Group,
+            dispatch_uid='auth_invalidate_permission_templates_post_delete')
+        signals.post_save.connect(
+            invalidate_user_snapshot_on_user_change, sender=User,
+            dispatch_uid='auth_invalidate_user_snapshot_post_save')
+        signals.post_delete.connect(
+            invalidate_user_snapshot_on_user_change, sender=User,
+            dispatch_uid='auth_invalidate_user_snapshot_post_delete')
+        signals.post_save.connect(
+            invalidate_well_known_users_on_user_change, sender=User,
+            dispatch_uid='auth_invalidate_well_known_users_post_save')
+        signals.post_delete.connect(
+            invalidate_well_known_users_on_user_change, sender=User,
+            dispatch_uid='auth_invalidate_well_known_users_post_delete')
+        signals.post_save.connect(
+            invalidate_user_snapshot_on_user_group_change, sender=UserGroup,
+            dispatch_uid='auth_invalidate_user_snapshot_user_group_post_save')
+        signals.post_delete.connect(
+            invalidate_user_snapshot_on_user_group_change, sender=UserGroup,
+            dispatch_uid=(
+                'auth_invalidate_user_snapshot_user_group_post_delete'))
+        signals.m2m_changed.connect(
+            invalidate_user_snapshots_on_groups_change,
+            sender=User.groups.through,
+            dispatch_uid='auth_invalidate_user_snapshots_m2m_changed')
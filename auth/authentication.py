@@ -1,12 +1,15 @@
 '''Authentication classes for JWT.'''
 from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
 from django.utils.encoding import smart_text
 from django.utils.translation import ugettext as _
 from rest_framework import exceptions
 from rest_framework.authentication import (
     get_authorization_header
 )
-from rest_framework_jwt.authentication import BaseJSONWebTokenAuthentication
+from rest_framework_jwt.authentication import (
+    BaseJSONWebTokenAuthentication, jwt_get_username_from_payload
+)
 
 from rest_framework_jwt.settings import api_settings
 
@@ -25,9 +28,33 @@ class JSONWebTokenAuthentication(BaseJSONWebTokenAuthentication):
     can get cookies correctly. If `request.path` starts with any routes listed
     in `settings.JWT_AUTH_COOKIE_WHITELIST` then cookie authentication will be
     permitted.
+
+    Users are read from cached snapshots, see `UserSnapshotCache`.
     """
     www_authenticate_realm = 'api'
 
+    def authenticate_credentials(self, payload):
+        '''Return the active user matching id and username of the payload.'''
+        from auth.user_snapshots import user_snapshots
+        username = jwt_get_username_from_payload(payload)
+        if not username:
+            msg = _('Invalid payload.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        try:
+            user = user_snapshots.get_user(payload.get('user_id'))
+        except (ObjectDoesNotExist, ValueError, TypeError):
+            user = None
+        if user is None or user.get_username() != username:
+            msg = _('Invalid signature.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        if not user.is_active:
+            msg = _('User account is disabled.')
+            raise exceptions.AuthenticationFailed(msg)
+
+        return user
+
     def get_jwt_value(self, request):
         '''Try to authenticate user.'''
         auth = get_authorization_header(request).split()
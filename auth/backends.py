@@ -0,0 +1,37 @@
+'''Authentication backends provided by auth module.'''
+from guardian import backends
+from guardian.ctypes import get_content_type
+from guardian.exceptions import WrongAppError
+
+
+class ObjectPermissionBackend(backends.ObjectPermissionBackend):
+    '''Guardian backend checking object permissions with the checker cached
+    on the user instance (see `User.object_permission_checker`), so
+    permission classes, serializers and services checking the same objects
+    during a request share the lookups.'''
+    @staticmethod
+    def get_checker(user_obj, obj):
+        '''Return the cached checker of the user, or None if the object or
+        the user is not supported.'''
+        support, user_obj = backends.check_support(user_obj, obj)
+        if not support:
+            return None
+        return user_obj.object_permission_checker
+
+    def has_perm(self, user_obj, perm, obj=None):
+        checker = self.get_checker(user_obj, obj)
+        if checker is None:
+            return False
+        if '.' in perm:
+            app_label, _ = perm.split('.', maxsplit=1)
+            if app_label not in (obj._meta.app_label,
+                                 get_content_type(obj).app_label):
+                raise WrongAppError(
+                    f'权限{perm}与对象{obj._meta.label}的应用不一致')
+        return checker.has_perm(perm, obj)
+
+    def get_all_permissions(self, user_obj, obj=None):
+        checker = self.get_checker(user_obj, obj)
+        if checker is None:
+            return set()
+        return checker.get_perms(obj)
@@ -0,0 +1,23 @@
+'''JWT handlers which are imported by rest_framework_jwt along with DRF
+settings, so models are only imported when handlers are called.'''
+import jwt
+from rest_framework_jwt.settings import api_settings
+
+
+def jwt_decode_handler(token):
+    '''Verify the token with the secret key of its user, who is read from
+    the cached snapshot instead of the database.'''
+    from auth.user_snapshots import user_snapshots
+    from auth.utils import get_user_secret_key
+    unverified_payload = jwt.decode(token, None, False)
+    user = user_snapshots.get_user(unverified_payload.get('user_id'))
+    return jwt.decode(
+        token,
+        api_settings.JWT_PUBLIC_KEY or get_user_secret_key(user),
+        api_settings.JWT_VERIFY,
+        options={'verify_exp': api_settings.JWT_VERIFY_EXPIRATION},
+        leeway=api_settings.JWT_LEEWAY,
+        audience=api_settings.JWT_AUDIENCE,
+        issuer=api_settings.JWT_ISSUER,
+        algorithms=[api_settings.JWT_ALGORITHM]
+    )
@@ -0,0 +1,110 @@
+'''Group memberships of users computed from departments and written in
+batches.'''
+from auth.models import Department, User, UserGroup
+from auth.user_snapshots import invalidate_user_snapshots
+from drf_cache.utils import batch_invalidation, invalidate_model_caches
+
+TEACHER_GROUP_SUFFIX = '-专任教师'
+MEMBERSHIP_BATCH_SIZE = 500
+
+
+class TeacherGroups(dict):
+    '''Ids of teacher groups along the department chain, keyed by ids of
+    departments, each department is looked up once.'''
+    def __missing__(self, department_id):
+        department = Department(pk=department_id)
+        self[department_id] = frozenset(
+            Department.get_groups(department.get_ancestors())
+            .filter(name__endswith=TEACHER_GROUP_SUFFIX)
+            .values_list('id', flat=True)
+        )
+        return self[department_id]
+
+
+class GroupMemberships:
+    '''Changes of group memberships of many users, applied at once.
+
+    Teacher groups of a user are the teacher groups along the chain of its
+    department. They are computed for each moved user and diffed against
+    current memberships, so only memberships which actually change are
+    written. Memberships are read with one query per batch of users, and
+    removed and added with bulk queries. Caches depending on them are
+    invalidated once.
+
+    Parameters
+    ----------
+    batch_size: int
+        The number of users or memberships per query. Default: 500
+    '''
+    def __init__(self, batch_size=MEMBERSHIP_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.teacher_groups = TeacherGroups()
+        # Ids of target teacher groups keyed by ids of moved users.
+        self.targets = {}
+        # Ids of other groups to add keyed by ids of users.
+        self.additions = {}
+
+    def move_user(self, user_id, department_id):
+        '''Put the user into teacher groups of the department, and remove it
+        from other teacher groups. The user is removed from all teacher
+        groups if department_id is None.'''
+        self.targets[user_id] = (
+            frozenset() if department_id is None
+            else self.teacher_groups[department_id])
+
+    def add_user(self, user_id, group_id):
+        '''Put the user into the group.'''
+        self.additions.setdefault(user_id, set()).add(group_id)
+
+    def _diff(self):
+        '''Return ids of memberships to remove, and pairs of ids of users
+        and groups to add.'''
+        removed_ids = []
+        added_pairs = {
+            (user_id, group_id)
+            for user_id, group_ids in self.additions.items()
+            for group_id in group_ids
+        }
+        user_ids = list(self.targets)
+        for start in range(0, len(user_ids), self.batch_size):
+            current = {}
+            for membership_id, user_id, group_id in UserGroup.objects.filter(
+                    user_id__in=user_ids[start:start + self.batch_size],
+                    group__name__endswith=TEACHER_GROUP_SUFFIX,
+            ).values_list('id', 'user_id', 'group_id'):
+                if group_id in self.targets[user_id]:
+                    current.setdefault(user_id, set()).add(group_id)
+                else:
+                    removed_ids.append(membership_id)
+            for user_id in user_ids[start:start + self.batch_size]:
+                added_pairs.update(
+                    (user_id, group_id) for group_id in
+                    self.targets[user_id] - current.get(user_id, set()))
+        return removed_ids, added_pairs
+
+    def apply(self):
+        '''Write the changes and forget them.
+
+        Returns
+        -------
+        stats: dict
+            Counts of memberships removed and added, memberships which
+            already exist are counted as added as well.
+        '''
+        removed_ids, added_pairs = self._diff()
+        with batch_invalidation():
+            for start in range(0, len(removed_ids), self.batch_size):
+                UserGroup.objects.filter(
+                    id__in=removed_ids[start:start + self.batch_size],
+                ).delete()
+            UserGroup.objects.bulk_create([
+                UserGroup(user_id=user_id, group_id=group_id)
+                for user_id, group_id in added_pairs
+            ], batch_size=self.batch_size, ignore_conflicts=True)
+            if removed_ids or added_pairs:
+                invalidate_model_caches(User, UserGroup)
+                invalidate_user_snapshots(
+                    set(self.targets) | set(self.additions))
+        self.targets = {}
+        self.additions = {}
+        return {'removed': len(removed_ids), 'added': len(added_pairs)}
@@ -0,0 +1,59 @@
+# Generated by Django 2.2 on 2026-10-18 03:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_department_closure(apps, schema_editor):
+    '''Build paths of existing departments.'''
+    Department = apps.get_model('tmsftt_auth', 'Department')
+    DepartmentClosure = apps.get_model('tmsftt_auth', 'DepartmentClosure')
+    super_department_ids = dict(
+        Department.objects.values_list('id', 'super_department_id'))
+    paths = []
+    for department_id in super_department_ids:
+        ancestor_ids = []
+        ancestor_id = department_id
+        while ancestor_id is not None and ancestor_id not in ancestor_ids:
+            ancestor_ids.append(ancestor_id)
+            ancestor_id = super_department_ids.get(ancestor_id)
+        paths.extend(
+            DepartmentClosure(ancestor_id=ancestor_id,
+                              descendant_id=department_id, depth=depth)
+            for depth, ancestor_id in enumerate(ancestor_ids)
+        )
+    DepartmentClosure.objects.bulk_create(paths, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tmsftt_auth', '0009_auto_20190620_1620'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepartmentClosure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveSmallIntegerField(verbose_name='层级距离')),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_closures', to='tmsftt_auth.Department', verbose_name='上级单位')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_closures', to='tmsftt_auth.Department', verbose_name='下级单位')),
+            ],
+            options={
+                'verbose_name': '院系层级',
+                'verbose_name_plural': '院系层级',
+                'default_permissions': (),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='departmentclosure',
+            index=models.Index(fields=['descendant', 'depth'], name='tmsftt_auth_descend_2e9da9_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='departmentclosure',
+            unique_together={('ancestor', 'descendant')},
+        ),
+        migrations.RunPython(build_department_closure,
+                             migrations.RunPython.noop),
+    ]
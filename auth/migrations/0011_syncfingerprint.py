@@ -0,0 +1,28 @@
+# Generated by Django 2.2 on 2026-10-18 03:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tmsftt_auth', '0010_departmentclosure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncFingerprint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('teacher', '教师基本信息'), ('department', '单位基本信息')], max_length=20, verbose_name='数据来源')),
+                ('key', models.CharField(max_length=20, verbose_name='主键')),
+                ('fingerprint', models.CharField(max_length=32, verbose_name='指纹')),
+            ],
+            options={
+                'verbose_name': '同步指纹',
+                'verbose_name_plural': '同步指纹',
+                'default_permissions': (),
+                'unique_together': {('source', 'key')},
+            },
+        ),
+    ]
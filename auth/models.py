@@ -1,8 +1,13 @@
 '''Define ORM models for auth module.'''
+import operator
+from functools import reduce
+
 from django.contrib.auth.models import (
     Permission, AbstractUser, Group, UserManager
 )
-from django.db import models
+from django.db import models, transaction
+from django.utils.functional import cached_property
+from guardian.core import ObjectPermissionChecker
 
 from auth.utils import (
     EducationBackgroundConverter,
@@ -65,6 +70,148 @@ class Department(models.Model):
     def __str__(self):
         return str(self.name)
 
+    def save(self, *args, **kwargs):  # pylint: disable=W0221
+        super().save(*args, **kwargs)
+        DepartmentClosure.objects.update_department(self)
+
+    def get_ancestors(self, include_self=True):
+        '''Return ancestors of the department, nearest first.'''
+        min_depth = 0 if include_self else 1
+        return Department.objects.filter(
+            descendant_closures__descendant=self,
+            descendant_closures__depth__gte=min_depth,
+        ).order_by('descendant_closures__depth')
+
+    def get_descendants(self, include_self=True):
+        '''Return all departments in the subtree of the department.'''
+        min_depth = 0 if include_self else 1
+        return Department.objects.filter(
+            ancestor_closures__ancestor=self,
+            ancestor_closures__depth__gte=min_depth,
+        )
+
+    def get_subtree_groups(self):
+        '''Return groups of all departments in the subtree.'''
+        return self.get_groups(self.get_descendants())
+
+    def get_ancestor_groups(self):
+        '''Return groups of the department and all its ancestors.'''
+        return self.get_groups(self.get_ancestors())
+
+    @staticmethod
+    def get_groups(departments):
+        '''Return groups of the departments, groups of a department are named
+        `{name}-{raw_department_id}-{role}`.
+
+        Prefixes of names are read first, so groups are matched by prefixes
+        of their names with the index on names.
+        '''
+        prefixes = {
+            f'{name}-{raw_department_id}-'
+            for name, raw_department_id in departments.values_list(
+                'name', 'raw_department_id')
+        }
+        if not prefixes:
+            return Group.objects.none()
+        return Group.objects.filter(reduce(operator.or_, (
+            models.Q(name__startswith=prefix) for prefix in sorted(prefixes)
+        )))
+
+
+class DepartmentClosureManager(models.Manager):
+    '''Maintain the closure table of the department hierarchy.'''
+    def update_department(self, department):
+        '''Update paths of the department after it is saved.
+
+        Paths of the whole subtree are moved if the super department of the
+        department is changed.
+        '''
+        paths = dict(
+            self.filter(descendant=department, depth__lte=1)
+            .values_list('depth', 'ancestor_id')
+        )
+        if 0 not in paths:
+            subtree = [(department.pk, 0)]
+            new_paths = [self.model(ancestor_id=department.pk,
+                                    descendant_id=department.pk, depth=0)]
+        elif paths.get(1) == department.super_department_id:
+            return
+        else:
+            subtree = list(
+                self.filter(ancestor=department)
+                .values_list('descendant_id', 'depth')
+            )
+            new_paths = []
+        subtree_ids = [descendant_id for descendant_id, _ in subtree]
+        if not new_paths:
+            self.filter(descendant_id__in=subtree_ids).exclude(
+                ancestor_id__in=subtree_ids).delete()
+        if department.super_department_id is not None:
+            # Ancestors within the subtree are skipped in case of cycles.
+            ancestors = (
+                self.filter(descendant_id=department.super_department_id)
+                .exclude(ancestor_id__in=subtree_ids)
+                .values_list('ancestor_id', 'depth')
+            )
+            new_paths.extend(
+                self.model(ancestor_id=ancestor_id,
+                           descendant_id=descendant_id,
+                           depth=ancestor_depth + descendant_depth + 1)
+                for ancestor_id, ancestor_depth in ancestors
+                for descendant_id, descendant_depth in subtree
+            )
+        self.bulk_create(new_paths)
+
+    @transaction.atomic()
+    def rebuild(self):
+        '''Rebuild the closure table from `Department.super_department`.'''
+        super_department_ids = dict(
+            Department.objects.values_list('id', 'super_department_id'))
+        paths = []
+        for department_id in super_department_ids:
+            ancestor_ids = []
+            ancestor_id = department_id
+            # Stop at visited ancestors in case of cycles.
+            while ancestor_id is not None and ancestor_id not in ancestor_ids:
+                ancestor_ids.append(ancestor_id)
+                ancestor_id = super_department_ids.get(ancestor_id)
+            paths.extend(
+                self.model(ancestor_id=ancestor_id,
+                           descendant_id=department_id, depth=depth)
+                for depth, ancestor_id in enumerate(ancestor_ids)
+            )
+        self.all().delete()
+        self.bulk_create(paths, batch_size=1000)
+
+
+class DepartmentClosure(models.Model):
+    '''DepartmentClosure stores a path for every pair of a department and
+    one of its ancestors (including itself), so ancestors or descendants of
+    a department can be read with a single indexed query.
+    '''
+    class Meta:
+        verbose_name = '院系层级'
+        verbose_name_plural = '院系层级'
+        default_permissions = ()
+        unique_together = (('ancestor', 'descendant'),)
+        indexes = [
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+    ancestor = models.ForeignKey(
+        Department, verbose_name='上级单位', on_delete=models.CASCADE,
+        related_name='descendant_closures')
+    descendant = models.ForeignKey(
+        Department, verbose_name='下级单位', on_delete=models.CASCADE,
+        related_name='ancestor_closures')
+    depth = models.PositiveSmallIntegerField(verbose_name='层级距离')
+
+    objects = DepartmentClosureManager()
+
+    def __str__(self):
+        return '单位{}是单位{}的{}级上级单位'.format(
+            self.ancestor_id, self.descendant_id, self.depth)
+
 
 class ActiveUserManager(UserManager):
     '''Filter queryset with active status.'''
@@ -128,31 +275,131 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    @cached_property
+    def role_context(self):
+        '''Roles of the user, loaded once per user instance.
+
+        Users are loaded per request, so roles are read once per request no
+        matter how many times they are checked.
+        '''
+        return RoleContext(self)
+
+    def refresh_role_context(self):
+        '''Drop the loaded roles, they are loaded again on next access.'''
+        self.__dict__.pop('role_context', None)
+
+    @cached_property
+    def object_permission_checker(self):
+        '''Guardian checker caching object permissions of the user, used by
+        `has_perm(perm, obj)`.
+
+        Permissions of each object are looked up once per user instance, or
+        once for many objects prefetched by `prefetch_object_permissions()`.
+        '''
+        return ObjectPermissionChecker(self)
+
+    def prefetch_object_permissions(self, objects):
+        '''Load object permissions of the user for objects of a model in one
+        query per permission table, such as objects of a list page.'''
+        objects = [x for x in objects if x is not None]
+        if objects and self.is_active:
+            self.object_permission_checker.prefetch_perms(objects)
+
+    def refresh_object_permissions(self):
+        '''Drop the loaded object permissions.'''
+        self.__dict__.pop('object_permission_checker', None)
+
     @property
     def is_teacher(self):
         '''Field to indicate whether the user is a teacher.'''
-        return self.groups.filter(name__endswith='专任教师').exists()
+        return self.role_context.is_teacher
 
     @property
     def is_department_admin(self):
         '''Field to indicate whether the user is a department admin.'''
-        return (
-            self.groups
-            .exclude(name='大连理工大学-10141-管理员')
-            .filter(name__endswith='管理员').exists()
-        )
+        return self.role_context.is_department_admin
 
     @property
     def is_school_admin(self):
         '''Field to indicate whether the user is a superadmin.'''
-        return self.is_staff or self.is_superuser or self.groups.filter(
-            name='大连理工大学-10141-管理员').exists()
+        return (self.is_staff or self.is_superuser
+                or self.role_context.is_school_admin)
 
     def check_department_admin(self, department):
         '''check department admin.'''
-        return self.groups.filter(
-            name=(f'{department.name}-{department.raw_department_id}-管理员')
-        ).exists()
+        return self.role_context.check_department_admin(department)
+
+
+class RoleContext:
+    '''Group names of a user and roles derived from them.
+
+    Groups prefetched along with the user are reused.
+
+    Parameters
+    ----------
+    user: User
+        The user whose group names are loaded.
+    group_names: iterable
+        Known group names of the user, which are not loaded again.
+        Default: None
+    '''
+    SCHOOL_ADMIN_GROUP_NAME = '大连理工大学-10141-管理员'
+
+    def __init__(self, user, group_names=None):
+        prefetched = getattr(user, '_prefetched_objects_cache', {})
+        if group_names is not None:
+            self.group_names = frozenset(group_names)
+        elif 'groups' in prefetched:
+            self.group_names = frozenset(x.name for x in prefetched['groups'])
+        else:
+            self.group_names = frozenset(
+                user.groups.values_list('name', flat=True))
+        self.admin_group_names = frozenset(
+            x for x in self.group_names if x.endswith('管理员'))
+
+    @property
+    def is_teacher(self):
+        '''Whether the user is in any teacher group.'''
+        return any(x.endswith('专任教师') for x in self.group_names)
+
+    @property
+    def is_department_admin(self):
+        '''Whether the user administers any department.'''
+        return bool(self.admin_group_names - {self.SCHOOL_ADMIN_GROUP_NAME})
+
+    @property
+    def is_school_admin(self):
+        '''Whether the user is in the school admin group.'''
+        return self.SCHOOL_ADMIN_GROUP_NAME in self.group_names
+
+    def check_department_admin(self, department):
+        '''Whether the user administers the department.'''
+        return (f'{department.name}-{department.raw_department_id}-管理员'
+                in self.admin_group_names)
+
+    @cached_property
+    def administered_department_ids(self):
+        '''Ids of departments the user administers.'''
+        raw_department_ids = [
+            x.rsplit('-', 2)[1] for x in self.admin_group_names
+            if x.count('-') >= 2
+        ]
+        if not raw_department_ids:
+            return frozenset()
+        return frozenset(
+            pk for pk, name, raw_department_id in Department.objects.filter(
+                raw_department_id__in=raw_department_ids,
+            ).values_list('pk', 'name', 'raw_department_id')
+            if f'{name}-{raw_department_id}-管理员' in self.admin_group_names
+        )
+
+
+def refresh_role_context_on_groups_change(instance, action, **_):
+    '''Drop loaded roles and object permissions of the user once its groups
+    are changed.'''
+    if isinstance(instance, User) and action.startswith('post_'):
+        instance.refresh_role_context()
+        instance.refresh_object_permissions()
 
 
 class UserGroup(models.Model):
@@ -295,6 +542,31 @@ class DepartmentInformation(models.Model):
         raise Exception('该表状态为只读')
 
 
+class SyncFingerprint(models.Model):
+    '''Fingerprint of a row mirrored from DLUT-ITS tables, so rows which
+    are not changed since the last sync can be skipped.'''
+    SOURCE_TEACHER = 'teacher'
+    SOURCE_DEPARTMENT = 'department'
+    SOURCE_CHOICES = (
+        (SOURCE_TEACHER, '教师基本信息'),
+        (SOURCE_DEPARTMENT, '单位基本信息'),
+    )
+
+    class Meta:
+        verbose_name = '同步指纹'
+        verbose_name_plural = '同步指纹'
+        default_permissions = ()
+        unique_together = (('source', 'key'),)
+
+    source = models.CharField(verbose_name='数据来源', max_length=20,
+                              choices=SOURCE_CHOICES)
+    key = models.CharField(verbose_name='主键', max_length=20)
+    fingerprint = models.CharField(verbose_name='指纹', max_length=32)
+
+    def __str__(self):
+        return '{}({})'.format(self.key, self.source)
+
+
 class DepartmentAdminInformation(models.Model):
     '''Raw data of department-admin information.
 
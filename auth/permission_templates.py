@@ -0,0 +1,99 @@
+'''Cache of groups and their model permissions, which are templates of
+object permissions assigned to created objects.'''
+from django.contrib.auth.models import Group
+
+from auth.models import GroupPermission
+from drf_cache.local import ModelDependentCache
+from drf_cache.utils import invalidate_model_caches
+
+PERMISSION_TEMPLATES_KEY_PREFIX = 'AUTH:PERMISSION_TEMPLATES:'
+
+
+class PermissionTemplates:
+    '''Groups and their model permissions.
+
+    Parameters
+    ----------
+    group_ids: dict
+        Ids of groups keyed by their names.
+    perms: dict
+        Ids of model permissions of groups, keyed by ids of groups and then
+        content types.
+    codenames: dict
+        Codenames of these permissions keyed by their ids.
+    '''
+    def __init__(self, group_ids, perms, codenames):
+        self.group_ids = group_ids
+        self.perms = perms
+        self.codenames = codenames
+
+    @classmethod
+    def load(cls):
+        '''Read groups and their permissions from the database.'''
+        perms = {}
+        codenames = {}
+        for group_id, content_type_id, perm_id, codename in (
+                GroupPermission.objects
+                .values_list('group_id', 'permission__content_type_id',
+                             'permission_id', 'permission__codename')
+                .order_by('id')):
+            perms.setdefault(group_id, {}).setdefault(
+                content_type_id, []).append(perm_id)
+            codenames[perm_id] = codename
+        return cls(dict(Group.objects.values_list('name', 'id')), perms,
+                   codenames)
+
+    def get_group_id(self, name):
+        '''Return id of the group, or None if it does not exist.'''
+        return self.group_ids.get(name)
+
+    def get_group_ids(self, name_prefixes):
+        '''Return ids of groups whose names start with any of the prefixes.'''
+        name_prefixes = tuple(name_prefixes)
+        if not name_prefixes:
+            return set()
+        return {
+            group_id for name, group_id in self.group_ids.items()
+            if name.startswith(name_prefixes)
+        }
+
+    def get_permission_ids(self, group_id, content_type_id):
+        '''Return ids of model permissions of the group for the content
+        type.'''
+        return self.perms.get(group_id, {}).get(content_type_id, [])
+
+    def has_permission(self, group_name, content_type_id, codename):
+        '''Whether the group is granted the model permission.'''
+        return any(
+            self.codenames[x] == codename
+            for x in self.get_permission_ids(
+                self.get_group_id(group_name), content_type_id)
+        )
+
+
+class PermissionTemplateCache(ModelDependentCache):
+    '''PermissionTemplates cached in the process and in the shared cache.
+
+    Templates only change when admins edit groups or their permissions,
+    versions of Group and its permission table are bumped then (see
+    `invalidate_permission_templates()`).
+    '''
+    key_prefix = PERMISSION_TEMPLATES_KEY_PREFIX
+    models = (Group, GroupPermission)
+
+    def load(self):
+        return PermissionTemplates.load()
+
+
+permission_templates = PermissionTemplateCache()  # pylint: disable=C0103
+
+
+def invalidate_permission_templates(sender, action=None, **_):
+    '''Drop cached permission templates once groups or their permissions are
+    changed.
+
+    Versions are bumped after the transaction commits, so other processes
+    can't cache the mappings read before the commit under new versions.
+    '''
+    if action in (None, 'post_add', 'post_remove', 'post_clear'):
+        invalidate_model_caches(sender)
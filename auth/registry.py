@@ -0,0 +1,158 @@
+'''Registry of well-known rows looked up by names or hard-coded ids, such as
+the school department, top-level departments and the notification robot.'''
+import copy
+
+from django.conf import settings
+from django.db.models import Q
+
+from auth.models import Department, User
+from auth.user_snapshots import user_snapshots
+from drf_cache.local import ModelDependentCache
+from drf_cache.utils import invalidate_versions
+
+WELL_KNOWN_OBJECTS_KEY_PREFIX = 'AUTH:WELL_KNOWN_OBJECTS:'
+# Bumped after well-known users are created, renamed or deleted, instead of
+# depending on every write of users.
+WELL_KNOWN_USERS_VERSION_KEY = 'AUTH:WELL_KNOWN_USERS_VERSION'
+SCHOOL_DEPARTMENT_NAME = '大连理工大学'
+NOTIFICATION_ROBOT_USERNAME = 'notification-robot'
+TOP_LEVEL_CAMPUS_NAMES = ('凌水主校区', '开发区校区', '盘锦校区')
+TOP_LEVEL_DEPARTMENT_TYPES = ('T3', 'T6', 'T7')
+TOP_LEVEL_INCLUDED_RAW_DEPARTMENT_IDS = (
+    '000133', '000216', '000360', '000340', '000356', '000329', '000308',
+    '000301', '000339', '000361', '000321', '001223', '000300',
+)
+TOP_LEVEL_EXCLUDED_RAW_DEPARTMENT_IDS = ('000355', '000354')
+
+
+class WellKnownObjects:
+    '''Well-known rows, or their ids.
+
+    Parameters
+    ----------
+    school_department: Department
+        The school department, None if it does not exist.
+    top_level_department_ids: tuple
+        Ids of top-level departments.
+    notification_robot_id: int
+        Id of the user sending system notifications, None if it does not
+        exist.
+    school_admin_reviewer_id: int
+        Id of the school admin notified of objects to review, None if it
+        does not exist.
+    '''
+    def __init__(self, school_department, top_level_department_ids,
+                 notification_robot_id, school_admin_reviewer_id):
+        self.school_department = school_department
+        self.top_level_department_ids = top_level_department_ids
+        self.notification_robot_id = notification_robot_id
+        self.school_admin_reviewer_id = school_admin_reviewer_id
+
+    @classmethod
+    def load(cls):
+        '''Read well-known rows from the database.'''
+        campuses = Department.objects.filter(name__in=TOP_LEVEL_CAMPUS_NAMES)
+        top_level_department_ids = tuple(
+            Department.objects.filter(
+                Q(super_department__in=campuses,
+                  department_type__in=TOP_LEVEL_DEPARTMENT_TYPES) |
+                Q(raw_department_id__in=TOP_LEVEL_INCLUDED_RAW_DEPARTMENT_IDS)
+            ).exclude(
+                raw_department_id__in=TOP_LEVEL_EXCLUDED_RAW_DEPARTMENT_IDS
+            ).order_by('id').values_list('id', flat=True))
+        user_ids = dict(User.objects.filter(
+            Q(username=NOTIFICATION_ROBOT_USERNAME)
+            | Q(id=settings.SCHOOL_ADMIN_REVIEWER_ID)
+        ).values_list('username', 'id'))
+        return cls(
+            Department.objects.filter(name=SCHOOL_DEPARTMENT_NAME).first(),
+            top_level_department_ids,
+            user_ids.get(NOTIFICATION_ROBOT_USERNAME),
+            (settings.SCHOOL_ADMIN_REVIEWER_ID
+             if settings.SCHOOL_ADMIN_REVIEWER_ID in user_ids.values()
+             else None),
+        )
+
+    def get_school_department(self):
+        '''Return a copy of the school department.
+
+        Raises
+        ------
+        Department.DoesNotExist
+            If the school department does not exist.
+        '''
+        if self.school_department is None:
+            raise Department.DoesNotExist(
+                f'单位{SCHOOL_DEPARTMENT_NAME}不存在')
+        return copy.deepcopy(self.school_department)
+
+    def get_school_department_id(self):
+        '''Return id of the school department, see
+        `get_school_department()`.'''
+        if self.school_department is None:
+            return self.get_school_department()
+        return self.school_department.id
+
+    @staticmethod
+    def _get_user(user_id, description):
+        if user_id is None:
+            raise User.DoesNotExist(f'{description}不存在')
+        return user_snapshots.get_user(user_id)
+
+    def get_notification_robot(self):
+        '''Return the user sending system notifications.
+
+        Raises
+        ------
+        User.DoesNotExist
+            If the user does not exist.
+        '''
+        return self._get_user(self.notification_robot_id, '通知机器人')
+
+    def get_school_admin_reviewer(self):
+        '''Return the school admin notified of objects to review.
+
+        Raises
+        ------
+        User.DoesNotExist
+            If the user does not exist.
+        '''
+        return self._get_user(self.school_admin_reviewer_id, '校级审核管理员')
+
+
+class WellKnownObjectCache(ModelDependentCache):
+    '''WellKnownObjects cached in the process and in the shared cache.
+
+    These rows change maybe once a year, they are loaded again whenever
+    departments are written, which mostly happens in the nightly sync, or
+    well-known users are changed (see `invalidate_well_known_users()`).
+    '''
+    key_prefix = WELL_KNOWN_OBJECTS_KEY_PREFIX
+    models = (Department,)
+
+    def get_version_keys(self):
+        return super().get_version_keys() | {WELL_KNOWN_USERS_VERSION_KEY}
+
+    def load(self):
+        return WellKnownObjects.load()
+
+
+def invalidate_well_known_users():
+    '''Load well-known objects again once the current transaction commits,
+    call this after users are created in bulk.'''
+    invalidate_versions([WELL_KNOWN_USERS_VERSION_KEY])
+
+
+def invalidate_well_known_users_on_user_change(instance, update_fields=None,
+                                               **_):
+    '''Load well-known objects again once a well-known user is saved with
+    its username, or deleted. Saves of other users, or of other fields such
+    as `last_login`, are ignored.'''
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    if (instance.username == NOTIFICATION_ROBOT_USERNAME
+            or instance.pk == settings.SCHOOL_ADMIN_REVIEWER_ID):
+        invalidate_well_known_users()
+
+
+well_known_objects = WellKnownObjectCache()  # pylint: disable=C0103
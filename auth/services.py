@@ -1,11 +1,16 @@
 '''Provide services related to auth module.'''
 from django.contrib.contenttypes.models import ContentType
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, Permission
 from django.db import transaction
-from django.db.models import Q
+from guardian.models import GroupObjectPermission, UserObjectPermission
 
 from auth.utils import assign_perm
-from auth.models import Department, UserGroup, User
+from auth.models import (
+    Department, DepartmentClosure, UserGroup, User
+)
+from auth.permission_templates import permission_templates
+from auth.registry import well_known_objects
+from drf_cache.utils import invalidate_instance_caches
 from infra.utils import prod_logger
 
 
@@ -28,20 +33,98 @@ class PermissionService:
         -------
         None
         '''
-        # i: assgin User-Object-Permissions for the current user
-        group = Group.objects.get(name='个人权限')
-        cls._assign_group_permissions(group, user, instance)
-
-        # ii: assgin Group-Object-Permissions for DepartmentGroup
-        related_department = user.department
-        while related_department:
-            name_prefix = (
-                f'{related_department.name}-'
-                f'{related_department.raw_department_id}-'
-            )
-            for group in Group.objects.filter(name__startswith=name_prefix):
-                cls._assign_group_permissions(group, group, instance)
-            related_department = related_department.super_department
+        cls.bulk_assign_object_permissions([(user, instance)])
+
+    # pylint: disable=R0914
+    @classmethod
+    @transaction.atomic()
+    def bulk_assign_object_permissions(cls, user_instance_pairs):
+        '''
+        Assign object permissions for many created objects at once, as
+        assign_object_permissions() does for each of them.
+
+        Groups and their permissions are read from the cached permission
+        templates, object permissions are inserted in batches, existing ones
+        are skipped. Cached responses of the objects are invalidated once the
+        transaction commits.
+
+        Parameters
+        ----------
+        user_instance_pairs: iterable
+            pairs of the user who create the object and the object.
+        Returns
+        -------
+        count: int
+            the number of object permissions assigned, including the ones
+            which already exist.
+        '''
+        pairs = list(user_instance_pairs)
+        if not pairs:
+            return 0
+        templates = permission_templates.get()
+        personal_group_id = templates.get_group_id('个人权限')
+        if personal_group_id is None:
+            raise Group.DoesNotExist('个人权限用户组不存在')
+        department_group_ids = cls._get_department_group_ids(
+            {user.department_id for user, _ in pairs}, templates)
+        content_types = ContentType.objects.get_for_models(
+            *{instance._meta.model for _, instance in pairs})
+
+        user_perms = {}
+        group_obj_perms = {}
+        for user, instance in pairs:
+            content_type_id = content_types[instance._meta.model].id
+            object_pk = str(instance.pk)
+            for perm_id in templates.get_permission_ids(
+                    personal_group_id, content_type_id):
+                user_perms[(user.pk, perm_id, object_pk)] = (
+                    UserObjectPermission(
+                        user_id=user.pk, permission_id=perm_id,
+                        content_type_id=content_type_id,
+                        object_pk=object_pk))
+            for group_id in department_group_ids.get(user.department_id, []):
+                for perm_id in templates.get_permission_ids(
+                        group_id, content_type_id):
+                    group_obj_perms[(group_id, perm_id, object_pk)] = (
+                        GroupObjectPermission(
+                            group_id=group_id, permission_id=perm_id,
+                            content_type_id=content_type_id,
+                            object_pk=object_pk))
+        UserObjectPermission.objects.bulk_create(
+            user_perms.values(), batch_size=1000, ignore_conflicts=True)
+        GroupObjectPermission.objects.bulk_create(
+            group_obj_perms.values(), batch_size=1000,
+            ignore_conflicts=True)
+        for user, _ in pairs:
+            user.refresh_object_permissions()
+        # Bulk inserts send no signals, and views filtering objects by
+        # permissions do not depend on permission models, so evict their
+        # responses of the objects as if the objects were created.
+        for model_cls in content_types:
+            invalidate_instance_caches(model_cls, [
+                instance.pk for _, instance in pairs
+                if instance._meta.model is model_cls], created=True)
+        count = len(user_perms) + len(group_obj_perms)
+        msg = f'为{len(pairs)}个对象赋予了{count}项对象权限'
+        prod_logger.info(msg)
+        return count
+
+    @staticmethod
+    def _get_department_group_ids(department_ids, templates):
+        '''Return ids of groups of departments and their ancestors, keyed
+        by ids of departments.'''
+        department_prefixes = {}
+        for department_id, name, raw_department_id in (
+                DepartmentClosure.objects
+                .filter(descendant_id__in=department_ids)
+                .values_list('descendant_id', 'ancestor__name',
+                             'ancestor__raw_department_id')):
+            department_prefixes.setdefault(department_id, []).append(
+                f'{name}-{raw_department_id}-')
+        return {
+            department_id: templates.get_group_ids(prefixes)
+            for department_id, prefixes in department_prefixes.items()
+        }
 
     # pylint: disable=redefined-builtin
     @classmethod
@@ -65,8 +148,10 @@ class PermissionService:
         '''
         content_type = ContentType.objects.get_for_model(
             instance._meta.model)
-        for perm in group.permissions.all().filter(
-                content_type_id=content_type.id):
+        perm_ids = permission_templates.get().get_permission_ids(
+            group.id, content_type.id)
+        for perm in Permission.objects.filter(id__in=perm_ids).select_related(
+                'content_type'):
             assign_perm(perm, user_or_group, instance)
 
 
@@ -85,27 +170,25 @@ class DepartmentService:
     Provide services for Departments.
     '''
     @staticmethod
-    def get_top_level_departments():
-        '''Get top level departments.
+    def get_top_level_departments(include_school=False):
+        '''Get top level departments, whose ids are read from the registry
+        (see `auth.registry.WellKnownObjects`).
+
+        Parameters
+        ----------
+        include_school: bool
+            Whether to include the school department. Default: False
 
         Returns
         -------
-        result: dict
-            the dict of top_level_departments
+        result: QuerySet
+            the queryset of top_level_departments
         '''
-        departments = Department.objects.filter(
-            name__in=('凌水主校区', '开发区校区', '盘锦校区')
-        )
-        include_departments = {'000133', '000216', '000360', '000340',
-                               '000356', '000329', '000308', '000301',
-                               '000339', '000361', '000321', '001223',
-                               '000300'}
-        exclude_departments = {'000355', '000354'}
-        return Department.objects.all().filter(
-            Q(super_department__in=departments,
-              department_type__in=('T3', 'T6', 'T7')) |
-            Q(raw_department_id__in=include_departments)).exclude(
-                raw_department_id__in=exclude_departments)
+        objects = well_known_objects.get()
+        department_ids = list(objects.top_level_department_ids)
+        if include_school and objects.school_department is not None:
+            department_ids.append(objects.school_department.id)
+        return Department.objects.filter(id__in=department_ids)
 
 
 class GroupService:
@@ -126,17 +209,10 @@ class GroupService:
             the queryset of all the groups which belongs to a
             top_level_department
         '''
-        departments = list(Department.objects.filter(id=department_id))
-        if not departments:
+        department = Department.objects.filter(id=department_id).first()
+        if department is None:
             return []
-        search_list = departments
-        while search_list:
-            search_list = list(Department.objects.filter(
-                super_department__in=[d.id for d in search_list]))
-            departments.extend(search_list)
-        regex = '^({})'.format('|'.join(
-            f'{d.name}-{d.raw_department_id}-' for d in departments))
-        return Group.objects.filter(name__regex=regex)
+        return department.get_subtree_groups()
 
 
 class UserGroupService:
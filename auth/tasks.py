@@ -1,30 +1,85 @@
 '''Celery tasks.'''
+import hashlib
 from datetime import datetime
 
 from celery import shared_task
 
+from django.core.cache import cache
 from django.db import transaction
 from django.utils.dateparse import parse_datetime
 from django.utils.timezone import make_aware, make_naive, now
 from django.contrib.auth.models import Group
 from auth.models import (
-    User, Department, DepartmentInformation, TeacherInformation, UserGroup)
+    User, Department, DepartmentClosure, DepartmentInformation,
+    SyncFingerprint, TeacherInformation, UserGroup)
+from auth.memberships import GroupMemberships
+from auth.permission_templates import permission_templates
+from auth.registry import invalidate_well_known_users
+from auth.user_snapshots import invalidate_user_snapshots
 from auth.utils import assign_model_perms_for_department
+from drf_cache.utils import batch_invalidation, invalidate_model_caches
 
 from infra.utils import prod_logger
 
 DLUT_ID = '10141'
 DLUT_NAME = '大连理工大学'
+SYNC_BATCH_SIZE = 500
+# Only one sync runs at a time, the lock is released if the worker dies.
+SYNC_LOCK_KEY = 'AUTH:SYNC_LOCK'
+SYNC_LOCK_TIMEOUT = 2 * 60 * 60
+# Seconds before a forced sync blocked by a running sync is retried.
+SYNC_RETRY_DELAY = 10 * 60
+USER_SYNC_FIELDS = (
+    'first_name', 'department_id', 'administrative_department_id', 'gender',
+    'age', 'onboard_time', 'tenure_status', 'education_background',
+    'technical_title', 'teaching_type', 'cell_phone_number', 'email',
+)
 
 
-def update_user_groups(handler, dep, dlut):
-    '''增删某一群用户的department链上的group'''
-    while dep.raw_department_id != dlut.raw_department_id:
-        handler(Group.objects.get(
-            name=f'{dep.name}-{dep.raw_department_id}-专任教师'))
-        dep = dep.super_department
-    handler(Group.objects.get(
-        name=f'{dep.name}-{dep.raw_department_id}-专任教师'))
+def _build_fingerprint(row):
+    '''Return hash of all mirrored columns of the raw row.'''
+    values = [repr(getattr(row, field.attname))
+              for field in row._meta.concrete_fields]
+    return hashlib.md5('\x1f'.join(values).encode()).hexdigest()
+
+
+def _filter_changed_rows(rows, source, force=False):
+    '''Return rows which appeared or changed since the last sync, and update
+    their fingerprints. Fingerprints of disappeared rows are deleted.
+
+    Parameters
+    ----------
+    rows: list
+        All raw rows of the source.
+    source: str
+        One of SyncFingerprint.SOURCE_CHOICES.
+    force: bool
+        Return all rows regardless of their fingerprints. Default: False
+    '''
+    fingerprints = {
+        x.key: x for x in SyncFingerprint.objects.filter(source=source)}
+    changed_rows = []
+    new_fingerprints = []
+    changed_fingerprints = []
+    for row in rows:
+        fingerprint = _build_fingerprint(row)
+        stored = fingerprints.pop(row.pk, None)
+        if stored is None:
+            new_fingerprints.append(SyncFingerprint(
+                source=source, key=row.pk, fingerprint=fingerprint))
+        elif stored.fingerprint != fingerprint:
+            stored.fingerprint = fingerprint
+            changed_fingerprints.append(stored)
+        elif not force:
+            continue
+        changed_rows.append(row)
+    SyncFingerprint.objects.bulk_create(new_fingerprints,
+                                        batch_size=SYNC_BATCH_SIZE)
+    SyncFingerprint.objects.bulk_update(changed_fingerprints, ['fingerprint'],
+                                        batch_size=SYNC_BATCH_SIZE)
+    SyncFingerprint.objects.filter(
+        pk__in=[x.pk for x in fingerprints.values()]).delete()
+    return changed_rows
 
 
 def _update_from_department_information():
@@ -32,14 +87,31 @@ def _update_from_department_information():
     # pylint: disable=R0915
     # pylint: disable=R1702
     # pylint: disable=R0914
-    '''Scan table DepartmentInformation and update related tables.'''
+    '''Scan table DepartmentInformation and update related tables.
+
+    Departments and groups are loaded once, new departments are inserted,
+    changed departments are updated in batches.
+    '''
     prod_logger.info('开始扫描并更新部门信息')
     # 校区初始化
     dlut, _ = Department.objects.get_or_create(raw_department_id=DLUT_ID,
                                                defaults={'name': DLUT_NAME})
     raw_departments = DepartmentInformation.objects.exclude(dwid=DLUT_ID)
+    dwid_to_dwmc = dict(
+        DepartmentInformation.objects.values_list('dwid', 'dwmc'))
+    id_to_department = {x.id: x for x in Department.objects.all()}
+    for department in id_to_department.values():
+        department.super_department = id_to_department.get(
+            department.super_department_id)
+    departments = {
+        x.raw_department_id: x for x in id_to_department.values()}
+    group_names = set(permission_templates.get().group_ids)
     dwid_to_department = {}
     department_id_to_administrative = {}
+    updated_departments = {}
+    # New names of groups keyed by old names, groups are renamed at once.
+    renamed_groups = {}
+    stats = {'inserted': 0, 'updated': 0, 'unchanged': 0}
 
     def update_administrative(department_id_to_administrative):
         # 更新administrative
@@ -56,31 +128,31 @@ def _update_from_department_information():
 
     def update_group_and_perms(department, created):
         # 同步group
-        group_names = [
-            f'{department.name}-{department.raw_department_id}-管理员',
-            f'{department.name}-{department.raw_department_id}-专任教师',
-        ]
-        for group_name in group_names:
-            Group.objects.get_or_create(name=group_name)
+        for role in ('管理员', '专任教师'):
+            group_name = (
+                f'{department.name}-{department.raw_department_id}-{role}')
+            if group_name not in group_names:
+                Group.objects.get_or_create(name=group_name)
+                group_names.add(group_name)
         if created:
             assign_model_perms_for_department(department)
 
+    def get_or_create_department(raw_department_id, name):
+        created = raw_department_id not in departments
+        if created:
+            departments[raw_department_id] = Department.objects.create(
+                raw_department_id=raw_department_id, name=name)
+        return departments[raw_department_id], created
+
     def find_all_child_department(super_department):
         # 将当前department的所有叶子结点返回
-        childs = []
-        child_departments = super_department.child_departments.all()
-        if child_departments:
-            for child_department in child_departments:
-                childs.extend(find_all_child_department(child_department))
-        else:
-            childs.extend([super_department])
-        return childs
+        return super_department.get_descendants().filter(
+            child_departments__isnull=True)
     try:
         for raw_department in raw_departments:
-            department, created = Department.objects.get_or_create(
-                raw_department_id=raw_department.dwid,
-                defaults={'name': raw_department.dwmc})
-            update_group_and_perms(department, created)
+            department, department_created = get_or_create_department(
+                raw_department.dwid, raw_department.dwmc)
+            update_group_and_perms(department, department_created)
             updated = False
             # 同步隶属单位
             if (department.super_department is None or
@@ -91,23 +163,22 @@ def _update_from_department_information():
                 if not raw_department.lsdw:
                     raw_department.lsdw = DLUT_ID
                 if raw_department.lsdw != DLUT_ID:
-                    super_department_name = DepartmentInformation.objects.get(
-                        dwid=raw_department.lsdw).dwmc
-                super_department, created = Department.objects.get_or_create(
-                    raw_department_id=raw_department.lsdw,
-                    defaults={'name': super_department_name}
-                )
+                    super_department_name = dwid_to_dwmc[raw_department.lsdw]
+                super_department, created = get_or_create_department(
+                    raw_department.lsdw, super_department_name)
                 update_group_and_perms(super_department, created)
                 # 将老师从原有group中删除
                 if department.super_department:
-                    child_departments = find_all_child_department(
-                        department.super_department)
-                    for child in child_departments:
-                        teachers = User.objects.filter(department=child)
-                        UserGroup.objects.filter(
-                            user__in=teachers,
-                            group__name__endswith='-专任教师').delete()
-                        teachers.update(department=None)
+                    teachers = User.objects.filter(
+                        department__in=find_all_child_department(
+                            department.super_department))
+                    UserGroup.objects.filter(
+                        user__in=teachers,
+                        group__name__endswith='-专任教师').delete()
+                    invalidate_user_snapshots(
+                        teachers.values_list('pk', flat=True))
+                    teachers.update(department=None)
+                    invalidate_model_caches(User)
                 department.super_department = super_department
                 updated = True
             # 同步单位类型
@@ -120,16 +191,22 @@ def _update_from_department_information():
                 name_prefix = (
                     f'{department.name}-{department.raw_department_id}-'
                 )
-                related_groups = Group.objects.filter(
-                    name__startswith=name_prefix)
-                for group in related_groups:
-                    _, dwid, suffix = group.name.split('-')
-                    group.name = f'{raw_department.dwmc}-{dwid}-{suffix}'
-                    group.save()
+                for group_name in [x for x in group_names
+                                   if x.startswith(name_prefix)]:
+                    _, dwid, suffix = group_name.split('-')
+                    renamed_groups[group_name] = (
+                        f'{raw_department.dwmc}-{dwid}-{suffix}')
+                    group_names.add(renamed_groups[group_name])
                 department.name = raw_department.dwmc
                 updated = True
             if updated:
-                department.save()
+                updated_departments[department.id] = department
+            if department_created:
+                stats['inserted'] += 1
+            elif updated:
+                stats['updated'] += 1
+            else:
+                stats['unchanged'] += 1
             if dlut in (department.super_department,
                         department.super_department.super_department):
                 # 校区和二级部门的administrative为本身
@@ -139,90 +216,263 @@ def _update_from_department_information():
                 department_id_to_administrative[department.id] = (
                     department.super_department
                 )
+            dwid_to_department[raw_department.dwid] = department
     except Exception as exc:
         prod_logger.exception('部门信息更新失败,单位号:%s, excepiton:%s',
                               raw_department.dwid, exc)
         raise
+    # Paths of moved departments are rebuilt by the caller.
+    Department.objects.bulk_update(
+        updated_departments.values(),
+        ('super_department', 'department_type', 'name'),
+        batch_size=SYNC_BATCH_SIZE)
+    invalidate_model_caches(Department)
+    groups = list(Group.objects.filter(name__in=list(renamed_groups)))
+    for group in groups:
+        group.name = renamed_groups[group.name]
+    Group.objects.bulk_update(groups, ('name',), batch_size=SYNC_BATCH_SIZE)
+    if groups:
+        # Permission templates and roles of users depend on names of groups.
+        invalidate_model_caches(Group)
     department_id_to_administrative = update_administrative(
         department_id_to_administrative)
-    for raw_department in raw_departments:
-        department, created = Department.objects.get_or_create(
-            raw_department_id=raw_department.dwid,
-            defaults={'name': raw_department.dwmc})
-        dwid_to_department[raw_department.dwid] = department
 
-    prod_logger.info('部门信息更新完毕')
+    msg = f'部门信息更新完毕: {stats}'
+    prod_logger.info(msg)
 
     return dwid_to_department, department_id_to_administrative
 
 
+def _build_user_fields(raw_user, user, dwid_to_department,
+                       department_id_to_administrative):
+    '''Return field values of the user synced from the raw user.'''
+    fields = {
+        'first_name': raw_user.jsxm,
+        'department_id': user.department_id,
+        'administrative_department_id': user.administrative_department_id,
+        'gender': User.GENDER_CHOICES_MAP.get(
+            raw_user.get_xb_display(), User.GENDER_UNKNOWN),
+        'age': 0,
+        'onboard_time': user.onboard_time,
+        'tenure_status': raw_user.get_rzzt_display(),
+        'education_background': raw_user.get_xl_display(),
+        'technical_title': raw_user.get_zyjszc_display(),
+        'teaching_type': raw_user.get_rjlx_display(),
+        'cell_phone_number': raw_user.sjh,
+        'email': raw_user.yxdz if raw_user.yxdz else '',
+    }
+    department = dwid_to_department.get(raw_user.xy)
+    if department is None:
+        fields['department_id'] = None
+    elif user.department_id != department.id:
+        fields['department_id'] = department.id
+        fields['administrative_department_id'] = (
+            department_id_to_administrative[department.id].id)
+    if raw_user.csrq:
+        birthday = datetime.strptime(raw_user.csrq, '%Y-%m-%d')
+        fields['age'] = (make_naive(now()) - birthday).days // 365
+    if raw_user.rxsj:
+        fields['onboard_time'] = make_aware(
+            parse_datetime(f'{raw_user.rxsj}T12:00:00'))
+    return fields
+
+
+def _apply_group_changes(moves, new_usernames,
+                         personal_permission_group_id):
+    '''Move synced users into teacher groups of their departments, and add
+    new users into the personal permission group.
+
+    Parameters
+    ----------
+    moves: dict
+        Ids of new departments of users keyed by their usernames, None to
+        remove users from all teacher groups.
+    new_usernames: list
+        Usernames of new users.
+    personal_permission_group_id: int
+        Id of the personal permission group.
+    '''
+    username_to_id = dict(
+        User.all_objects.filter(username__in={*moves, *new_usernames})
+        .values_list('username', 'id'))
+    memberships = GroupMemberships(batch_size=SYNC_BATCH_SIZE)
+    for username, department_id in moves.items():
+        memberships.move_user(username_to_id[username], department_id)
+    for username in new_usernames:
+        memberships.add_user(username_to_id[username],
+                             personal_permission_group_id)
+    return memberships.apply()
+
+
 def _update_from_teacher_information(dwid_to_department,
-                                     department_id_to_administrative):
-    '''Scan table TeacherInformation and update related tables.'''
+                                     department_id_to_administrative,
+                                     raw_users=None):
+    # pylint: disable=R0912
+    # pylint: disable=R0914
+    # pylint: disable=R0915
+    '''Scan table TeacherInformation and update related tables.
+
+    Users are loaded once and compared field by field with raw users, new
+    users are inserted and changed users are updated in batches, unchanged
+    users are not written at all. Teacher groups are only changed for users
+    whose departments are changed.
+
+    Parameters
+    ----------
+    raw_users: list
+        Raw users to sync, all raw users if None. Default: None
+
+    Returns
+    -------
+    stats: dict
+        Counts of users inserted, updated and unchanged.
+    '''
+    # Imported lazily since training_record depends on auth.
+    from training_record.services import RECORD_USER_FIELDS, RecordService
     prod_logger.info('开始扫描并更新用户信息')
-    dlut, _ = Department.objects.get_or_create(raw_department_id=DLUT_ID,
-                                               defaults={'name': DLUT_NAME})
-    personal_permission_group, _ = Group.objects.get_or_create(name='个人权限')
-    raw_users = TeacherInformation.objects.all()
+    personal_permission_group_id = (
+        permission_templates.get().get_group_id('个人权限')
+        or Group.objects.get_or_create(name='个人权限')[0].id)
+    if raw_users is None:
+        raw_users = TeacherInformation.objects.all()
+        users = User.all_objects.all()
+    else:
+        users = User.all_objects.filter(
+            username__in=[x.zgh for x in raw_users])
+    users = {x.username: x for x in users}
+    new_users = []
+    changed_users = []
+    changed_fields = set()
+    # Ids of users whose fields rendered along with records are changed.
+    record_user_ids = []
+    # Ids of new departments of users keyed by their usernames, or None to
+    # remove users from all teacher groups.
+    moves = {}
+    num_unchanged = 0
     try:
         for raw_user in raw_users:
-            user, created = User.all_objects.get_or_create(
-                username=raw_user.zgh)
+            user = users.get(raw_user.zgh)
+            created = user is None
             if created:
-                user.groups.add(personal_permission_group)
+                user = User(username=raw_user.zgh)
                 user.set_unusable_password()
-            user.first_name = raw_user.jsxm
+            fields = _build_user_fields(raw_user, user, dwid_to_department,
+                                        department_id_to_administrative)
             if raw_user.xy not in dwid_to_department:
-                warn_msg = (
-                    f'职工号为{user.username}的教师'
-                    f'使用了一个系统中不存在的学院{raw_user.xy}'
-                )
-                if created or user.department:
+                if created or user.department_id:
+                    warn_msg = (
+                        f'职工号为{user.username}的教师'
+                        f'使用了一个系统中不存在的学院{raw_user.xy}'
+                    )
                     prod_logger.warning(warn_msg)
-                UserGroup.objects.filter(
-                    user=user,
-                    group__name__endswith='-专任教师').delete()
-                user.department = None
-            elif user.department != dwid_to_department.get(raw_user.xy):
-                if user.department:
-                    update_user_groups(user.groups.remove, user.department,
-                                       dlut)
-                user.department = dwid_to_department.get(raw_user.xy)
-                user.administrative_department = (
-                    department_id_to_administrative[user.department.id]
-                )
-                update_user_groups(user.groups.add, user.department, dlut)
-            user.gender = User.GENDER_CHOICES_MAP.get(
-                raw_user.get_xb_display(), User.GENDER_UNKNOWN)
-            user.age = 0
-            if raw_user.csrq:
-                birthday = datetime.strptime(raw_user.csrq, '%Y-%m-%d')
-                user.age = (make_naive(now()) - birthday).days // 365
-            if raw_user.rxsj and user.onboard_time != raw_user.rxsj:
-                user.onboard_time = make_aware(
-                    parse_datetime(f'{raw_user.rxsj}T12:00:00'))
-
-            user.tenure_status = raw_user.get_rzzt_display()
-            user.education_background = raw_user.get_xl_display()
-            user.technical_title = raw_user.get_zyjszc_display()
-            user.teaching_type = raw_user.get_rjlx_display()
-            user.cell_phone_number = raw_user.sjh
-            user.email = raw_user.yxdz if raw_user.yxdz else ''
-            user.save()
+                if not created:
+                    moves[user.username] = None
+            elif fields['department_id'] != user.department_id:
+                moves[user.username] = fields['department_id']
+            updated_fields = [
+                name for name, value in fields.items()
+                if getattr(user, name) != value
+            ]
+            for name in updated_fields:
+                setattr(user, name, fields[name])
+            if created:
+                new_users.append(user)
+            elif updated_fields:
+                changed_users.append(user)
+                changed_fields.update(updated_fields)
+                if RECORD_USER_FIELDS.intersection(updated_fields):
+                    record_user_ids.append(user.id)
+            else:
+                num_unchanged += 1
     except Exception as exc:
         prod_logger.exception('用户信息更新失败,职工号:%s, exception:%s',
                               raw_user.zgh, exc)
         raise
-    prod_logger.info('用户信息更新完毕')
+
+    User.all_objects.bulk_create(new_users, batch_size=SYNC_BATCH_SIZE)
+    if changed_users:
+        User.all_objects.bulk_update(
+            changed_users,
+            [x for x in USER_SYNC_FIELDS if x in changed_fields],
+            batch_size=SYNC_BATCH_SIZE)
+
+    invalidate_model_caches(User)
+    invalidate_user_snapshots(x.id for x in changed_users)
+    if record_user_ids:
+        RecordService.invalidate_caches_of_users(record_user_ids)
+    if new_users:
+        invalidate_well_known_users()
+    # 同步专任教师group
+    _apply_group_changes(moves, [x.username for x in new_users],
+                         personal_permission_group_id)
+
+    stats = {
+        'inserted': len(new_users),
+        'updated': len(changed_users),
+        'unchanged': num_unchanged,
+    }
+    msg = f'用户信息更新完毕: {stats}'
+    prod_logger.info(msg)
+    return stats
+
+
+@shared_task(max_retries=6)
+def update_teachers_and_departments_information(force=False):
+    '''Scan table TBL_DW_INFO and TBL_JB_INFO, update related tables.
+
+    Only teachers whose rows appeared or changed since the last sync are
+    synced, unless departments are changed (which might move teachers) or
+    a full sync is forced. Ages are derived from the current date, so a
+    full sync should still be forced periodically.
+
+    Runs are skipped while another one is running, forced runs are retried
+    later instead.
+
+    Parameters
+    ----------
+    force: bool
+        Sync all teachers regardless of their fingerprints. Default: False
+
+    Returns
+    -------
+    stats: dict
+        Counts of users inserted, updated and unchanged, None if the run is
+        skipped.
+    '''
+    if not cache.add(SYNC_LOCK_KEY, True, SYNC_LOCK_TIMEOUT):
+        if force:
+            raise update_teachers_and_departments_information.retry(
+                countdown=SYNC_RETRY_DELAY)
+        msg = '上一次同步尚未结束，跳过本次同步'
+        prod_logger.warning(msg)
+        return None
+    try:
+        return _sync_teachers_and_departments(force)
+    finally:
+        cache.delete(SYNC_LOCK_KEY)
 
 
-@shared_task
 @transaction.atomic()
-def update_teachers_and_departments_information():
-    '''Scan table TBL_DW_INFO and TBL_JB_INFO, update related tables.'''
+@batch_invalidation()
+def _sync_teachers_and_departments(force):
+    '''Sync departments and teachers in one transaction, see
+    `update_teachers_and_departments_information()`.'''
+    changed_departments = _filter_changed_rows(
+        DepartmentInformation.objects.all(),
+        SyncFingerprint.SOURCE_DEPARTMENT, force)
     dwid_to_department, department_id_to_administrative = (
         _update_from_department_information()
     )
+    if changed_departments:
+        # Paths of departments moved by bulk updates are not maintained on
+        # save, and forced runs repair any drift.
+        DepartmentClosure.objects.rebuild()
 
-    _update_from_teacher_information(dwid_to_department,
-                                     department_id_to_administrative)
+    raw_users = _filter_changed_rows(
+        TeacherInformation.objects.all(),
+        SyncFingerprint.SOURCE_TEACHER, force)
+    if changed_departments:
+        raw_users = None
+    return _update_from_teacher_information(dwid_to_department,
+                                            department_id_to_administrative,
+                                            raw_users)
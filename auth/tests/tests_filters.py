@@ -0,0 +1,148 @@
+'''Unit tests for auth filters.'''
+from unittest.mock import Mock
+
+from django.contrib.auth.models import Group, Permission
+from django.test import TestCase
+from model_mommy import mommy
+from rest_framework_guardian.filters import DjangoObjectPermissionsFilter
+
+from auth.filters import RowScopeFilter
+from auth.models import Department, User
+from auth.services import PermissionService
+from auth.utils import assign_model_perms_for_department
+from infra.models import Notification
+from infra.views import NotificationViewSet
+from training_event.models import CampusEvent
+from training_record.models import Record, RecordContent, RecordAttachment
+from training_record.views import (
+    RecordViewSet, RecordContentViewSet, RecordAttachmentViewSet
+)
+from training_review.models import ReviewNote
+from training_review.views import ReviewNoteViewSet
+
+PERSONAL_PERMISSIONS = (
+    'view_record', 'view_recordcontent', 'view_recordattachment',
+    'view_reviewnote', 'view_notification',
+)
+
+
+class TestRowScopeFilter(TestCase):
+    '''Unit tests for RowScopeFilter, which should filter the same objects
+    as DjangoObjectPermissionsFilter.'''
+    @classmethod
+    def setUpTestData(cls):
+        mommy.make(Group, name='个人权限').permissions.add(
+            *Permission.objects.filter(codename__in=PERSONAL_PERMISSIONS))
+        school = mommy.make(Department, name='大连理工大学',
+                            raw_department_id='10141')
+        college_a = mommy.make(Department, name='学院A', raw_department_id='1',
+                               super_department=school)
+        college_b = mommy.make(Department, name='学院B', raw_department_id='2',
+                               super_department=school)
+        department_a1 = mommy.make(Department, name='系A1',
+                                   raw_department_id='11',
+                                   super_department=college_a)
+        departments = (school, college_a, college_b, department_a1)
+        for department in departments:
+            for role in ('管理员', '专任教师'):
+                mommy.make(Group, name=(
+                    f'{department.name}-{department.raw_department_id}-'
+                    f'{role}'))
+            assign_model_perms_for_department(department)
+
+        cls.users = []
+        teachers = []
+        for department in departments:
+            admin = mommy.make(User, department=department)
+            admin.groups.add(Group.objects.get(name=(
+                f'{department.name}-{department.raw_department_id}-管理员')))
+            teacher = mommy.make(User, department=department)
+            teacher.groups.add(*department.get_ancestor_groups().filter(
+                name__endswith='-专任教师'))
+            cls.users.extend([admin, teacher])
+            teachers.append(teacher)
+        cls.users.append(mommy.make(User, department=None))
+
+        pairs = []
+        for teacher in teachers:
+            record = mommy.make(Record, user=teacher,
+                                campus_event=mommy.make(CampusEvent))
+            pairs.extend([
+                (teacher, record),
+                (teacher, mommy.make(RecordContent, record=record)),
+                (teacher, mommy.make(RecordAttachment, record=record)),
+                (teacher, mommy.make(Notification, recipient=teacher)),
+            ])
+            for admin in cls.users[:4:2]:
+                note = mommy.make(ReviewNote, record=record, user=admin)
+                pairs.extend([(admin, note), (teacher, note)])
+        PermissionService.bulk_assign_object_permissions(pairs)
+
+    def assert_parity(self, view_class):
+        '''Both filters should keep the same objects for every user.'''
+        view = view_class()
+        queryset = view_class.queryset.model.objects.all()
+        num_visible = 0
+        for user in self.users:
+            user = User.objects.get(pk=user.pk)
+            request = Mock(user=user)
+            expected = DjangoObjectPermissionsFilter().filter_queryset(
+                request, queryset, view)
+            result = RowScopeFilter().filter_queryset(
+                request, queryset, view)
+            self.assertCountEqual(result.values_list('pk', flat=True),
+                                  expected.values_list('pk', flat=True))
+            num_visible += expected.count()
+        self.assertGreaterEqual(num_visible, queryset.count())
+
+    def test_record_parity(self):
+        '''Should filter the same records as guardian.'''
+        self.assert_parity(RecordViewSet)
+
+    def test_record_content_parity(self):
+        '''Should filter the same record contents as guardian.'''
+        self.assert_parity(RecordContentViewSet)
+
+    def test_record_attachment_parity(self):
+        '''Should filter the same record attachments as guardian.'''
+        self.assert_parity(RecordAttachmentViewSet)
+
+    def test_review_note_parity(self):
+        '''Should filter the same review notes as guardian.'''
+        self.assert_parity(ReviewNoteViewSet)
+
+    def test_notification_parity(self):
+        '''Should filter the same notifications as guardian.'''
+        self.assert_parity(NotificationViewSet)
+
+    def test_scope_of_department_admin(self):
+        '''Should keep records owned within the administered subtree.'''
+        admin = User.objects.get(pk=self.users[2].pk)
+        request = Mock(user=admin)
+
+        records = RowScopeFilter().filter_queryset(
+            request, Record.objects.all(), RecordViewSet())
+
+        self.assertCountEqual(
+            records.values_list('user__department__name', flat=True),
+            ['学院A', '系A1'])
+
+    def test_superuser(self):
+        '''Should keep all objects for superusers.'''
+        request = Mock(user=mommy.make(User, is_superuser=True))
+
+        records = RowScopeFilter().filter_queryset(
+            request, Record.objects.all(), RecordViewSet())
+
+        self.assertEqual(records.count(), Record.objects.count())
+
+    def test_anonymous_user(self):
+        '''Should keep nothing for anonymous users.'''
+        request = Mock()
+        request.user.is_superuser = False
+        request.user.is_authenticated = False
+
+        records = RowScopeFilter().filter_queryset(
+            request, Record.objects.all(), RecordViewSet())
+
+        self.assertFalse(records.exists())
@@ -0,0 +1,90 @@
+'''Unit tests for auth memberships.'''
+from django.contrib.auth.models import Group
+from django.test import TestCase
+from model_mommy import mommy
+
+from auth.memberships import GroupMemberships
+from auth.models import Department, User, UserGroup
+
+
+class TestGroupMemberships(TestCase):
+    '''Unit tests for GroupMemberships.'''
+    @classmethod
+    def setUpTestData(cls):
+        school = mommy.make(Department, name='大连理工大学',
+                            raw_department_id='10141')
+        cls.colleges = [
+            mommy.make(Department, name=f'学院{idx}',
+                       raw_department_id=f'{idx}', super_department=school)
+            for idx in range(2)
+        ]
+        cls.school_group = mommy.make(Group, name='大连理工大学-10141-专任教师')
+        cls.college_groups = [
+            mommy.make(Group, name=f'学院{idx}-{idx}-专任教师')
+            for idx in range(2)
+        ]
+        cls.admin_group = mommy.make(Group, name='学院0-0-管理员')
+        cls.personal_group = mommy.make(Group, name='个人权限')
+
+    def setUp(self):
+        self.memberships = GroupMemberships(batch_size=2)
+        self.users = [mommy.make(User) for _ in range(3)]
+        for user in self.users:
+            user.groups.add(self.school_group, self.college_groups[0],
+                            self.admin_group)
+
+    def get_groups(self, user):
+        '''Return groups of the user.'''
+        return set(Group.objects.filter(user=user))
+
+    def test_move_users(self):
+        '''Should move users into teacher groups of new departments.'''
+        for user in self.users:
+            self.memberships.move_user(user.id, self.colleges[1].id)
+
+        stats = self.memberships.apply()
+
+        self.assertEqual(stats, {'removed': 3, 'added': 3})
+        for user in self.users:
+            self.assertEqual(self.get_groups(user), {
+                self.school_group, self.college_groups[1], self.admin_group})
+
+    def test_remove_teacher_groups(self):
+        '''Should remove users from all teacher groups.'''
+        self.memberships.move_user(self.users[0].id, None)
+
+        self.memberships.apply()
+
+        self.assertEqual(self.get_groups(self.users[0]), {self.admin_group})
+
+    def test_unchanged_memberships(self):
+        '''Should not write memberships which are not changed.'''
+        for user in self.users:
+            self.memberships.move_user(user.id, self.colleges[0].id)
+        ids = set(UserGroup.objects.values_list('id', flat=True))
+
+        stats = self.memberships.apply()
+
+        self.assertEqual(stats, {'removed': 0, 'added': 0})
+        self.assertEqual(set(UserGroup.objects.values_list('id', flat=True)),
+                         ids)
+
+    def test_add_users(self):
+        '''Should put users into other groups.'''
+        self.memberships.add_user(self.users[0].id, self.personal_group.id)
+
+        self.memberships.apply()
+
+        self.assertIn(self.personal_group, self.get_groups(self.users[0]))
+
+    def test_batched_queries(self):
+        '''Should read memberships of users in batches, and write them in
+        bulk.'''
+        for user in self.users:
+            self.memberships.move_user(user.id, self.colleges[1].id)
+        self.memberships.move_user(self.users[0].id, self.colleges[1].id)
+
+        # For each batch of 2 users or memberships: a read of memberships,
+        # a read and a delete of removed memberships, and an insert.
+        with self.assertNumQueries(8):
+            self.memberships.apply()
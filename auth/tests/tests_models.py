@@ -1,15 +1,18 @@
 '''Unit tests for auth models.'''
 from django.test import TestCase
 from django.contrib.auth.models import Group
+from guardian.exceptions import WrongAppError
 from model_mommy import mommy
 
 from auth.models import (
-    User, Department, GroupPermission,
+    User, Department, DepartmentClosure, GroupPermission,
     TeacherInformation, DepartmentInformation,
     DepartmentAdminInformation,
 )
 
+from auth.utils import assign_perm
 import auth.models
+from training_event.models import CampusEvent
 
 
 class TestUser(TestCase):
@@ -65,6 +68,99 @@ class TestUser(TestCase):
         self.assertTrue(user.check_department_admin(department1))
         self.assertFalse(user.check_department_admin(department2))
 
+    def test_load_roles_once(self):
+        '''Should query groups once for all role checks.'''
+        department = mommy.make(Department, raw_department_id='11',
+                                name="创新创业学院")
+        user = mommy.make(auth.models.User)
+        user.groups.add(mommy.make(Group, name="创新创业学院-11-管理员"))
+        user.groups.add(mommy.make(Group, name="创新创业学院-专任教师"))
+        user = User.objects.get(pk=user.pk)
+
+        with self.assertNumQueries(1):
+            for _ in range(10):
+                self.assertTrue(user.is_teacher)
+                self.assertTrue(user.is_department_admin)
+                self.assertFalse(user.is_school_admin)
+                self.assertTrue(user.check_department_admin(department))
+
+    def test_reuse_prefetched_groups(self):
+        '''Should read roles from prefetched groups.'''
+        user = mommy.make(auth.models.User)
+        user.groups.add(mommy.make(Group, name="创新创业学院-专任教师"))
+        user = User.objects.prefetch_related('groups').get(pk=user.pk)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(user.is_teacher)
+
+    def test_refresh_roles_on_groups_change(self):
+        '''Should reload roles after groups of the user are changed.'''
+        user = mommy.make(auth.models.User)
+        group = mommy.make(Group, name="大连理工大学-10141-管理员")
+        self.assertFalse(user.is_school_admin)
+
+        user.groups.add(group)
+        self.assertTrue(user.is_school_admin)
+
+        user.groups.remove(group)
+        self.assertFalse(user.is_school_admin)
+
+    def test_administered_department_ids(self):
+        '''Should return ids of departments administered by the user.'''
+        department = mommy.make(Department, raw_department_id='11',
+                                name="创新创业学院")
+        mommy.make(Department, raw_department_id='22', name="机械工程学院")
+        user = mommy.make(auth.models.User)
+        user.groups.add(mommy.make(Group, name="创新创业学院-11-管理员"))
+        user.groups.add(mommy.make(Group, name="大连理工大学-10141-管理员"))
+
+        self.assertEqual(user.role_context.administered_department_ids,
+                         {department.pk})
+
+    def test_check_object_permissions_once(self):
+        '''Should look up object permissions once per object.'''
+        user = mommy.make(auth.models.User)
+        event = mommy.make(CampusEvent)
+        assign_perm('training_event.view_campusevent', user, event)
+        self.assertTrue(user.has_perm('training_event.view_campusevent',
+                                      event))
+
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm('view_campusevent', event))
+            self.assertFalse(user.has_perm(
+                'training_event.change_campusevent', event))
+        with self.assertRaises(WrongAppError):
+            user.has_perm('infra.view_campusevent', event)
+
+    def test_prefetch_object_permissions(self):
+        '''Should load object permissions of many objects at once.'''
+        user = mommy.make(auth.models.User)
+        events = mommy.make(CampusEvent, _quantity=5)
+        for event in events[:3]:
+            assign_perm('training_event.view_campusevent', user, event)
+
+        with self.assertNumQueries(2):
+            user.prefetch_object_permissions(events)
+        with self.assertNumQueries(0):
+            self.assertEqual([
+                user.has_perm('training_event.view_campusevent', x)
+                for x in events
+            ], [True] * 3 + [False] * 2)
+
+    def test_refresh_object_permissions(self):
+        '''Should reload object permissions after they are changed.'''
+        user = mommy.make(auth.models.User)
+        group = mommy.make(Group)
+        event = mommy.make(CampusEvent)
+        self.assertFalse(user.has_perm('training_event.view_campusevent',
+                                       event))
+
+        assign_perm('training_event.view_campusevent', group, event)
+        user.groups.add(group)
+
+        self.assertTrue(user.has_perm('training_event.view_campusevent',
+                                      event))
+
 
 class TestDepartment(TestCase):
     '''Unit tests for model Department.'''
@@ -76,6 +172,60 @@ class TestDepartment(TestCase):
 
         self.assertEqual(str(department), name)
 
+    def test_get_ancestors_and_descendants(self):
+        '''Should read ancestors and descendants with a single query.'''
+        root = mommy.make(Department, name='root')
+        child = mommy.make(Department, name='child', super_department=root)
+        leaf = mommy.make(Department, name='leaf', super_department=child)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(list(leaf.get_ancestors()), [leaf, child, root])
+        with self.assertNumQueries(1):
+            self.assertEqual(set(root.get_descendants()), {root, child, leaf})
+        self.assertEqual(list(leaf.get_ancestors(include_self=False)),
+                         [child, root])
+        self.assertEqual(set(root.get_descendants(include_self=False)),
+                         {child, leaf})
+
+    def test_move_subtree(self):
+        '''Should move paths of the subtree along with the department.'''
+        root = mommy.make(Department, name='root')
+        other = mommy.make(Department, name='other', super_department=root)
+        child = mommy.make(Department, name='child', super_department=root)
+        leaf = mommy.make(Department, name='leaf', super_department=child)
+
+        child.super_department = other
+        child.save()
+
+        self.assertEqual(list(leaf.get_ancestors()),
+                         [leaf, child, other, root])
+        self.assertEqual(set(other.get_descendants()), {other, child, leaf})
+
+    def test_rebuild_closure(self):
+        '''Should rebuild paths from super departments.'''
+        root = mommy.make(Department, name='root')
+        child = mommy.make(Department, name='child', super_department=root)
+        Department.objects.filter(pk=child.pk).update(super_department=None)
+
+        DepartmentClosure.objects.rebuild()
+
+        self.assertEqual(list(child.get_ancestors()), [child])
+        self.assertEqual(DepartmentClosure.objects.count(), 2)
+
+    def test_get_subtree_groups(self):
+        '''Should return groups of departments in the subtree.'''
+        root = mommy.make(Department, name='root', raw_department_id='1')
+        child = mommy.make(Department, name='child', raw_department_id='2',
+                           super_department=root)
+        other = mommy.make(Department, name='other', raw_department_id='3')
+        groups = [mommy.make(Group, name=f'{x.name}-{x.raw_department_id}-管理员')
+                  for x in (root, child, other)]
+        mommy.make(Group, name='child-20-管理员')
+
+        with self.assertNumQueries(2):
+            self.assertEqual(set(root.get_subtree_groups()), set(groups[:2]))
+        self.assertEqual(set(child.get_ancestor_groups()), set(groups[:2]))
+
 
 class TestUserGroup(TestCase):
     '''Unit tests for model UserGroup.'''
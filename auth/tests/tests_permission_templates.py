@@ -0,0 +1,76 @@
+'''Unit tests for auth permission templates.'''
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from model_mommy import mommy
+
+from auth.permission_templates import PermissionTemplateCache
+from drf_cache.local import LocalCache
+from drf_cache.tests.tests_utils import LOCMEM_CACHES, run_commit_hooks
+from training_event.models import CampusEvent
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestPermissionTemplateCache(TestCase):
+    '''Unit tests for PermissionTemplateCache.'''
+    @classmethod
+    def setUpTestData(cls):
+        cls.content_type = ContentType.objects.get_for_model(CampusEvent)
+        cls.perms = list(Permission.objects.filter(
+            content_type=cls.content_type).order_by('id'))
+        cls.group = mommy.make(Group, name='学院-1-管理员')
+        cls.group.permissions.add(*cls.perms[:2])
+
+    def setUp(self):
+        cache.clear()
+        self.templates = PermissionTemplateCache(LocalCache(check_interval=0))
+
+    def test_get_templates(self):
+        '''Should map names of groups to ids and groups to permissions.'''
+        templates = self.templates.get()
+
+        self.assertEqual(templates.get_group_id('学院-1-管理员'),
+                         self.group.id)
+        self.assertIsNone(templates.get_group_id('学院-2-管理员'))
+        self.assertEqual(templates.get_group_ids(['学院-1-']), {self.group.id})
+        self.assertCountEqual(
+            templates.get_permission_ids(self.group.id, self.content_type.id),
+            [x.id for x in self.perms[:2]])
+        self.assertEqual(templates.get_permission_ids(self.group.id, -1), [])
+
+    def test_load_once(self):
+        '''Should read templates from the process, or the shared cache.'''
+        self.templates.get()
+
+        with self.assertNumQueries(0):
+            self.templates.get()
+            PermissionTemplateCache(LocalCache(check_interval=0)).get()
+
+    def test_invalidate_on_permissions_change(self):
+        '''Should reload templates once permissions of groups are changed.'''
+        self.templates.get()
+
+        self.group.permissions.add(self.perms[2])
+        run_commit_hooks()
+
+        self.assertEqual(len(self.templates.get().get_permission_ids(
+            self.group.id, self.content_type.id)), 3)
+
+    def test_invalidate_on_group_change(self):
+        '''Should reload templates once groups are created.'''
+        self.templates.get()
+
+        group = mommy.make(Group, name='学院-2-管理员')
+        run_commit_hooks()
+
+        self.assertEqual(self.templates.get().get_group_id('学院-2-管理员'),
+                         group.id)
+
+    def test_not_cached_without_versions(self):
+        '''Should not cache templates if the shared cache lacks versions.'''
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            self.templates.get()
+            with self.assertNumQueries(2):
+                self.templates.get()
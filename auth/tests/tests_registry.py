@@ -0,0 +1,99 @@
+'''Unit tests for auth registry.'''
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils.timezone import now
+from model_mommy import mommy
+
+from auth.models import Department, User
+from auth.registry import WellKnownObjectCache
+from drf_cache.local import LocalCache
+from drf_cache.tests.tests_utils import LOCMEM_CACHES, run_commit_hooks
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SCHOOL_ADMIN_REVIEWER_ID=10977)
+class TestWellKnownObjectCache(TestCase):
+    '''Unit tests for WellKnownObjectCache.'''
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = mommy.make(Department, name='大连理工大学')
+        campus = mommy.make(Department, name='凌水主校区',
+                            super_department=cls.school)
+        cls.college = mommy.make(Department, super_department=campus,
+                                 department_type='T3')
+        mommy.make(Department, super_department=campus, department_type='T1')
+        cls.robot = mommy.make(User, username='notification-robot')
+        cls.reviewer = mommy.make(User, id=10977)
+
+    def setUp(self):
+        cache.clear()
+        self.registry = WellKnownObjectCache(LocalCache(check_interval=0))
+
+    def test_get_objects(self):
+        '''Should look up well-known rows.'''
+        objects = self.registry.get()
+
+        self.assertEqual(objects.get_school_department_id(), self.school.id)
+        self.assertEqual(objects.get_school_department(), self.school)
+        self.assertEqual(objects.top_level_department_ids,
+                         (self.college.id,))
+        self.assertEqual(objects.get_notification_robot(), self.robot)
+        self.assertEqual(objects.get_school_admin_reviewer(), self.reviewer)
+
+    def test_load_once(self):
+        '''Should read rows from the process, or the shared cache.'''
+        self.registry.get()
+
+        with self.assertNumQueries(0):
+            self.registry.get().get_school_department()
+            WellKnownObjectCache(LocalCache(check_interval=0)).get()
+
+    def test_new_school_department_instances(self):
+        '''Should not share the cached school department.'''
+        objects = self.registry.get()
+
+        objects.get_school_department().name = '学院'
+
+        self.assertEqual(objects.get_school_department().name, '大连理工大学')
+
+    def test_invalidate_on_department_change(self):
+        '''Should read rows again once departments are written.'''
+        self.registry.get()
+
+        college = mommy.make(Department, raw_department_id='000133')
+        run_commit_hooks()
+
+        self.assertIn(college.id,
+                      self.registry.get().top_level_department_ids)
+
+    def test_invalidate_on_well_known_user_change(self):
+        '''Should read rows again once well-known users are changed.'''
+        User.objects.filter(pk=self.robot.pk).delete()
+        self.assertIsNone(self.registry.get().notification_robot_id)
+
+        robot = mommy.make(User, username='notification-robot')
+        run_commit_hooks()
+
+        self.assertEqual(self.registry.get().notification_robot_id, robot.id)
+
+    def test_keep_on_other_user_change(self):
+        '''Should keep rows after logins and writes of other users.'''
+        self.registry.get()
+
+        self.reviewer.last_login = now()
+        self.reviewer.save(update_fields=['last_login'])
+        mommy.make(User)
+        run_commit_hooks()
+
+        with self.assertNumQueries(0):
+            self.registry.get()
+
+    def test_missing_rows(self):
+        '''Should raise DoesNotExist for missing rows.'''
+        Department.objects.filter(name='大连理工大学').update(name='学院')
+        User.objects.filter(id=10977).delete()
+        objects = self.registry.get()
+
+        with self.assertRaises(Department.DoesNotExist):
+            objects.get_school_department_id()
+        with self.assertRaises(User.DoesNotExist):
+            objects.get_school_admin_reviewer()
@@ -4,6 +4,8 @@ from unittest.mock import patch
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission, Group
+from django.contrib.contenttypes.models import ContentType
+from guardian.models import GroupObjectPermission, UserObjectPermission
 from model_mommy import mommy
 
 import auth.services as services
@@ -119,6 +121,10 @@ class TestDepartmentService(TestCase):
 
         self.assertTrue(queryset.filter(id=depart4.id).exists())
         self.assertFalse(queryset.filter(id=depart5.id).exists())
+        self.assertFalse(queryset.filter(id=depart1.id).exists())
+        self.assertTrue(
+            services.DepartmentService.get_top_level_departments(
+                include_school=True).filter(id=depart1.id).exists())
 
 
 class TestGroupService(TestCase):
@@ -152,6 +158,74 @@ class TestGroupService(TestCase):
         self.assertFalse(queryset.filter(id=group4.id).exists())
 
 
+class TestBulkAssignObjectPermissions(TestCase):
+    '''Unit tests for PermissionService.bulk_assign_object_permissions.'''
+    @classmethod
+    def setUpTestData(cls):
+        perms = Permission.objects.filter(codename__in=PERMINSSION_MAP)
+        department_school = mommy.make(
+            Department, name="大连理工大学", raw_department_id='10141')
+        cls.departments = [mommy.make(
+            Department, name=f'学院{idx}', raw_department_id=f'{idx}',
+            super_department=department_school) for idx in range(2)]
+        mommy.make(Group, name="个人权限").permissions.add(*perms)
+        cls.admins = []
+        for department in [department_school] + cls.departments:
+            group = mommy.make(Group, name=(
+                f'{department.name}-{department.raw_department_id}-管理员'))
+            group.permissions.add(*perms)
+            admin = mommy.make(User)
+            admin.groups.add(group)
+            cls.admins.append(admin)
+
+    def test_bulk_assign_object_permissions(self):
+        '''Should assign permissions of all pairs with constant queries.'''
+        users = [mommy.make(User, department=self.departments[idx % 2])
+                 for idx in range(6)]
+        events = [mommy.make(CampusEvent) for _ in users]
+        ContentType.objects.get_for_model(CampusEvent)
+
+        with self.assertNumQueries(7):
+            count = services.PermissionService.bulk_assign_object_permissions(
+                zip(users, events))
+
+        # 4 permissions for the user and 2 department groups per event.
+        self.assertEqual(count, len(events) * 4 * 3)
+        self.assertFalse(users[1].has_perm('change_campusevent', events[0]))
+        for idx, (user, event) in enumerate(zip(users, events)):
+            self.assertTrue(user.has_perm('change_campusevent', event))
+            self.assertTrue(self.admins[0].has_perm('view_campusevent', event))
+            self.assertTrue(
+                self.admins[1 + idx % 2].has_perm('view_campusevent', event))
+            self.assertFalse(
+                self.admins[2 - idx % 2].has_perm('view_campusevent', event))
+
+    def test_skip_existing_permissions(self):
+        '''Should skip permissions which are already assigned.'''
+        user = mommy.make(User, department=self.departments[0])
+        event = mommy.make(CampusEvent)
+        services.PermissionService.assign_object_permissions(user, event)
+
+        services.PermissionService.bulk_assign_object_permissions(
+            [(user, event)])
+
+        self.assertEqual(UserObjectPermission.objects.count(), 4)
+        self.assertEqual(GroupObjectPermission.objects.count(), 8)
+
+    @patch('auth.services.invalidate_instance_caches')
+    def test_invalidate_caches(self, mocked_invalidate):
+        '''Should invalidate cached responses of the objects, as views
+        filtering objects by permissions do not depend on permissions.'''
+        user = mommy.make(User, department=self.departments[0])
+        events = [mommy.make(CampusEvent) for _ in range(2)]
+
+        services.PermissionService.bulk_assign_object_permissions(
+            (user, event) for event in events)
+
+        mocked_invalidate.assert_called_once_with(
+            CampusEvent, [event.pk for event in events], created=True)
+
+
 class TestUserGroupService(TestCase):
     '''Unit tests for UserGroupService.'''
     @classmethod
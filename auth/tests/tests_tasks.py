@@ -2,19 +2,24 @@
 from datetime import datetime
 from unittest.mock import patch, Mock
 
-from django.test import TestCase
+from celery.exceptions import Retry
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.db import models
 from django.contrib.auth.models import Group
 from django.utils.timezone import now, make_aware
 from model_mommy import mommy
 
 from auth.models import (
-    User, Department, DepartmentInformation, TeacherInformation)
+    User, Department, DepartmentInformation, SyncFingerprint,
+    TeacherInformation)
 from auth.tasks import (
+    SYNC_LOCK_KEY,
     _update_from_department_information,
     _update_from_teacher_information,
     update_teachers_and_departments_information
 )
+from drf_cache.tests.tests_utils import LOCMEM_CACHES
 
 
 class TestUpdateTeachersAndDepartmentsInformation(TestCase):
@@ -49,7 +54,7 @@ class TestUpdateTeachersAndDepartmentsInformation(TestCase):
 
         mocked_department_update_func.assert_called()
         mocked_teacher_update_func.assert_called_with(
-            dwid_to_department, department_id_to_administrative)
+            dwid_to_department, department_id_to_administrative, [])
         mocked_prod_logger.exception.assert_not_called()
 
     @patch('auth.tasks.Group.objects.get_or_create')
@@ -67,14 +72,14 @@ class TestUpdateTeachersAndDepartmentsInformation(TestCase):
         mocked_prod_logger.exception.assert_called_with(
             '部门信息更新失败,单位号:%s, excepiton:%s', depart.dwid, exc)
 
-    @patch('auth.tasks.User.all_objects.get_or_create')
+    @patch('auth.models.TeacherInformation.get_xb_display')
     @patch('auth.tasks.prod_logger')
     @patch('auth.models.TeacherInformation.save', models.Model.save)
     def test_logging_if_teacher_update_failed(
-            self, mocked_prod_logger, mocked_get_or_create):
+            self, mocked_prod_logger, mocked_get_xb_display):
         '''Should call update functions.'''
         exc = Exception('Oops')
-        mocked_get_or_create.side_effect = exc
+        mocked_get_xb_display.side_effect = exc
         user = TeacherInformation.objects.create(zgh='123')
         departments = [mommy.make(
             Department, raw_department_id=idx,
@@ -117,6 +122,39 @@ class TestUpdateTeachersAndDepartmentsInformation(TestCase):
             self.assertEqual(info.dwmc, department.name)
             self.assertEqual(info.dwid, department.raw_department_id)
 
+    @patch('auth.models.DepartmentInformation.save',
+           models.Model.save)
+    @patch('auth.tasks.prod_logger')
+    def test_rename_groups_of_departments(self, _):
+        '''Should rename groups of renamed departments at once.'''
+        mommy.make(DepartmentInformation,
+                   dwid=self.dlut_id, dwmc=self.dlut_name)
+        departments = [mommy.make(
+            Department, raw_department_id=f'{idx}', name=f'Old{idx}',
+            super_department=self.dlut,
+            department_type=Department.DEPARTMENT_TYPE_T1,
+        ) for idx in range(2)]
+        for department in departments:
+            Group.objects.create(
+                name=f'{department.name}-{department.raw_department_id}-管理员')
+            mommy.make(DepartmentInformation,
+                       dwid=department.raw_department_id,
+                       dwmc=f'New{department.raw_department_id}',
+                       lsdw=self.dlut_id,
+                       dwlx=Department.DEPARTMENT_TYPE_T1)
+
+        # Groups are read and written once for all renamed departments.
+        with patch('auth.tasks.Group.objects.bulk_update',
+                   wraps=Group.objects.bulk_update) as mocked_bulk_update:
+            _update_from_department_information()
+
+        mocked_bulk_update.assert_called_once()
+        for idx in range(2):
+            self.assertTrue(Group.objects.filter(
+                name=f'New{idx}-{idx}-管理员').exists())
+            self.assertFalse(Group.objects.filter(
+                name=f'Old{idx}-{idx}-管理员').exists())
+
     @patch('auth.models.TeacherInformation.save',
            models.Model.save)
     @patch('auth.tasks.prod_logger')
@@ -187,3 +225,186 @@ class TestUpdateTeachersAndDepartmentsInformation(TestCase):
             self.assertEqual(user.technical_title,
                              raw_user.get_zyjszc_display())
             self.assertEqual(user.teaching_type, raw_user.get_rjlx_display())
+
+    @patch('auth.models.TeacherInformation.save', models.Model.save)
+    @patch('auth.tasks.prod_logger')
+    def test_sync_only_changed_users(self, _):
+        '''Should only write new or changed users, and report counts.'''
+        department = mommy.make(Department, raw_department_id='1',
+                                name='Department1', super_department=self.dlut)
+        teacher_group = Group.objects.create(name='Department1-1-专任教师')
+        dwid_to_department = {'1': department}
+        department_id_to_administrative = {department.id: department}
+        raw_users = [mommy.make(
+            TeacherInformation, zgh=f'2{idx:02d}', jsxm=f'name{idx}',
+            csrq='1980-01-01', xb='1', xy='1', rxsj='2019-12-01', rzzt='11',
+            xl='14', zyjszc='061', rjlx='12')
+                     for idx in range(self.num_teachers)]
+
+        stats = _update_from_teacher_information(
+            dwid_to_department, department_id_to_administrative)
+        self.assertEqual(stats, {
+            'inserted': self.num_teachers, 'updated': 0, 'unchanged': 0})
+        self.assertEqual(
+            User.objects.filter(groups=teacher_group).count(),
+            self.num_teachers)
+
+        TeacherInformation.objects.filter(zgh=raw_users[0].zgh).update(
+            jsxm='renamed')
+        stats = _update_from_teacher_information(
+            dwid_to_department, department_id_to_administrative)
+
+        self.assertEqual(stats, {
+            'inserted': 0, 'updated': 1,
+            'unchanged': self.num_teachers - 1})
+        self.assertEqual(
+            User.objects.get(username=raw_users[0].zgh).first_name,
+            'renamed')
+        self.assertEqual(
+            User.objects.filter(groups=teacher_group).count(),
+            self.num_teachers)
+
+    @patch('auth.models.TeacherInformation.save', models.Model.save)
+    @patch('auth.tasks.prod_logger')
+    def test_sync_invalidate_record_caches(self, _):
+        '''Should evict cached records of users only if fields of the users
+        rendered along with records are changed.'''
+        department = mommy.make(Department, raw_department_id='1',
+                                name='Department1', super_department=self.dlut)
+        dwid_to_department = {'1': department}
+        department_id_to_administrative = {department.id: department}
+        for idx in range(2):
+            mommy.make(TeacherInformation, zgh=f'2{idx:02d}',
+                       jsxm=f'name{idx}', xy='1', rzzt='11')
+        _update_from_teacher_information(
+            dwid_to_department, department_id_to_administrative)
+        TeacherInformation.objects.filter(zgh='200').update(jsxm='renamed')
+        TeacherInformation.objects.filter(zgh='201').update(rzzt='12')
+
+        with patch('training_record.services.RecordService'
+                   '.invalidate_caches_of_users') as mocked_invalidate:
+            _update_from_teacher_information(
+                dwid_to_department, department_id_to_administrative)
+
+        mocked_invalidate.assert_called_once_with(
+            [User.objects.get(username='200').id])
+
+    @patch('auth.models.TeacherInformation.save', models.Model.save)
+    @patch('auth.tasks.prod_logger')
+    def test_sync_moved_users(self, _):
+        '''Should move teacher groups of users whose departments changed.'''
+        departments = [mommy.make(
+            Department, raw_department_id=f'{idx}', name=f'Department{idx}',
+            super_department=self.dlut) for idx in range(2)]
+        groups = [Group.objects.create(
+            name=f'Department{idx}-{idx}-专任教师') for idx in range(2)]
+        dwid_to_department = {x.raw_department_id: x for x in departments}
+        department_id_to_administrative = {x.id: x for x in departments}
+        mommy.make(TeacherInformation, zgh='200', jsxm='name', xy='0')
+        _update_from_teacher_information(
+            dwid_to_department, department_id_to_administrative)
+
+        TeacherInformation.objects.filter(zgh='200').update(xy='1')
+        stats = _update_from_teacher_information(
+            dwid_to_department, department_id_to_administrative)
+
+        user = User.objects.get(username='200')
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(user.department, departments[1])
+        self.assertEqual(user.administrative_department, departments[1])
+        self.assertEqual(
+            set(user.groups.filter(name__endswith='专任教师')),
+            {groups[1], self.dlut_group})
+
+    @patch('auth.models.DepartmentInformation.save', models.Model.save)
+    @patch('auth.models.TeacherInformation.save', models.Model.save)
+    @patch('auth.tasks.prod_logger')
+    def test_sync_changed_rows_only(self, _):
+        '''Should only sync rows changed since the last sync.'''
+        mommy.make(DepartmentInformation, dwid='1', dwmc='Department1',
+                   lsdw=self.dlut_id)
+        for idx in range(self.num_teachers):
+            mommy.make(TeacherInformation, zgh=f'2{idx:02d}',
+                       jsxm=f'name{idx}', xy='1')
+
+        stats = update_teachers_and_departments_information()
+        self.assertEqual(stats['inserted'], self.num_teachers)
+
+        TeacherInformation.objects.filter(zgh='200').update(jsxm='renamed')
+        stats = update_teachers_and_departments_information()
+        self.assertEqual(
+            stats, {'inserted': 0, 'updated': 1, 'unchanged': 0})
+        self.assertEqual(User.objects.get(username='200').first_name,
+                         'renamed')
+
+        stats = update_teachers_and_departments_information(force=True)
+        self.assertEqual(stats, {
+            'inserted': 0, 'updated': 0, 'unchanged': self.num_teachers})
+
+    @patch('auth.models.DepartmentInformation.save', models.Model.save)
+    @patch('auth.models.TeacherInformation.save', models.Model.save)
+    @patch('auth.tasks.prod_logger')
+    def test_sync_all_teachers_if_departments_changed(self, _):
+        '''Should sync all teachers once departments are changed.'''
+        mommy.make(DepartmentInformation, dwid='1', dwmc='Department1',
+                   lsdw=self.dlut_id)
+        for idx in range(self.num_teachers):
+            mommy.make(TeacherInformation, zgh=f'2{idx:02d}',
+                       jsxm=f'name{idx}', xy='1')
+        update_teachers_and_departments_information()
+
+        DepartmentInformation.objects.filter(dwid='1').update(dwmc='renamed')
+        TeacherInformation.objects.filter(zgh='200').delete()
+        stats = update_teachers_and_departments_information()
+
+        self.assertEqual(stats['unchanged'], self.num_teachers - 1)
+        self.assertFalse(SyncFingerprint.objects.filter(
+            source=SyncFingerprint.SOURCE_TEACHER, key='200').exists())
+
+    @patch('auth.models.DepartmentInformation.save', models.Model.save)
+    @patch('auth.tasks.prod_logger')
+    def test_rebuild_closure_if_departments_changed(self, _):
+        '''Should only rebuild department paths if departments changed.'''
+        mommy.make(DepartmentInformation, dwid='1', dwmc='Department1',
+                   lsdw=self.dlut_id)
+        with patch('auth.tasks.DepartmentClosure.objects.rebuild') as rebuild:
+            update_teachers_and_departments_information()
+            update_teachers_and_departments_information()
+
+        rebuild.assert_called_once_with()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestSyncLock(TestCase):
+    '''Unit tests for the lock of syncs.'''
+    def setUp(self):
+        cache.clear()
+        cache.add(SYNC_LOCK_KEY, True)
+
+    @patch('auth.tasks.prod_logger')
+    @patch('auth.tasks._sync_teachers_and_departments')
+    def test_skip_if_running(self, mocked_sync, mocked_prod_logger):
+        '''Should skip the run if another one is running.'''
+        self.assertIsNone(update_teachers_and_departments_information())
+
+        mocked_sync.assert_not_called()
+        mocked_prod_logger.warning.assert_called()
+
+    @patch('auth.tasks._sync_teachers_and_departments')
+    def test_retry_forced_run(self, mocked_sync):
+        '''Should retry the forced run if another one is running.'''
+        with self.assertRaises(Retry):
+            update_teachers_and_departments_information(force=True)
+
+        mocked_sync.assert_not_called()
+
+    @patch('auth.tasks._sync_teachers_and_departments')
+    def test_release_lock(self, mocked_sync):
+        '''Should release the lock after the run.'''
+        cache.delete(SYNC_LOCK_KEY)
+        mocked_sync.side_effect = Exception('Oops')
+
+        with self.assertRaises(Exception):
+            update_teachers_and_departments_information()
+
+        self.assertTrue(cache.add(SYNC_LOCK_KEY, True))
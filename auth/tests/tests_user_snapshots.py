@@ -0,0 +1,142 @@
+'''Unit tests for auth user snapshots.'''
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from model_mommy import mommy
+from rest_framework import exceptions
+from rest_framework_jwt.settings import api_settings
+
+from auth.authentication import JSONWebTokenAuthentication
+from auth.models import Department, User
+from auth.user_snapshots import UserSnapshotCache
+from drf_cache.tests.tests_utils import LOCMEM_CACHES, run_commit_hooks
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestUserSnapshotCache(TestCase):
+    '''Unit tests for UserSnapshotCache.'''
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = mommy.make(Department)
+        cls.group = mommy.make(Group, name='学院-1-专任教师')
+        cls.user = mommy.make(User, department=cls.department)
+        cls.user.groups.add(cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.snapshots = UserSnapshotCache()
+
+    def test_get_user(self):
+        '''Should read fields and roles of users from cached snapshots.'''
+        self.snapshots.get_user(self.user.pk)
+
+        with self.assertNumQueries(0):
+            user = self.snapshots.get_user(self.user.pk)
+            self.assertTrue(user.is_teacher)
+            self.assertFalse(user.is_school_admin)
+
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.username, self.user.username)
+        self.assertEqual(user.department_id, self.department.id)
+
+    def test_new_instances(self):
+        '''Should return new instances, so per-instance caches are never
+        shared between requests.'''
+        self.snapshots.get_user(self.user.pk)
+
+        user = self.snapshots.get_user(self.user.pk)
+        user.refresh_role_context()
+
+        self.assertIsNot(self.snapshots.get_user(self.user.pk), user)
+        with self.assertNumQueries(0):
+            self.assertTrue(self.snapshots.get_user(self.user.pk).is_teacher)
+
+    def test_password_not_cached(self):
+        '''Should not copy password hashes into the shared cache.'''
+        self.snapshots.get_user(self.user.pk)
+
+        user = self.snapshots.get_user(self.user.pk)
+
+        self.assertIn('password', user.get_deferred_fields())
+
+    def test_invalidate_on_user_change(self):
+        '''Should read users again once they are saved.'''
+        self.snapshots.get_user(self.user.pk)
+
+        self.user.first_name = '张三'
+        self.user.save()
+        run_commit_hooks()
+
+        self.assertEqual(self.snapshots.get_user(self.user.pk).first_name,
+                         '张三')
+
+    def test_invalidate_on_groups_change(self):
+        '''Should read roles again once groups of users are changed.'''
+        self.snapshots.get_user(self.user.pk)
+
+        self.user.groups.remove(self.group)
+        run_commit_hooks()
+
+        self.assertFalse(self.snapshots.get_user(self.user.pk).is_teacher)
+
+    def test_invalidate_on_reverse_groups_change(self):
+        '''Should read roles again once users of groups are changed.'''
+        self.snapshots.get_user(self.user.pk)
+
+        self.group.user_set.clear()
+        run_commit_hooks()
+
+        self.assertFalse(self.snapshots.get_user(self.user.pk).is_teacher)
+
+    def test_user_does_not_exist(self):
+        '''Should raise DoesNotExist for missing users.'''
+        with self.assertRaises(User.DoesNotExist):
+            self.snapshots.get_user(-1)
+
+    def test_not_cached_without_versions(self):
+        '''Should not cache snapshots if the shared cache lacks versions.'''
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            self.snapshots.get_user(self.user.pk)
+            with self.assertNumQueries(1):
+                self.snapshots.get_user(self.user.pk)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestJSONWebTokenAuthentication(TestCase):
+    '''Unit tests for JSONWebTokenAuthentication.'''
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = mommy.make(User)
+
+    def setUp(self):
+        cache.clear()
+        self.authentication = JSONWebTokenAuthentication()
+
+    def test_authenticate_without_queries(self):
+        '''Should verify tokens and resolve users from cached snapshots.'''
+        token = api_settings.JWT_ENCODE_HANDLER(
+            api_settings.JWT_PAYLOAD_HANDLER(self.user))
+        self.authentication.authenticate_credentials(
+            api_settings.JWT_DECODE_HANDLER(token))
+
+        with self.assertNumQueries(0):
+            user = self.authentication.authenticate_credentials(
+                api_settings.JWT_DECODE_HANDLER(token))
+            self.assertFalse(user.is_department_admin)
+
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_authenticate_username_mismatched(self):
+        '''Should reject payloads whose usernames do not match.'''
+        payload = {'user_id': self.user.pk, 'username': 'someone'}
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authentication.authenticate_credentials(payload)
+
+    def test_authenticate_user_does_not_exist(self):
+        '''Should reject payloads of missing users.'''
+        payload = {'user_id': -1, 'username': self.user.username}
+
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authentication.authenticate_credentials(payload)
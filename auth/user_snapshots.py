@@ -0,0 +1,145 @@
+'''Snapshots of users cached in the shared cache, so users authenticated by
+JWT are resolved without querying the database.'''
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+
+from auth.models import RoleContext, User
+from drf_cache.local import LocalCache
+from drf_cache.utils import (
+    build_key_for_model_version, build_model_index_keys, invalidate_versions
+)
+
+USER_SNAPSHOT_KEY_PREFIX = 'AUTH:USER_SNAPSHOT:'
+USER_VERSION_KEY_PREFIX = 'AUTH:USER_VERSION:'
+USER_SNAPSHOT_TIMEOUT = 5 * 60
+# Password hashes are never needed by authenticated requests, so they are
+# not copied into the shared cache.
+USER_SNAPSHOT_EXCLUDED_FIELDS = ('password',)
+
+
+def build_key_for_user_version(user_id):
+    '''Construct cache key for the version of the user, which is bumped
+    after the user or its groups are changed.'''
+    return f'{USER_VERSION_KEY_PREFIX}{user_id}'
+
+
+class UserSnapshot:
+    '''Values of fields of a user, including ids of its departments, and
+    names of its groups, from which roles of the user are derived.
+
+    Parameters
+    ----------
+    field_values: dict
+        Values of concrete fields keyed by their attnames.
+    group_names: frozenset
+        Names of groups of the user.
+    '''
+    def __init__(self, field_values, group_names):
+        self.field_values = field_values
+        self.group_names = group_names
+
+    @classmethod
+    def take(cls, user):
+        '''Take a snapshot of the user.'''
+        return cls({
+            field.attname: getattr(user, field.attname)
+            for field in User._meta.concrete_fields
+            if field.attname not in USER_SNAPSHOT_EXCLUDED_FIELDS
+        }, user.role_context.group_names)
+
+    def to_user(self):
+        '''Build a new user instance with roles loaded, so loaded roles and
+        object permissions are never shared between requests.'''
+        values = [
+            self.field_values[field.attname]
+            for field in User._meta.concrete_fields
+            if field.attname in self.field_values
+        ]
+        user = User.from_db('default', self.field_values, values)
+        user.role_context = RoleContext(user, self.group_names)
+        return user
+
+
+class UserSnapshotCache:
+    '''UserSnapshots cached in the shared cache for a short time.
+
+    Snapshots are keyed by ids of users and their versions, which are
+    bumped after users or their group memberships change (see
+    `invalidate_user_snapshots()`), and they depend on the version of
+    Group since roles are derived from names of groups. Snapshots read
+    before the changes commit are stored under outdated versions, so they
+    are never read again. Nothing is cached if the shared cache does not
+    keep versions.
+
+    Parameters
+    ----------
+    timeout: int
+        The number of seconds before expiring snapshots. Default: 300
+    '''
+    def __init__(self, timeout=USER_SNAPSHOT_TIMEOUT):
+        self.timeout = timeout
+
+    @staticmethod
+    def get_version_keys(user_id):
+        '''Return version keys which the snapshot of the user depends on.'''
+        version_keys = build_model_index_keys(
+            [Group], build_key_for_model_version)
+        version_keys.add(build_key_for_user_version(user_id))
+        return version_keys
+
+    def get_user(self, user_id):
+        '''Return a new instance of the active user, which is read from the
+        cached snapshot if possible.
+
+        Raises
+        ------
+        User.DoesNotExist
+            If the user does not exist or is not active.
+        '''
+        versions = LocalCache.get_versions(self.get_version_keys(user_id))
+        if versions is None:
+            return User.objects.get(pk=user_id)
+        key = '{}{}:{}'.format(
+            USER_SNAPSHOT_KEY_PREFIX, user_id,
+            ':'.join(str(versions[x]) for x in sorted(versions)))
+        snapshot = cache.get(key)
+        if snapshot is not None:
+            return snapshot.to_user()
+        user = User.objects.get(pk=user_id)
+        cache.set(key, UserSnapshot.take(user), self.timeout)
+        return user
+
+
+user_snapshots = UserSnapshotCache()  # pylint: disable=C0103
+
+
+def invalidate_user_snapshots(user_ids):
+    '''Drop cached snapshots of users once the current transaction
+    commits.'''
+    invalidate_versions(build_key_for_user_version(x) for x in user_ids)
+
+
+def invalidate_user_snapshot_on_user_change(instance, **_):
+    '''Drop the cached snapshot of the saved or deleted user.'''
+    invalidate_user_snapshots([instance.pk])
+
+
+def invalidate_user_snapshot_on_user_group_change(instance, **_):
+    '''Drop the cached snapshot of the user whose group membership is
+    saved or deleted.'''
+    invalidate_user_snapshots([instance.user_id])
+
+
+def invalidate_user_snapshots_on_groups_change(instance, action, pk_set,
+                                               **_):
+    '''Drop cached snapshots of users whose groups are changed, from either
+    side of the relationship.'''
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if isinstance(instance, User):
+        invalidate_user_snapshots([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_user_snapshots(
+            instance.user_set.values_list('pk', flat=True))
+    else:
+        invalidate_user_snapshots(pk_set)
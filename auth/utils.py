@@ -33,6 +33,8 @@ def jwt_response_payload_handler(token, user=None, request=None):
 def assign_perm(perm_name, user_or_group, obj=None):
     '''Re-export assign_perm from django-guardian.'''
     ret = guardian.shortcuts.assign_perm(perm_name, user_or_group, obj)
+    if hasattr(user_or_group, 'refresh_object_permissions'):
+        user_or_group.refresh_object_permissions()
     msg = (
         f'赋予用户(组) {user_or_group}'
         f' 对 {obj} 的 {perm_name} 权限'
@@ -43,7 +45,10 @@ def assign_perm(perm_name, user_or_group, obj=None):
 
 def remove_perm(perm_name, user_or_group, obj=None):
     '''Re-export remove_perm from django-guardian.'''
-    return guardian.shortcuts.remove_perm(perm_name, user_or_group, obj)
+    ret = guardian.shortcuts.remove_perm(perm_name, user_or_group, obj)
+    if hasattr(user_or_group, 'refresh_object_permissions'):
+        user_or_group.refresh_object_permissions()
+    return ret
 
 
 class ChoiceConverter:
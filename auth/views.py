@@ -12,7 +12,9 @@ import auth.serializers
 import auth.permissions
 import auth.filters
 from infra.exceptions import BadRequest
+from drf_cache.local import LocalCache
 from drf_cache.mixins import DRFCacheMixin
+from drf_cache.warmup import recent_users
 
 User = get_user_model()
 
@@ -24,6 +26,15 @@ class DepartmentViewSet(DRFCacheMixin, viewsets.ReadOnlyModelViewSet):
     permission_classes = (
         auth.permissions.AdminPermission,
     )
+    cache_scope = 'role'
+    cache_volatile_actions = ('top_level_departments',)
+    local_cache = LocalCache(max_entries=128, max_bytes=2 * 1024 * 1024)
+    cache_warmup = (
+        {'url_name': 'department-list',
+         'users': recent_users(groups__name__endswith='管理员')},
+        {'url_name': 'department-top-level-departments',
+         'users': recent_users(groups__name__endswith='管理员')},
+    )
 
     @decorators.action(detail=False, methods=['GET'],
                        url_path='top-level-departments')
@@ -47,6 +58,7 @@ class UserViewSet(DRFCacheMixin, viewsets.ReadOnlyModelViewSet):
     permission_classes = (
         auth.permissions.SchoolAdminOnlyPermission,
     )
+    cache_scope = 'role'
 
     def _get_paginated_response(self, queryset):
         '''Return paginated response'''
@@ -74,7 +86,9 @@ class GroupViewSet(DRFCacheMixin, viewsets.ReadOnlyModelViewSet):
     permission_classes = (
         auth.permissions.SchoolAdminOnlyPermission,
     )
+    cache_scope = 'role'
     filter_class = auth.filters.GroupFilter
+    cache_dependencies = ('tmsftt_auth.department',)
 
     @decorators.action(detail=False, methods=['GET'],
                        url_path='top-department-related-groups')
@@ -103,6 +117,7 @@ class UserGroupViewSet(DRFCacheMixin,
     permission_classes = (
         auth.permissions.SchoolAdminOnlyPermission,
     )
+    cache_scope = 'role'
     filter_fields = ('group',)
 
 
@@ -117,6 +132,7 @@ class GroupPermissionViewSet(DRFCacheMixin,
     permission_classes = (
         auth.permissions.SchoolAdminOnlyPermission,
     )
+    cache_scope = 'role'
     filter_fields = ('group',)
 
 
@@ -128,3 +144,4 @@ class PermissionViewSet(DRFCacheMixin, viewsets.ReadOnlyModelViewSet):
     permission_classes = (
         auth.permissions.SchoolAdminOnlyPermission,
     )
+    cache_scope = 'role'
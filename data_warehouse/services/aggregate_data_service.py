@@ -3,6 +3,7 @@ from django.utils.timezone import now, localtime
 from django.utils.timezone import datetime
 
 from auth.models import Department, User
+from auth.registry import well_known_objects
 from infra.exceptions import BadRequest
 from training_program.models import Program
 from training_event.services import EnrollmentService
@@ -193,7 +194,8 @@ class AggregateDataService:
         group_by = int(group_by)
         department_id = int(department_id)
         if department_id == 0:
-            department_id = Department.objects.get(name='大连理工大学').id
+            department_id = (
+                well_known_objects.get().get_school_department_id())
         users = TeachersStatisticsService.get_users_by_department(
             context['request'].user, department_id)
         users = users.filter(
@@ -232,7 +234,8 @@ class AggregateDataService:
         group_by = int(group_by)
         department_id = int(department_id)
         if department_id == 0:
-            department_id = Department.objects.get(name='大连理工大学').id
+            department_id = (
+                well_known_objects.get().get_school_department_id())
         time = {'start_time': start_time, 'end_time': end_time}
         records = RecordsStatisticsService.get_records_by_time_department(
             context['request'].user, department_id, time)
@@ -200,10 +200,9 @@ class CoverageStatisticsService:
             department_ids = [department_id]
         else:
             if user.is_school_admin:
-                departments = DepartmentService.get_top_level_departments()
-                dlut = Department.objects.filter(name='大连理工大学')
-                department_ids = departments.union(dlut).values_list(
-                    'id', flat=True)
+                department_ids = (
+                    DepartmentService.get_top_level_departments(
+                        include_school=True).values_list('id', flat=True))
             else:
                 raise BadRequest('你不是校级管理员，必须指定部门ID。')
         if end_time is None:
@@ -7,7 +7,7 @@ from django.db import models, transaction
 from django.db.models.functions import Coalesce
 from django.utils.timezone import now, localtime
 
-from auth.models import Department
+from auth.registry import well_known_objects
 from auth.services import UserService
 from training_record.models import Record
 from data_warehouse.models import Ranking
@@ -104,7 +104,8 @@ class UserRankingService:
         cached_value = cache.get(cache_key)
         if cached_value:
             return cached_value
-        dlut_department_id = Department.objects.get(name='大连理工大学').id
+        dlut_department_id = (
+            well_known_objects.get().get_school_department_id())
         ranking = cls._get_ranking(
             user,
             dlut_department_id,
@@ -130,7 +131,7 @@ class UserRankingService:
     @staticmethod
     def generate_user_rankings_by_training_hours(baseoffset=0):
         '''Calculate user rankings by training hours.'''
-        dlut_department = Department.objects.get(name='大连理工大学').id
+        dlut_department = well_known_objects.get().get_school_department_id()
         user_training_hours = list(
             UserService.get_full_time_teachers()
             .filter(administrative_department__isnull=False)
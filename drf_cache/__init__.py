@@ -1,12 +1,75 @@
 '''Constants used in this module.'''
 
 
+default_app_config = 'drf_cache.apps.DrfCacheConfig'  # pylint: disable=C0103
+
 CACHE_NAME = 'default'
 CACHE_TIMEOUT = 30 * 60
+# Seconds a response is still served to concurrent requests after it expires
+# or is evicted, while one of them is rebuilding it.
+CACHE_STALE_TIMEOUT = 5 * 60
+# Seconds before the rebuilding lock is released if the holder dies.
+CACHE_LOCK_TIMEOUT = 30
+# Seconds to wait for the lock holder before rebuilding the response anyway.
+CACHE_LOCK_WAIT = 5
+CACHE_LOCK_POLL_INTERVAL = 0.05
+# Rendered bodies not smaller than this are compressed with zlib.
+CACHE_COMPRESS_MIN_SIZE = 1024
+# Default limits of in-process caches, see `drf_cache.local.LocalCache`.
+LOCAL_CACHE_MAX_ENTRIES = 256
+LOCAL_CACHE_MAX_BYTES = 8 * 1024 * 1024
+LOCAL_CACHE_TIMEOUT = 60
+# Seconds before versions in the shared cache expire, not shorter than the
+# longest timeout of entries depending on them (a day, see
+# `drf_cache.local.ModelDependentCache`). Entries are only orphaned when
+# their versions expire, since expired versions are initialized randomly.
+VERSION_TIMEOUT = 2 * 24 * 60 * 60
+# Milliseconds between checks of model versions in the shared cache.
+LOCAL_CACHE_CHECK_INTERVAL = 500
+# Limits of warm-ups, see `drf_cache.warmup.WarmupRegistry`.
+WARMUP_CONCURRENCY = 2
+WARMUP_MAX_USERS = 50
+WARMUP_LOCK_TIMEOUT = 10 * 60
+# Seconds to wait after invalidations before warming up, so invalidations in
+# a short period only trigger one warm-up.
+WARMUP_DELAY = 30
+# Default scheme of warm-up requests, see `DRF_CACHE_WARMUP_URL_SCHEME`.
+WARMUP_URL_SCHEME = 'http'
+# Headers kept in cached responses.
+CACHED_HEADERS = ('Content-Type', 'Content-Language', 'Vary', 'Allow',
+                  'ETag', 'Cache-Control')
+CACHE_KEY_PREFIX = 'DRF_CACHE:CACHE_KEY:'
 CACHE_KEY_FORMAT = (
-    'DRF_CACHE:CACHE_KEY:{method}:{app_label}:{model_name}:{uri}:{fp}'
+    CACHE_KEY_PREFIX + '{method}:{app_label}:{model_name}:{uri}:{fp}'
+)
+STALE_KEY_PREFIX = 'DRF_CACHE:STALE_KEY:'
+WARMUP_LOCK_KEY = 'DRF_CACHE:WARMUP_LOCK'
+WARMUP_SCHEDULE_KEY = 'DRF_CACHE:WARMUP_SCHEDULE'
+LOCK_KEY_PREFIX = 'DRF_CACHE:LOCK_KEY:'
+# Pages of a list response sharing the same filters.
+LIST_GROUP_INDEX_KEY_FORMAT = (
+    'DRF_CACHE:LIST_GROUP_INDEX:{method}:{app_label}:{model_name}:{uri}:{fp}'
 )
+# Responses containing the instance, evicted when it is changed or deleted.
 INVERTED_INDEX_KEY_FORMAT = (
     'DRF_CACHE:INVERTED_INDEX:{app_label}:{model_name}:{instance_id}'
 )
-VARY_HEADERS = ('Cookie', 'Authorization')
+# List responses of the model, evicted when an instance is created.
+LIST_INDEX_KEY_FORMAT = (
+    'DRF_CACHE:LIST_INDEX:{app_label}:{model_name}'
+)
+# Responses which can not be narrowed down to instances of the model, such as
+# nested data or filtered lists, evicted on every write of the model.
+RELATED_INDEX_KEY_FORMAT = (
+    'DRF_CACHE:RELATED_INDEX:{app_label}:{model_name}'
+)
+# All responses depending on the model.
+NAMESPACE_INDEX_KEY_FORMAT = (
+    'DRF_CACHE:NAMESPACE_INDEX:{app_label}:{model_name}'
+)
+# Bumped after writes of the model, used by in-process caches.
+MODEL_VERSION_KEY_FORMAT = (
+    'DRF_CACHE:MODEL_VERSION:{app_label}:{model_name}'
+)
+# Query parameters which don't affect results, such as cache busters.
+IGNORED_QUERY_PARAMS = ('_',)
@@ -1,7 +1,28 @@
 '''App configs'''
 from django.apps import AppConfig
+from django.db.models import signals
 
 
 class DrfCacheConfig(AppConfig):
     '''DRF cache config.'''
     name = 'drf_cache'
+
+    def ready(self):
+        '''Connect invalidation handlers once the app registry is ready.
+
+        Handlers are connected here rather than on first dispatch so writes
+        happen in processes which never serve cached views (Celery workers,
+        management commands) still invalidate the related caches.
+        '''
+        from drf_cache.utils import (
+            invalidate_caches_on_model_change, invalidate_caches_on_m2m_change
+        )
+        signals.post_save.connect(
+            invalidate_caches_on_model_change,
+            dispatch_uid='drf_cache_post_save')
+        signals.pre_delete.connect(
+            invalidate_caches_on_model_change,
+            dispatch_uid='drf_cache_pre_delete')
+        signals.m2m_changed.connect(
+            invalidate_caches_on_m2m_change,
+            dispatch_uid='drf_cache_m2m_changed')
@@ -0,0 +1,218 @@
+'''In-process cache in front of the shared Django cache.'''
+import hashlib
+import pickle
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+from drf_cache import (
+    LOCAL_CACHE_MAX_ENTRIES, LOCAL_CACHE_MAX_BYTES, LOCAL_CACHE_TIMEOUT,
+    LOCAL_CACHE_CHECK_INTERVAL, VERSION_TIMEOUT
+)
+from drf_cache.utils import build_key_for_model_version, build_model_index_keys
+
+
+class LocalCache:  # pylint: disable=R0902
+    '''Bounded LRU cache with TTL living in the process.
+
+    Entries can depend on version keys in the shared cache, which are bumped
+    by other processes after writes. Versions are checked at most once every
+    `check_interval` milliseconds, entries whose versions are outdated are
+    dropped, so staleness of entries is bounded by the interval.
+
+    Hits and misses of both tiers are counted in `stats`.
+
+    Parameters
+    ----------
+    max_entries: int
+        The maximum number of entries. Default: 256
+    max_bytes: int
+        The maximum total size of entries. Default: 8MB
+    timeout: int
+        The number of seconds before expiring entries. Default: 60
+    check_interval: int
+        The number of milliseconds between version checks. Default: 500
+    '''
+    def __init__(self, max_entries=LOCAL_CACHE_MAX_ENTRIES,
+                 max_bytes=LOCAL_CACHE_MAX_BYTES,
+                 timeout=LOCAL_CACHE_TIMEOUT,
+                 check_interval=LOCAL_CACHE_CHECK_INTERVAL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.check_interval = check_interval / 1000
+        self.stats = {
+            'local_hits': 0, 'local_misses': 0,
+            'shared_hits': 0, 'shared_misses': 0,
+        }
+        self._lock = threading.RLock()
+        # key -> (expire_time, size, versions, value)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._last_check_time = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def get_versions(version_keys):
+        '''Read versions from the shared cache, which are stored alongside
+        entries so entries can be dropped when versions change.
+
+        Missing versions are initialized randomly, so versions read before
+        the shared cache is flushed are unlikely to be seen again. Versions
+        expire after `VERSION_TIMEOUT`, so per-user versions of users who
+        are gone do not pile up. None is
+        returned if the shared cache does not keep versions (DummyCache),
+        in which case entries can not be tracked.
+        '''
+        version_keys = list(version_keys)
+        versions = cache.get_many(version_keys)
+        missing_keys = [x for x in version_keys if x not in versions]
+        if missing_keys:
+            for version_key in missing_keys:
+                cache.add(version_key, random.randint(1, 1 << 30),
+                          VERSION_TIMEOUT)
+            versions.update(cache.get_many(missing_keys))
+        if len(versions) < len(version_keys):
+            return None
+        return versions
+
+    def _delete(self, key):
+        _, size, _, _ = self._entries.pop(key)
+        self._size -= size
+
+    def _check_versions(self):
+        '''Drop entries whose versions have changed in the shared cache.'''
+        now = time.monotonic()
+        if now - self._last_check_time < self.check_interval:
+            return
+        self._last_check_time = now
+        version_keys = set()
+        for _, _, versions, _ in self._entries.values():
+            version_keys.update(versions)
+        current_versions = self.get_versions(version_keys) or {}
+        for key, (_, _, versions, _) in list(self._entries.items()):
+            if any(current_versions.get(x) != v for x, v in versions.items()):
+                self._delete(key)
+
+    def get(self, key):
+        '''Return the value of the key, or None if it is missing.'''
+        with self._lock:
+            self._check_versions()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._delete(key)
+                entry = None
+            if entry is None:
+                self.stats['local_misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['local_hits'] += 1
+            return entry[3]
+
+    def set(self, key, value, versions=None, size=None):
+        '''Store the value, least recently used entries are dropped when the
+        limits are exceeded.
+
+        Parameters
+        ----------
+        versions: dict
+            Versions (read by `get_versions()` before computing the value)
+            which the value depends on.
+        size: int
+            The size of the value, estimated by pickling it if not given.
+        '''
+        if size is None:
+            size = len(pickle.dumps(value))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._delete(key)
+            self._entries[key] = (time.monotonic() + self.timeout, size,
+                                  versions or {}, value)
+            self._size += size
+            while (len(self._entries) > self.max_entries
+                   or self._size > self.max_bytes):
+                self._delete(next(iter(self._entries)))
+
+    def get_or_set(self, key, default, timeout):
+        '''Return the value from the local tier, then the shared cache, or
+        compute it by calling `default` and store it in both tiers.'''
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = cache.get(key)
+        if value is None:
+            self.stats['shared_misses'] += 1
+            value = default()
+            cache.set(key, value, timeout)
+        else:
+            self.stats['shared_hits'] += 1
+        self.set(key, value)
+        return value
+
+    def clear(self):
+        '''Remove all entries.'''
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class ModelDependentCache:
+    '''A single value computed from models, cached in the process and in
+    the shared cache until the models are written.
+
+    Subclasses set `key_prefix` and `models`, and compute the value in
+    `load()`. Versions of the models are bumped after writes commit, so
+    values read before the commit are stored under outdated versions and
+    never read again. The value is computed on every call if the shared
+    cache does not keep versions.
+
+    Parameters
+    ----------
+    local_cache: LocalCache
+        The in-process cache. Default: a new LocalCache
+    '''
+    key_prefix = None
+    models = ()
+    timeout = 24 * 60 * 60
+
+    def __init__(self, local_cache=None):
+        if local_cache is None:
+            local_cache = LocalCache(max_entries=1)
+        self.local_cache = local_cache
+
+    def get_version_keys(self):
+        '''Return version keys which the value depends on.'''
+        return build_model_index_keys(self.models, build_key_for_model_version)
+
+    def load(self):
+        '''Compute the value from the database.'''
+        raise NotImplementedError
+
+    def get(self):
+        '''Return the cached value.'''
+        key = self.key_prefix + 'local'
+        value = self.local_cache.get(key)
+        if value is not None:
+            return value
+        versions = self.local_cache.get_versions(self.get_version_keys())
+        if versions is None:
+            return self.load()
+        shared_key = self.key_prefix + hashlib.md5(repr(
+            sorted(versions.items())).encode()).hexdigest()
+        value = cache.get(shared_key)
+        if value is None:
+            value = self.load()
+            cache.set(shared_key, value, self.timeout)
+        self.local_cache.set(key, value, versions)
+        return value
+
+    def clear(self):
+        '''Drop the value cached in the process.'''
+        self.local_cache.clear()
@@ -1,66 +1,319 @@
 '''Mixins that provide cache support for DRF.'''
+import time
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.db.models import signals
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from rest_framework.exceptions import APIException
 
-from drf_cache import CACHE_TIMEOUT
+from drf_cache import (
+    IGNORED_QUERY_PARAMS, CACHE_TIMEOUT, CACHE_STALE_TIMEOUT,
+    CACHE_LOCK_TIMEOUT, CACHE_LOCK_WAIT, CACHE_LOCK_POLL_INTERVAL
+)
 from drf_cache.utils import (
-    build_cache_key, invalidate_all_caches
+    build_cache_key, build_etag, is_etag_matched, dump_response,
+    load_response,
+    build_key_for_stale_response, build_key_for_lock,
+    build_key_for_list_group_index,
+    build_key_for_instance_inverted_index, build_key_for_list_index,
+    build_key_for_related_index, build_key_for_model_version,
+    build_model_index_keys, get_serializer_dependencies, update_indexes
 )
+from drf_cache.warmup import warmup_registry
 
 
 class DRFCacheMixin:
     '''Cache DRF responses of list, retrieve.
 
+    Cached responses are evicted once data they depend on is changed:
+
+    - Responses are indexed by ids of the instances they contain, so changing
+      or deleting an instance only evicts responses containing it (all pages
+      of a list are evicted together, since the change might shift items
+      between pages). Creating an instance evicts list responses.
+    - Filtered lists, actions listed in `cache_volatile_actions` and
+      responses without ids are evicted on every write of the model.
+    - Other models the responses depend on, which are models rendered by
+      the serializer (including nested serializers and dotted sources),
+      the user-group table (roles of the requester), and models listed in
+      `cache_dependencies`, evict the responses on every write.
+
+    Responses are cached per user by default, views whose responses only
+    vary on roles of the requester can share them across users with the same
+    roles through `cache_scope`.
+
+    Cached responses carry an ETag of their content, requests whose
+    `If-None-Match` matches it receive 304 without the body.
+
+    Views can opt in an in-process cache in front of the shared cache for
+    small and hot responses through `local_cache`.
+
+    Concurrent misses of the same key are coalesced: only the request holding
+    the lock rebuilds the response, others receive the stale copy if there is
+    one, or wait for the lock holder.
+
+    Requests listed in `cache_warmup` are sent in the background
+    periodically and (unless `after_invalidation` is False) after
+    invalidations, so hot responses are rebuilt before users ask for them.
+
     Properties
     ----------
     timeout: int
-        The number of seconds before deleting the cached result. Default: 600
+        The number of seconds before deleting the cached result. Default: 1800
+    cache_scope: str
+        What the responses vary on, 'user' (the requester), 'role' (groups
+        and admin flags of the requester) or 'public'. Default: 'user'
+    local_cache: LocalCache
+        The in-process cache shared by requests of the view in the process,
+        None to disable it. Default: None
+    stale_timeout: int
+        The number of seconds the stale copy is kept after the cached result
+        expires, 0 disables serving stale copies. Default: 300
+    cache_dependencies: tuple
+        Labels (`app_label.model_name`) of extra models the responses depend
+        on, such as models read in `SerializerMethodField`. Default: ()
+    cache_volatile_actions: tuple
+        Actions whose results are filtered or ordered by mutable fields,
+        such as status of records, so updating any instance might add it to
+        the results or move it onto a cached page. Default: ()
+    cache_warmup: tuple
+        Requests to warm up, each is a dict of keyword arguments passed to
+        `WarmupRegistry.register_request()`. Default: ()
     '''
     timeout = CACHE_TIMEOUT
-    _signals_registered = False
+    cache_scope = 'user'
+    local_cache = None
+    _initialized_request = None
+    _cache_identity = ''
+    _local_versions = None
+    stale_timeout = CACHE_STALE_TIMEOUT
+    cache_dependencies = ()
+    cache_volatile_actions = ()
+    cache_warmup = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for kwargs_of_request in cls.__dict__.get('cache_warmup', ()):
+            warmup_registry.register_request(**kwargs_of_request)
 
     @staticmethod
     def __is_paginated_response(data):
-        res = (x in data for x in ('count', 'previous', 'next', 'results'))
+        res = (x in data for x in ('next', 'results'))
         return all(res)
 
-    def _build_cache_for_results(self, cache_key, response):
+    def get_cache_identity(self, request):
+        '''Return the identity which the response varies on.'''
+        if self.cache_scope == 'public':
+            return ''
+        user = request.user
+        if not user.is_authenticated:
+            return 'anonymous'
+        if self.cache_scope == 'role':
+            # Group names are loaded along with users authenticated from
+            # snapshots (see `User.role_context`), so cached responses are
+            # served without querying the database.
+            group_names = sorted(user.role_context.group_names)
+            return 'role:{}:{}:{}'.format(
+                int(user.is_staff), int(user.is_superuser),
+                ','.join(group_names))
+        return f'user:{user.pk}'
+
+    def initialize_request(self, request, *args, **kwargs):
+        '''Reuse the request authenticated when building the cache key.'''
+        initialized_request = self._initialized_request
+        self._initialized_request = None
+        if initialized_request is not None:
+            return initialized_request
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_cache_dependencies(self):
+        '''Return models which the response of current action depends on.'''
+        model_classes = {get_user_model().groups.through}
+        model_classes.update(
+            get_serializer_dependencies(self.get_serializer_class()))
+        model_classes.update(
+            apps.get_model(label) for label in self.cache_dependencies)
+        return model_classes
+
+    def _get_pagination_params(self):
+        '''Return query parameters used by the paginator.'''
+        return tuple(
+            getattr(self.paginator, name) for name in (
+                'limit_query_param', 'offset_query_param',
+                'page_query_param', 'page_size_query_param',
+                'cursor_query_param',
+            ) if getattr(self.paginator, name, None)
+        )
+
+    def _is_volatile_list(self, request):
+        '''Whether the list might gain results when instances are updated.'''
+        if self.action in self.cache_volatile_actions:
+            return True
+        non_filter_params = set(self._get_pagination_params()).union(
+            IGNORED_QUERY_PARAMS, ('format',))
+        return any(x not in non_filter_params for x in request.query_params)
+
+    def _get_index_members(self, cache_key, results, is_list):
+        '''Return members to register per index for the cached response.'''
+        model_cls = self.get_queryset().model
+        app_label = model_cls._meta.app_label
+        model_name = model_cls._meta.model_name
+        dependencies = self.get_cache_dependencies() | {model_cls}
+        members_by_index = {
+            index_key: {cache_key}
+            for index_key in build_model_index_keys(dependencies)
+        }
+        related_models = dependencies - {model_cls}
+        for index_key in build_model_index_keys(
+                related_models, build_key_for_related_index):
+            members_by_index[index_key] = {cache_key}
+
+        instance_ids = [x.get('id') if isinstance(x, dict) else None
+                        for x in results]
+        if None in instance_ids or (
+                is_list and self._is_volatile_list(self.request)):
+            members_by_index[build_key_for_related_index(
+                app_label, model_name)] = {cache_key}
+            return members_by_index
+
+        member = cache_key
+        if is_list:
+            member = build_key_for_list_group_index(
+                self.request, app_label, model_name,
+                self._get_pagination_params(), self._cache_identity)
+            members_by_index[member] = {cache_key}
+            members_by_index[build_key_for_list_index(
+                app_label, model_name)] = {member}
+        for instance_id in instance_ids:
+            members_by_index[build_key_for_instance_inverted_index(
+                instance_id, app_label, model_name)] = {member}
+        return members_by_index
+
+    def _build_cache_for_results(self, cache_key, response, lock_key=None):
         '''Set cache for results, update inverted index.'''
         results = response.data
+        is_list = True
         if self.__is_paginated_response(results):
             # Paginated response
             results = results['results']
         elif isinstance(results, dict):
             # Single object
             results = [results]
+            is_list = False
+        elif not isinstance(results, list):
+            results = [None]
+        members_by_index = self._get_index_members(
+            cache_key, results, is_list)
+
+        def set_cache(response):
+            response['ETag'] = build_etag(response.content)
+            patch_cache_control(response, private=True, no_cache=True)
+            entry = dump_response(response)
+            cache.set(cache_key, entry, self.timeout)
+            update_indexes(members_by_index, self.timeout)
+            if self.stale_timeout:
+                cache.set(build_key_for_stale_response(cache_key), entry,
+                          self.timeout + self.stale_timeout)
+            if lock_key is not None:
+                cache.delete(lock_key)
+            self._set_local_cache(cache_key, entry)
         if hasattr(response, 'render') and callable(response.render):
-            def set_cache(response):
-                cache.set(cache_key, response, self.timeout)
             response.add_post_render_callback(set_cache)
         else:
-            cache.set(cache_key, response, self.timeout)
+            set_cache(response)
 
-    @classmethod
-    def _register_signals(cls):
-        signals.m2m_changed.connect(invalidate_all_caches)
-        signals.post_save.connect(invalidate_all_caches)
-        signals.pre_delete.connect(invalidate_all_caches)
-        cls._signals_registered = True
+    def _get_local_cache(self, cache_key, model_cls):
+        '''Return entry in the in-process cache, or read versions which the
+        entry will depend on.'''
+        cached_result = self.local_cache.get(cache_key)
+        if cached_result:
+            return cached_result
+        model_classes = self.get_cache_dependencies() | {model_cls}
+        self._local_versions = self.local_cache.get_versions(
+            build_model_index_keys(model_classes, build_key_for_model_version))
+        return None
+
+    def _set_local_cache(self, cache_key, entry):
+        '''Store entry in the in-process cache if enabled.'''
+        if self.local_cache is not None and self._local_versions is not None:
+            self.local_cache.set(
+                cache_key, entry, self._local_versions, len(entry[3]))
+
+    @staticmethod
+    def _get_cached_response(request, cached_result):
+        '''Return response of the cache entry, or 304 response if the client
+        has the cached result.'''
+        headers = cached_result[1]
+        if not is_etag_matched(request, headers.get('ETag')):
+            return load_response(cached_result)
+        response = HttpResponseNotModified()
+        for header in ('ETag', 'Cache-Control'):
+            if header in headers:
+                response[header] = headers[header]
+        return response
+
+    def _wait_for_lock_holder(self, cache_key):
+        '''Return the stale entry, or the entry built by the lock holder,
+        or None if it is not ready in time.'''
+        if self.stale_timeout:
+            stale_result = cache.get(build_key_for_stale_response(cache_key))
+            if stale_result:
+                return stale_result
+        deadline = time.monotonic() + CACHE_LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(CACHE_LOCK_POLL_INTERVAL)
+            cached_result = cache.get(cache_key)
+            if cached_result:
+                return cached_result
+        return None
 
     def dispatch(self, request, *args, **kwargs):
         '''Override dispatch() to check cache.'''
+        if request.method not in ('GET', 'HEAD') or not self.timeout:
+            return super().dispatch(request, *args, **kwargs)
+        self._initialized_request = self.initialize_request(
+            request, *args, **kwargs)
+        try:
+            self._cache_identity = self.get_cache_identity(
+                self._initialized_request)
+        except APIException:
+            # Let DRF authenticate the request again and handle the error.
+            self._initialized_request = None
+            return super().dispatch(request, *args, **kwargs)
         model_cls = self.get_queryset().model
         app_label = model_cls._meta.app_label
         model_name = model_cls._meta.model_name
-        if not self._signals_registered:
-            self._register_signals()
-        cache_key = build_cache_key(request, app_label, model_name)
+        cache_key = build_cache_key(
+            request, app_label, model_name, self._cache_identity)
+        if self.local_cache is not None:
+            cached_result = self._get_local_cache(cache_key, model_cls)
+            if cached_result:
+                return self._get_cached_response(request, cached_result)
         cached_result = cache.get(cache_key, None)
+        if self.local_cache is not None:
+            self.local_cache.stats[
+                'shared_hits' if cached_result else 'shared_misses'] += 1
         if cached_result:
-            return cached_result
-        response = super().dispatch(request, *args, **kwargs)
-        if (request.method in ('GET', 'HEAD')
-                and self.timeout
-                and response.status_code == 200):
-            self._build_cache_for_results(cache_key, response)
+            self._set_local_cache(cache_key, cached_result)
+            return self._get_cached_response(request, cached_result)
+        lock_key = build_key_for_lock(cache_key)
+        if not cache.add(lock_key, True, CACHE_LOCK_TIMEOUT):
+            cached_result = self._wait_for_lock_holder(cache_key)
+            if cached_result:
+                return self._get_cached_response(request, cached_result)
+            # The lock holder is too slow, build the response without the
+            # lock and leave the lock to its holder.
+            lock_key = None
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        except Exception:
+            if lock_key is not None:
+                cache.delete(lock_key)
+            raise
+        if response.status_code == 200:
+            self._build_cache_for_results(cache_key, response, lock_key)
+        elif lock_key is not None:
+            cache.delete(lock_key)
         return response
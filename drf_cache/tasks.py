@@ -0,0 +1,10 @@
+'''Celery tasks.'''
+from celery import shared_task
+
+from drf_cache.warmup import warmup_registry
+
+
+@shared_task
+def warm_up_caches(after_invalidation=False):
+    '''Re-populate caches registered in the warm-up registry.'''
+    return warmup_registry.warm_up(after_invalidation=after_invalidation)
@@ -0,0 +1,98 @@
+'''Unit tests for drf_cache local cache.'''
+from unittest.mock import ANY, patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from drf_cache import VERSION_TIMEOUT
+from drf_cache.local import LocalCache
+from drf_cache.tests.tests_utils import LOCMEM_CACHES
+from drf_cache.utils import bump_versions
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestLocalCache(TestCase):
+    '''Unit tests for LocalCache.'''
+    def setUp(self):
+        cache.clear()
+        self.local_cache = LocalCache(max_entries=2, max_bytes=100,
+                                      check_interval=0)
+
+    def test_evict_least_recently_used(self):
+        '''Should drop least recently used entries beyond max_entries.'''
+        self.local_cache.set('a', 1, size=1)
+        self.local_cache.set('b', 2, size=1)
+        self.local_cache.get('a')
+
+        self.local_cache.set('c', 3, size=1)
+
+        self.assertEqual(self.local_cache.get('a'), 1)
+        self.assertIsNone(self.local_cache.get('b'))
+        self.assertEqual(self.local_cache.get('c'), 3)
+
+    def test_limit_bytes(self):
+        '''Should drop entries beyond max_bytes and skip large entries.'''
+        self.local_cache.set('a', 1, size=60)
+        self.local_cache.set('b', 2, size=60)
+        self.local_cache.set('c', 3, size=101)
+
+        self.assertIsNone(self.local_cache.get('a'))
+        self.assertEqual(self.local_cache.get('b'), 2)
+        self.assertIsNone(self.local_cache.get('c'))
+
+    def test_expire(self):
+        '''Should drop expired entries.'''
+        self.local_cache.timeout = 0
+        self.local_cache.set('a', 1)
+
+        self.assertIsNone(self.local_cache.get('a'))
+
+    def test_drop_outdated_versions(self):
+        '''Should drop entries after versions are bumped elsewhere.'''
+        versions = self.local_cache.get_versions(['version'])
+        self.local_cache.set('a', 1, versions)
+        self.local_cache.set('b', 2)
+
+        bump_versions(['version'])
+
+        self.assertIsNone(self.local_cache.get('a'))
+        self.assertEqual(self.local_cache.get('b'), 2)
+
+    def test_expire_versions(self):
+        '''Should initialize versions which expire.'''
+        with patch.object(cache, 'add', wraps=cache.add) as mocked_add:
+            self.local_cache.get_versions(['version'])
+
+        mocked_add.assert_called_once_with('version', ANY, VERSION_TIMEOUT)
+
+    def test_check_versions_periodically(self):
+        '''Should keep entries until the next version check.'''
+        self.local_cache.check_interval = 60
+        versions = self.local_cache.get_versions(['version'])
+        self.local_cache.set('a', 1, versions)
+        self.local_cache.get('a')
+
+        bump_versions(['version'])
+
+        self.assertEqual(self.local_cache.get('a'), 1)
+
+    def test_get_or_set(self):
+        '''Should count hits and misses of both tiers.'''
+        self.local_cache.get_or_set('a', lambda: 1, 60)
+        self.local_cache.clear()
+        self.local_cache.get_or_set('a', lambda: 2, 60)
+        value = self.local_cache.get_or_set('a', lambda: 3, 60)
+
+        self.assertEqual(value, 1)
+        self.assertEqual(self.local_cache.stats, {
+            'local_hits': 1, 'local_misses': 2,
+            'shared_hits': 1, 'shared_misses': 1,
+        })
+
+    def test_untracked_versions(self):
+        '''Should not track versions if the shared cache does not keep them.'''
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            versions = self.local_cache.get_versions(['version'])
+
+        self.assertIsNone(versions)
@@ -0,0 +1,274 @@
+'''Unit tests for drf_cache mixins.'''
+import json
+import threading
+import time
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from model_mommy import mommy
+from rest_framework import status, viewsets
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from auth.models import Department, User
+from auth.views import DepartmentViewSet
+from auth.serializers import DepartmentSerializer
+from auth.user_snapshots import user_snapshots
+from infra.models import Notification
+from drf_cache.mixins import DRFCacheMixin
+from drf_cache.tests.tests_utils import LOCMEM_CACHES, run_commit_hooks
+from drf_cache.utils import (
+    build_cache_key, build_key_for_lock, build_key_for_stale_response
+)
+
+
+class SlowViewSet(DRFCacheMixin, viewsets.GenericViewSet):
+    '''A view counting how many times its response is built.'''
+    queryset = Department.objects.none()
+    serializer_class = DepartmentSerializer
+    authentication_classes = ()
+    permission_classes = ()
+    computations = 0
+    computations_lock = threading.Lock()
+
+    def list(self, request):
+        '''Return a constant response slowly.'''
+        with self.computations_lock:
+            SlowViewSet.computations += 1
+            computations = SlowViewSet.computations
+        time.sleep(0.2)
+        return Response({'computations': computations})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestDRFCacheMixin(APITestCase):
+    '''Unit tests for DRFCacheMixin.'''
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = mommy.make(User, is_staff=True)
+        cls.department = mommy.make(Department, name='Old')
+
+    def setUp(self):
+        run_commit_hooks()
+        cache.clear()
+        self.local_cache = DepartmentViewSet.local_cache
+        self.local_cache.clear()
+        patcher = patch.object(self.local_cache, 'check_interval', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.url = reverse('department-detail', args=(self.department.pk,))
+        self.client.force_authenticate(self.user)
+
+    def test_cache_hit(self):
+        '''Should return cached response until dependencies change.'''
+        response = self.client.get(self.url)
+        Department.objects.filter(pk=self.department.pk).update(name='New')
+
+        cached_response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(cached_response.json()['name'], 'Old')
+
+    def test_keep_cache_on_unrelated_write(self):
+        '''Should keep cached response after writes of other models.'''
+        self.client.get(self.url)
+        Department.objects.filter(pk=self.department.pk).update(name='New')
+
+        mommy.make(Notification)
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.json()['name'], 'Old')
+
+    def test_evict_cache_on_related_write(self):
+        '''Should evict cached response after writes of dependencies.'''
+        self.client.get(self.url)
+        self.department.name = 'New'
+        self.department.save()
+        run_commit_hooks()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.json()['name'], 'New')
+
+    def test_ignore_unrelated_cookies(self):
+        '''Should share cached response between requests of the user.'''
+        self.client.get(self.url)
+        Department.objects.filter(pk=self.department.pk).update(name='New')
+
+        self.client.cookies['analytics'] = 'value'
+        response = self.client.get(self.url, {'_': '1562150000000'})
+
+        self.assertEqual(response.json()['name'], 'Old')
+
+    def test_share_cache_between_roles(self):
+        '''Should share role-scoped response between users of the role.'''
+        self.client.get(self.url)
+        Department.objects.filter(pk=self.department.pk).update(name='New')
+
+        self.client.force_authenticate(mommy.make(User, is_staff=True))
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.json()['name'], 'Old')
+
+    def test_serve_role_scoped_cache_without_queries(self):
+        '''Should serve role-scoped response to users authenticated from
+        snapshots without querying the database.'''
+        self.client.get(self.url)
+        self.local_cache.clear()
+
+        self.client.force_authenticate(user_snapshots.get_user(self.user.pk))
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_separate_cache_between_roles(self):
+        '''Should not share role-scoped response between roles.'''
+        self.client.get(self.url)
+        Department.objects.filter(pk=self.department.pk).update(name='New')
+
+        self.client.force_authenticate(mommy.make(User, is_superuser=True))
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.json()['name'], 'New')
+
+    def test_not_modified(self):
+        '''Should return 304 if If-None-Match matches the cached ETag.'''
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_modified_after_write(self):
+        '''Should return the new response if the ETag is outdated.'''
+        etag = self.client.get(self.url)['ETag']
+        self.department.name = 'New'
+        self.department.save()
+        run_commit_hooks()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['name'], 'New')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_local_cache(self):
+        '''Should serve hot responses from the in-process cache.'''
+        self.client.get(self.url)
+        stats = dict(self.local_cache.stats)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.local_cache.stats['local_hits'],
+                         stats['local_hits'] + 1)
+        self.assertEqual(self.local_cache.stats['shared_hits'],
+                         stats['shared_hits'])
+
+    def test_keep_cache_on_other_instance_write(self):
+        '''Should keep cached detail after writes of other instances.'''
+        self.client.get(self.url)
+        Department.objects.filter(pk=self.department.pk).update(name='New')
+
+        other_department = mommy.make(Department)
+        other_department.name = 'Other'
+        other_department.save()
+        run_commit_hooks()
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.json()['name'], 'Old')
+
+    def test_evict_all_pages_on_instance_write(self):
+        '''Should evict every page of a list containing the instance.'''
+        mommy.make(Department)
+        run_commit_hooks()
+        url = reverse('department-list')
+        self.client.get(url, {'limit': 1, 'offset': 0})
+        self.client.get(url, {'limit': 1, 'offset': 1})
+        Department.objects.all().update(name='New')
+
+        self.department.name = 'New'
+        self.department.save()
+        run_commit_hooks()
+        pages = [self.client.get(url, {'limit': 1, 'offset': offset})
+                 for offset in (0, 1)]
+
+        self.assertEqual(
+            [page.json()['results'][0]['name'] for page in pages],
+            ['New', 'New'])
+
+    def test_evict_list_on_create(self):
+        '''Should evict cached lists after instances are created.'''
+        url = reverse('department-list')
+        response = self.client.get(url)
+
+        mommy.make(Department)
+        run_commit_hooks()
+        new_response = self.client.get(url)
+
+        self.assertEqual(new_response.json()['count'],
+                         response.json()['count'] + 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestRequestCoalescing(SimpleTestCase):
+    '''Unit tests for coalescing concurrent cache misses.'''
+    def setUp(self):
+        cache.clear()
+        SlowViewSet.computations = 0
+        self.view = SlowViewSet.as_view({'get': 'list'})
+        self.factory = APIRequestFactory()
+        self.cache_key = build_cache_key(
+            self.factory.get('/slow/'), 'tmsftt_auth', 'department',
+            'anonymous')
+
+    def _get(self):
+        response = self.view(self.factory.get('/slow/'))
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_compute_once_for_concurrent_misses(self):
+        '''Should build the response only once for concurrent requests.'''
+        responses = []
+
+        def request():
+            responses.append(self._get())
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(SlowViewSet.computations, 1)
+        self.assertEqual(len(responses), 8)
+        self.assertTrue(all(json.loads(x.content) == {'computations': 1}
+                            for x in responses))
+        self.assertIsNone(cache.get(build_key_for_lock(self.cache_key)))
+
+    def test_serve_stale_while_rebuilding(self):
+        '''Should serve the stale copy while another request rebuilds.'''
+        self._get()
+        cache.delete(self.cache_key)
+        cache.add(build_key_for_lock(self.cache_key), True)
+
+        response = self._get()
+
+        self.assertEqual(SlowViewSet.computations, 1)
+        self.assertEqual(json.loads(response.content), {'computations': 1})
+        self.assertIsNotNone(
+            cache.get(build_key_for_stale_response(self.cache_key)))
+
+    def test_rebuild_after_eviction(self):
+        '''Should rebuild the response if nobody else is rebuilding.'''
+        self._get()
+        cache.delete(self.cache_key)
+
+        response = self._get()
+
+        self.assertEqual(json.loads(response.content), {'computations': 2})
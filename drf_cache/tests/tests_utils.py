@@ -0,0 +1,285 @@
+'''Unit tests for drf_cache utils.'''
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import RequestFactory, TestCase, override_settings
+from model_mommy import mommy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from auth.models import Department, User, UserGroup
+from infra.models import Notification
+from training_event.models import CampusEvent, EventCoefficient
+from training_program.models import Program
+from training_record.models import Record, RecordContent, RecordAttachment
+from training_record.serializers import ReadOnlyRecordSerializer
+from drf_cache.utils import (
+    add_key_to_indexes, batch_invalidation, build_cache_key, dump_response,
+    load_response, build_key_for_instance_inverted_index,
+    build_key_for_list_index, build_key_for_namespace_index,
+    build_key_for_related_index, build_model_index_keys, evict_indexes,
+    get_model_aliases, get_serializer_dependencies, invalidate_model_caches,
+    update_indexes
+)
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+def run_commit_hooks():
+    '''Run on_commit callbacks, which never run in TestCase.'''
+    connection = transaction.get_connection()
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for _, func in callbacks:
+        func()
+
+
+class TestBuildCacheKey(TestCase):
+    '''Unit tests for build_cache_key().'''
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_canonical_query(self):
+        '''Should sort query parameters and drop cache busters.'''
+        key = build_cache_key(
+            self.factory.get('/api/records/?b=2&a=1&_=1562150000000'),
+            'training_record', 'record', 'user:1')
+        canonical_key = build_cache_key(
+            self.factory.get('/api/records/?a=1&b=2'),
+            'training_record', 'record', 'user:1')
+
+        self.assertEqual(key, canonical_key)
+
+    def test_ignore_headers(self):
+        '''Should build the same key for the same identity.'''
+        key = build_cache_key(
+            self.factory.get('/api/records/', HTTP_COOKIE='a=1'),
+            'training_record', 'record', 'user:1')
+        other_key = build_cache_key(
+            self.factory.get('/api/records/', HTTP_AUTHORIZATION='JWT x'),
+            'training_record', 'record', 'user:1')
+
+        self.assertEqual(key, other_key)
+
+    def test_vary_on_identity(self):
+        '''Should build different keys for different identities.'''
+        request = self.factory.get('/api/records/')
+
+        self.assertNotEqual(
+            build_cache_key(request, 'training_record', 'record', 'user:1'),
+            build_cache_key(request, 'training_record', 'record', 'user:2'))
+
+
+class TestCacheEntry(TestCase):
+    '''Unit tests for dump_response() and load_response().'''
+    def _render(self, data):
+        response = Response(data, headers={'ETag': '"etag"'})
+        response.accepted_renderer = JSONRenderer()
+        response.accepted_media_type = 'application/json'
+        response.renderer_context = {}
+        return response.render()
+
+    def test_small_response(self):
+        '''Should keep small body uncompressed.'''
+        response = self._render({'id': 1})
+
+        entry = dump_response(response)
+        loaded_response = load_response(entry)
+
+        self.assertFalse(entry[2])
+        self.assertEqual(loaded_response.content, response.content)
+        self.assertEqual(loaded_response['ETag'], '"etag"')
+        self.assertEqual(loaded_response['Content-Type'], 'application/json')
+
+    def test_large_response(self):
+        '''Should compress large body.'''
+        response = self._render([{'id': x, 'name': 'name'}
+                                 for x in range(200)])
+
+        entry = dump_response(response)
+        loaded_response = load_response(entry)
+
+        self.assertTrue(entry[2])
+        self.assertLess(len(entry[3]), len(response.content))
+        self.assertEqual(loaded_response.content, response.content)
+
+
+class TestSerializerDependencies(TestCase):
+    '''Unit tests for get_serializer_dependencies().'''
+    def test_nested_serializers(self):
+        '''Should follow nested serializers, dotted sources and relations.'''
+        dependencies = get_serializer_dependencies(ReadOnlyRecordSerializer)
+
+        expected_models = {Record, CampusEvent, Program, Department,
+                           EventCoefficient, RecordContent, RecordAttachment}
+        self.assertTrue(expected_models.issubset(dependencies))
+        self.assertNotIn(Notification, dependencies)
+
+    def test_model_aliases(self):
+        '''Should treat unmanaged mappings of M2M tables as aliases.'''
+        aliases = get_model_aliases(UserGroup)
+
+        self.assertIn(User.groups.through, aliases)
+        self.assertIn(UserGroup, aliases)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestModelScopedInvalidation(TestCase):
+    '''Unit tests for model-scoped invalidation.'''
+    def setUp(self):
+        cache.clear()
+        self.record_index = build_key_for_namespace_index(
+            'training_record', 'record')
+        self.record_key = 'DRF_CACHE:CACHE_KEY:record'
+        cache.set(self.record_key, 'value')
+        add_key_to_indexes(self.record_key, [
+            self.record_index,
+            build_key_for_related_index('training_record', 'record'),
+        ], 60)
+
+    def test_evict_indexes(self):
+        '''Should delete registered keys and the index itself.'''
+        evicted = evict_indexes([self.record_index])
+
+        self.assertEqual(evicted, {self.record_key})
+        self.assertIsNone(cache.get(self.record_key))
+        self.assertIsNone(cache.get(self.record_index))
+
+    def test_write_unrelated_model(self):
+        '''Should keep caches which do not depend on the changed model.'''
+        mommy.make(Notification)
+
+        self.assertEqual(cache.get(self.record_key), 'value')
+
+    def test_write_related_model(self):
+        '''Should evict caches which depend on the changed model.'''
+        mommy.make(Record, campus_event=mommy.make(CampusEvent))
+        run_commit_hooks()
+
+        self.assertIsNone(cache.get(self.record_key))
+
+    def test_m2m_change_evicts_aliases(self):
+        '''Should evict caches of the alias model after M2M changes.'''
+        index_keys = build_model_index_keys([UserGroup])
+        user_group_key = 'DRF_CACHE:CACHE_KEY:user-group'
+        cache.set(user_group_key, 'value')
+        add_key_to_indexes(user_group_key, index_keys, 60)
+        user = mommy.make(User)
+
+        user.groups.add(mommy.make('auth.Group'))
+        run_commit_hooks()
+
+        self.assertIsNone(cache.get(user_group_key))
+
+    def test_invalidate_model_caches(self):
+        '''Should evict caches after explicit invalidation.'''
+        invalidate_model_caches(Record)
+        run_commit_hooks()
+
+        self.assertIsNone(cache.get(self.record_key))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestInstanceScopedInvalidation(TestCase):
+    '''Unit tests for instance-scoped invalidation.'''
+    def setUp(self):
+        cache.clear()
+        self.department = mommy.make(Department)
+        self.other_department = mommy.make(Department)
+        run_commit_hooks()
+        self.detail_key = 'DRF_CACHE:CACHE_KEY:detail'
+        self.page_keys = ['DRF_CACHE:CACHE_KEY:page1',
+                          'DRF_CACHE:CACHE_KEY:page2']
+        list_group = 'DRF_CACHE:LIST_GROUP_INDEX:list'
+        cache.set_many(
+            {x: 'value' for x in [self.detail_key, *self.page_keys]})
+        update_indexes({
+            build_key_for_instance_inverted_index(
+                self.department.pk, 'tmsftt_auth', 'department'): [
+                    self.detail_key],
+            build_key_for_instance_inverted_index(
+                self.other_department.pk, 'tmsftt_auth', 'department'): [
+                    list_group],
+            build_key_for_list_index('tmsftt_auth', 'department'): [
+                list_group],
+            list_group: self.page_keys,
+        }, 60)
+
+    def test_update_instance(self):
+        '''Should only evict responses containing the instance.'''
+        self.department.name = 'New'
+        self.department.save()
+        run_commit_hooks()
+
+        self.assertIsNone(cache.get(self.detail_key))
+        self.assertEqual(cache.get_many(self.page_keys),
+                         {x: 'value' for x in self.page_keys})
+
+    def test_update_instance_in_list(self):
+        '''Should evict all pages of the list containing the instance.'''
+        self.other_department.delete()
+        run_commit_hooks()
+
+        self.assertEqual(cache.get_many(self.page_keys), {})
+        self.assertEqual(cache.get(self.detail_key), 'value')
+
+    def test_create_instance(self):
+        '''Should evict list responses after creating instances.'''
+        mommy.make(Department)
+        run_commit_hooks()
+
+        self.assertEqual(cache.get_many(self.page_keys), {})
+        self.assertEqual(cache.get(self.detail_key), 'value')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestTransactionAwareInvalidation(TestCase):
+    '''Unit tests for invalidations deferred to commits.'''
+    def setUp(self):
+        self.department = mommy.make(Department)
+        run_commit_hooks()
+        cache.clear()
+        self.cache_key = 'DRF_CACHE:CACHE_KEY:detail'
+        cache.set(self.cache_key, 'value')
+        update_indexes({
+            build_key_for_instance_inverted_index(
+                self.department.pk, 'tmsftt_auth', 'department'): [
+                    self.cache_key],
+        }, 60)
+
+    def test_defer_to_commit(self):
+        '''Should invalidate caches after the transaction commits.'''
+        self.department.save()
+
+        self.assertEqual(cache.get(self.cache_key), 'value')
+        run_commit_hooks()
+        self.assertIsNone(cache.get(self.cache_key))
+
+    def test_discard_on_rollback(self):
+        '''Should keep caches if the transaction is rolled back.'''
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                self.department.save()
+                raise ValueError
+
+        run_commit_hooks()
+        self.assertEqual(cache.get(self.cache_key), 'value')
+
+    @patch('drf_cache.utils.evict_indexes', wraps=evict_indexes)
+    def test_batch_invalidation(self, mocked_evict_indexes):
+        '''Should run de-duplicated invalidations at once.'''
+        with batch_invalidation() as batch:
+            for _ in range(3):
+                self.department.save()
+            mommy.make(Department, _quantity=3)
+
+            # Related and list indexes, inverted indexes of 4 departments.
+            self.assertEqual(len(batch.index_keys), 6)
+        run_commit_hooks()
+
+        mocked_evict_indexes.assert_called_once()
+        self.assertIsNone(cache.get(self.cache_key))
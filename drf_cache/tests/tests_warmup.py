@@ -0,0 +1,159 @@
+'''Unit tests for drf_cache warm-up.'''
+from unittest.mock import Mock, patch
+
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+from model_mommy import mommy
+from rest_framework.test import APIClient
+
+from auth.models import Department, User
+from auth.views import DepartmentViewSet
+from drf_cache import WARMUP_DELAY, WARMUP_LOCK_KEY
+from drf_cache.tests.tests_utils import LOCMEM_CACHES, run_commit_hooks
+from drf_cache.utils import (
+    add_key_to_indexes, build_model_index_keys, invalidate_model_caches
+)
+from drf_cache.warmup import WarmupRegistry, recent_users
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestWarmupRegistry(TestCase):
+    '''Unit tests for WarmupRegistry.'''
+    def setUp(self):
+        cache.clear()
+        DepartmentViewSet.local_cache.clear()
+        self.registry = WarmupRegistry()
+        self.group = mommy.make(Group, name='大连理工-10141-管理员')
+        self.admin = mommy.make(User, last_login=now(),
+                                department=mommy.make(Department))
+        self.admin.groups.add(self.group)
+        mommy.make(User, last_login=None)
+
+    def test_recent_users(self):
+        '''Should return users who logged in, filtered by lookups.'''
+        users = recent_users(groups__name__endswith='管理员')
+
+        self.assertEqual(list(users()), [self.admin])
+
+    def test_warm_up_requests(self):
+        '''Should send requests as users, so their responses are cached.'''
+        self.registry.register_request(
+            'department-list', users=recent_users())
+
+        count = self.registry.warm_up(max_workers=1)
+
+        self.assertEqual(count, 1)
+        self.assertEqual(len(DepartmentViewSet.local_cache), 1)
+
+    @override_settings(DRF_CACHE_WARMUP_HOST='example.com',
+                       ALLOWED_HOSTS=['example.com'])
+    def test_warm_up_host(self):
+        '''Should send requests to the configured host, so real requests to
+        the host hit the warmed up responses.'''
+        self.registry.register_request(
+            'department-list', users=recent_users())
+        self.assertEqual(self.registry.warm_up(max_workers=1), 1)
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        response = client.get(reverse('department-list'),
+                              HTTP_HOST='example.com')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(DepartmentViewSet.local_cache), 1)
+
+    def test_warm_up_callables(self):
+        '''Should call callables with their arguments.'''
+        func = Mock()
+        self.registry.register_callable(func, 1, 2)
+
+        count = self.registry.warm_up(max_workers=1)
+
+        self.assertEqual(count, 1)
+        func.assert_called_once_with(1, 2)
+
+    @override_settings(DRF_CACHE_WARMUP_URL_SCHEME='https',
+                       DRF_CACHE_WARMUP_HOST='example.com',
+                       ALLOWED_HOSTS=['example.com'])
+    def test_warm_up_scheme(self):
+        '''Should send requests with the configured scheme, so real secure
+        requests hit the warmed up responses.'''
+        self.registry.register_request(
+            'department-list', users=recent_users())
+        self.assertEqual(self.registry.warm_up(max_workers=1), 1)
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        response = client.get(reverse('department-list'),
+                              HTTP_HOST='example.com', secure=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(DepartmentViewSet.local_cache), 1)
+
+    def test_warm_up_after_invalidation(self):
+        '''Should only run warm-ups enabled after invalidations.'''
+        func = Mock()
+        periodic_func = Mock()
+        self.registry.register_callable(func)
+        self.registry.register_callable(
+            periodic_func, after_invalidation=False)
+
+        count = self.registry.warm_up(max_workers=1, after_invalidation=True)
+
+        self.assertEqual(count, 1)
+        func.assert_called_once_with()
+        periodic_func.assert_not_called()
+
+    def test_skip_failures(self):
+        '''Should keep running other warm-ups after failures.'''
+        func = Mock()
+        self.registry.register_callable(Mock(side_effect=ValueError))
+        self.registry.register_callable(func)
+
+        count = self.registry.warm_up(max_workers=1)
+
+        self.assertEqual(count, 1)
+        func.assert_called_once_with()
+
+    def test_skip_concurrent_warm_up(self):
+        '''Should not run if another warm-up is running.'''
+        func = Mock()
+        self.registry.register_callable(func)
+        cache.set(WARMUP_LOCK_KEY, True)
+
+        count = self.registry.warm_up(max_workers=1)
+
+        self.assertIsNone(count)
+        func.assert_not_called()
+
+
+@override_settings(CACHES=LOCMEM_CACHES,
+                   DRF_CACHE_WARMUP_AFTER_INVALIDATION=True)
+class TestScheduleWarmup(TestCase):
+    '''Unit tests for scheduling warm-ups after invalidations.'''
+    def setUp(self):
+        cache.clear()
+
+    @patch('drf_cache.tasks.warm_up_caches.apply_async')
+    def test_schedule_after_eviction(self, mocked_apply_async):
+        '''Should schedule one warm-up for evictions within the delay.'''
+        for index in range(2):
+            cache_key = f'DRF_CACHE:CACHE_KEY:{index}'
+            add_key_to_indexes(
+                cache_key, build_model_index_keys([Department]), 60)
+            invalidate_model_caches(Department)
+            run_commit_hooks()
+
+        mocked_apply_async.assert_called_once_with(
+            kwargs={'after_invalidation': True}, countdown=WARMUP_DELAY)
+
+    @patch('drf_cache.tasks.warm_up_caches.apply_async')
+    def test_skip_without_eviction(self, mocked_apply_async):
+        '''Should not schedule warm-ups if nothing is evicted.'''
+        invalidate_model_caches(Department)
+        run_commit_hooks()
+
+        mocked_apply_async.assert_not_called()
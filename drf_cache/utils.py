@@ -1,40 +1,144 @@
 '''Utility functions.'''
 import hashlib
-from urllib.parse import quote
+import threading
+import zlib
+from contextlib import contextmanager
+from functools import lru_cache
+from urllib.parse import quote, urlencode
 
+from django.apps import apps
+from django.conf import settings
 from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.http import HttpResponse
 from django.utils.encoding import uri_to_iri, force_bytes
+from django.utils.http import parse_etags, quote_etag
+from django_redis import get_redis_connection
+from rest_framework import serializers
 
 from drf_cache import (
-    CACHE_KEY_FORMAT, INVERTED_INDEX_KEY_FORMAT, VARY_HEADERS
+    CACHE_NAME, CACHE_COMPRESS_MIN_SIZE, CACHED_HEADERS, CACHE_KEY_PREFIX,
+    CACHE_KEY_FORMAT, STALE_KEY_PREFIX, LOCK_KEY_PREFIX,
+    LIST_GROUP_INDEX_KEY_FORMAT, INVERTED_INDEX_KEY_FORMAT,
+    LIST_INDEX_KEY_FORMAT, RELATED_INDEX_KEY_FORMAT,
+    NAMESPACE_INDEX_KEY_FORMAT, MODEL_VERSION_KEY_FORMAT,
+    IGNORED_QUERY_PARAMS, VERSION_TIMEOUT, WARMUP_DELAY, WARMUP_SCHEDULE_KEY
 )
 
 
-def build_cache_key(request, app_label, model_name, vary_headers=VARY_HEADERS):
-    '''Construct cache key of the given request.'''
-    uri = quote(uri_to_iri(request.build_absolute_uri()))
-    vary = ''
-    for vary_header in vary_headers:
-        if vary_header in request.headers:
-            vary += request.headers[vary_header]
-    finger_print = hashlib.md5(force_bytes(vary)).hexdigest()
+def _build_uri(request, excluded_params=()):
+    '''Construct quoted absolute URI of the request. Query parameters are
+    sorted, parameters which don't affect results are dropped.'''
+    excluded_params = set(excluded_params).union(IGNORED_QUERY_PARAMS)
+    query = [
+        (param, value)
+        for param, values in sorted(request.GET.lists())
+        if param not in excluded_params for value in values
+    ]
+    path = request.build_absolute_uri(request.path)
+    if query:
+        path = f'{path}?{urlencode(query)}'
+    return quote(uri_to_iri(path))
+
+
+def _build_finger_print(identity):
+    return hashlib.md5(force_bytes(identity)).hexdigest()
+
+
+def build_cache_key(request, app_label, model_name, identity=''):
+    '''Construct cache key of the given request.
+
+    Parameters
+    ----------
+    identity: str
+        The identity which the response varies on, such as the user id, or
+        empty string if the response is the same for all users.
+    '''
     data = {
         'method': request.method,
         'app_label': app_label,
         'model_name': model_name,
-        'uri': uri,
-        'fp': finger_print,
+        'uri': _build_uri(request),
+        'fp': _build_finger_print(identity),
     }
     cache_key = CACHE_KEY_FORMAT.format(**data)
     return cache_key
 
 
-def invalidate_all_caches(*_, **__):
-    '''Invalidate all daches is a high-cost task, ideally we can only
-    invalidate caches related to the model change, but it's not easy,
-    so currently we invalidate all caches.
+def build_etag(content):
+    '''Construct strong ETag from the rendered content.'''
+    return quote_etag(hashlib.md5(force_bytes(content)).hexdigest())
+
+
+def is_etag_matched(request, etag):
+    '''Check whether `If-None-Match` header of the request matches the
+    ETag, in which case a 304 response can be sent instead.'''
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match or not etag:
+        return False
+    etags = parse_etags(if_none_match)
+    if '*' in etags:
+        return True
+    # If-None-Match uses weak comparison, which ignores the weak indicator.
+    etag = etag[2:] if etag.startswith('W/') else etag
+    return any(etag == (x[2:] if x.startswith('W/') else x) for x in etags)
+
+
+def dump_response(response):
+    '''Return the cache entry of the rendered response.
+
+    Only status, selected headers and the rendered body are kept, so hits
+    don't unpickle DRF internals such as `data` and the renderer context.
+
+    Returns
+    -------
+    entry: tuple
+        (status_code, headers, is_compressed, content)
     '''
-    cache.clear()
+    content = response.content
+    is_compressed = len(content) >= CACHE_COMPRESS_MIN_SIZE
+    if is_compressed:
+        content = zlib.compress(content)
+    headers = {
+        header: response[header]
+        for header in CACHED_HEADERS if response.has_header(header)
+    }
+    return (response.status_code, headers, is_compressed, content)
+
+
+def load_response(entry):
+    '''Construct HttpResponse from the cache entry.'''
+    status_code, headers, is_compressed, content = entry
+    if is_compressed:
+        content = zlib.decompress(content)
+    response = HttpResponse(content, status=status_code)
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def build_key_for_stale_response(cache_key):
+    '''Construct cache key for the stale copy of the cached response.'''
+    return STALE_KEY_PREFIX + cache_key[len(CACHE_KEY_PREFIX):]
+
+
+def build_key_for_lock(cache_key):
+    '''Construct cache key for the lock of rebuilding the response.'''
+    return LOCK_KEY_PREFIX + cache_key[len(CACHE_KEY_PREFIX):]
+
+
+def build_key_for_list_group_index(request, app_label, model_name,
+                                   pagination_params=(), identity=''):
+    '''Construct cache key for the index of all pages of the list.'''
+    data = {
+        'method': request.method,
+        'app_label': app_label,
+        'model_name': model_name,
+        'uri': _build_uri(request, pagination_params),
+        'fp': _build_finger_print(identity),
+    }
+    return LIST_GROUP_INDEX_KEY_FORMAT.format(**data)
 
 
 def build_key_for_instance_inverted_index(instance_id, app_label, model_name):
@@ -45,3 +149,379 @@ def build_key_for_instance_inverted_index(instance_id, app_label, model_name):
         'instance_id': instance_id,
     }
     return INVERTED_INDEX_KEY_FORMAT.format(**data)
+
+
+def build_key_for_list_index(app_label, model_name):
+    '''Construct cache key for the index of list responses of the model.'''
+    data = {
+        'app_label': app_label,
+        'model_name': model_name,
+    }
+    return LIST_INDEX_KEY_FORMAT.format(**data)
+
+
+def build_key_for_related_index(app_label, model_name):
+    '''Construct cache key for the index of responses which should be
+    evicted on every write of the model.'''
+    data = {
+        'app_label': app_label,
+        'model_name': model_name,
+    }
+    return RELATED_INDEX_KEY_FORMAT.format(**data)
+
+
+def build_key_for_namespace_index(app_label, model_name):
+    '''Construct cache key for the index of all cached responses which
+    depend on the model.'''
+    data = {
+        'app_label': app_label,
+        'model_name': model_name,
+    }
+    return NAMESPACE_INDEX_KEY_FORMAT.format(**data)
+
+
+def build_key_for_model_version(app_label, model_name):
+    '''Construct cache key for the version of the model, which is bumped
+    after writes of the model.'''
+    data = {
+        'app_label': app_label,
+        'model_name': model_name,
+    }
+    return MODEL_VERSION_KEY_FORMAT.format(**data)
+
+
+def _get_redis_client():
+    '''Return the raw redis client if the cache is backed by django-redis,
+    so index updates can be done atomically with redis sets.'''
+    try:
+        return get_redis_connection(CACHE_NAME)
+    except NotImplementedError:
+        return None
+
+
+def update_indexes(members_by_index, timeout):
+    '''Register members (cache keys or nested index keys) in indexes,
+    indexes expire `timeout` seconds after the last registration.
+
+    Parameters
+    ----------
+    members_by_index: dict
+        Mapping from index key to iterable of members.
+    timeout: int
+        The number of seconds before deleting indexes.
+    '''
+    members_by_index = {
+        index_key: set(members)
+        for index_key, members in members_by_index.items() if members
+    }
+    if not members_by_index:
+        return
+    client = _get_redis_client()
+    if client is not None:
+        pipeline = client.pipeline()
+        for index_key, members in members_by_index.items():
+            raw_key = cache.make_key(index_key)
+            pipeline.sadd(raw_key, *members)
+            pipeline.expire(raw_key, timeout)
+        pipeline.execute()
+        return
+    indexes = cache.get_many(list(members_by_index))
+    for index_key, members in members_by_index.items():
+        indexes[index_key] = indexes.get(index_key, set()) | members
+    cache.set_many(indexes, timeout)
+
+
+def add_key_to_indexes(cache_key, index_keys, timeout):
+    '''Register cache key in indexes, indexes expire with the cache key.'''
+    update_indexes({index_key: [cache_key] for index_key in index_keys},
+                   timeout)
+
+
+def _pop_indexes(index_keys):
+    '''Delete indexes and return all their members.'''
+    members = set()
+    client = _get_redis_client()
+    if client is not None:
+        pipeline = client.pipeline()
+        for index_key in index_keys:
+            raw_key = cache.make_key(index_key)
+            pipeline.smembers(raw_key)
+            pipeline.delete(raw_key)
+        results = pipeline.execute()
+        for index_members in results[::2]:
+            members.update(member.decode() for member in index_members)
+    else:
+        for index_members in cache.get_many(index_keys).values():
+            members.update(index_members)
+        cache.delete_many(index_keys)
+    return members
+
+
+def evict_indexes(index_keys):
+    '''Delete indexes and all cache keys registered in them.
+
+    Members of an index might be nested indexes (e.g. an inverted index
+    refers to the list group of the pages containing the instance), they are
+    evicted recursively.
+
+    Returns
+    -------
+    cache_keys: set
+        The cache keys evicted.
+    '''
+    cache_keys = set()
+    evicted_index_keys = set()
+    index_keys = set(index_keys)
+    while index_keys:
+        evicted_index_keys.update(index_keys)
+        members = _pop_indexes(list(index_keys))
+        index_keys = set()
+        for member in members:
+            if member.startswith(CACHE_KEY_PREFIX):
+                cache_keys.add(member)
+            elif member not in evicted_index_keys:
+                index_keys.add(member)
+    if cache_keys:
+        cache.delete_many(list(cache_keys))
+    return cache_keys
+
+
+def bump_versions(version_keys):
+    '''Increase versions, so in-process caches drop entries depending on
+    them.'''
+    client = _get_redis_client()
+    if client is not None:
+        pipeline = client.pipeline()
+        for version_key in version_keys:
+            raw_key = cache.make_key(version_key)
+            pipeline.incr(raw_key)
+            # INCR creates missing versions without expiry.
+            pipeline.expire(raw_key, VERSION_TIMEOUT)
+        pipeline.execute()
+        return
+    for version_key in version_keys:
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            # Versions are initialized when entries depending on them are
+            # stored, nothing to do if there isn't any.
+            pass
+
+
+@lru_cache(maxsize=None)
+def get_model_aliases(model):
+    '''Return models sharing the same database table with the model.
+
+    Some models are unmanaged mappings of auto-created M2M tables (e.g.
+    UserGroup), changes to either of them should invalidate both.
+    '''
+    db_table = model._meta.db_table
+    return tuple(
+        x for x in apps.get_models(include_auto_created=True)
+        if x._meta.db_table == db_table
+    )
+
+
+def build_model_index_keys(model_classes,
+                           key_builder=build_key_for_namespace_index):
+    '''Construct model-level index keys for models and their aliases.'''
+    index_keys = set()
+    for model_cls in model_classes:
+        for alias in get_model_aliases(model_cls):
+            index_keys.add(key_builder(
+                alias._meta.app_label, alias._meta.model_name))
+    return index_keys
+
+
+def _get_models_along_source(model_cls, source):
+    '''Return related models accessed by a dotted field source.'''
+    related_models = set()
+    for attr in source.split('.'):
+        try:
+            field = model_cls._meta.get_field(attr)
+        except FieldDoesNotExist:
+            break
+        if not field.is_relation:
+            break
+        model_cls = field.related_model
+        related_models.add(model_cls)
+        if field.many_to_many:
+            through = getattr(field, 'through', None) or (
+                field.remote_field.through)
+            related_models.add(through)
+    return related_models
+
+
+def _collect_serializer_models(serializer, model_classes):
+    '''Collect models rendered by the serializer and its nested ones.'''
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    model_cls = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    if model_cls is not None:
+        model_classes.add(model_cls)
+    for field in serializer.fields.values():
+        if isinstance(field, serializers.BaseSerializer):
+            _collect_serializer_models(field, model_classes)
+        elif model_cls is None or field.source in (None, '*'):
+            continue
+        elif ('.' in field.source
+              or isinstance(field, serializers.ManyRelatedField)
+              or (isinstance(field, serializers.RelatedField)
+                  and not isinstance(
+                      field, serializers.PrimaryKeyRelatedField))):
+            model_classes.update(
+                _get_models_along_source(model_cls, field.source))
+
+
+@lru_cache(maxsize=None)
+def get_serializer_dependencies(serializer_class):
+    '''Return models whose data are rendered by the serializer class.
+
+    Nested serializers, dotted sources (e.g. `department.name`) and to-many
+    relations are followed. Data read in `SerializerMethodField` can not be
+    inspected, views should declare them explicitly.
+    '''
+    model_classes = set()
+    _collect_serializer_models(serializer_class(), model_classes)
+    return frozenset(model_classes)
+
+
+def schedule_warmup():
+    '''Warm up caches in the background after invalidations, warm-ups are
+    debounced by WARMUP_DELAY seconds.'''
+    if not getattr(settings, 'DRF_CACHE_WARMUP_AFTER_INVALIDATION', False):
+        return
+    if cache.add(WARMUP_SCHEDULE_KEY, True, WARMUP_DELAY):
+        from drf_cache.tasks import warm_up_caches
+        warm_up_caches.apply_async(
+            kwargs={'after_invalidation': True}, countdown=WARMUP_DELAY)
+
+
+def _run_invalidations(version_keys, index_keys):
+    if version_keys:
+        bump_versions(version_keys)
+    if index_keys and evict_indexes(index_keys):
+        schedule_warmup()
+
+
+class InvalidationBatch:
+    '''Invalidations collected to run at once, de-duplicated by keys.'''
+    def __init__(self):
+        self.version_keys = set()
+        self.index_keys = set()
+
+    def add(self, version_keys, index_keys):
+        '''Collect keys to invalidate.'''
+        self.version_keys.update(version_keys)
+        self.index_keys.update(index_keys)
+
+    def flush(self):
+        '''Run collected invalidations.'''
+        version_keys, self.version_keys = self.version_keys, set()
+        index_keys, self.index_keys = self.index_keys, set()
+        _run_invalidations(version_keys, index_keys)
+
+
+_BATCHES = threading.local()
+
+
+def _get_transaction_batch():
+    '''Return the batch flushed when the current transaction commits.'''
+    connection = transaction.get_connection()
+    batch = getattr(_BATCHES, 'transaction_batch', None)
+    # The batch is stale if its callback has run, or has been discarded by
+    # rolling back the (savepoint of the) transaction.
+    if batch is None or all(
+            getattr(func, '__self__', None) is not batch
+            for _, func in connection.run_on_commit):
+        batch = InvalidationBatch()
+        _BATCHES.transaction_batch = batch
+        transaction.on_commit(batch.flush)
+    return batch
+
+
+def _invalidate(version_keys, index_keys):
+    '''Run invalidations, or defer them to the end of the current
+    `batch_invalidation()` block or transaction.'''
+    stack = getattr(_BATCHES, 'stack', None)
+    if stack:
+        stack[-1].add(version_keys, index_keys)
+    elif transaction.get_connection().in_atomic_block:
+        _get_transaction_batch().add(version_keys, index_keys)
+    else:
+        _run_invalidations(version_keys, index_keys)
+
+
+@contextmanager
+def batch_invalidation():
+    '''Collect invalidations in the block and run them once when leaving it.
+
+    Invalidations inside transactions are always deferred to the commit and
+    dropped on rollback. Use this in management commands and Celery tasks
+    doing bulk writes in autocommit mode, it can also decorate functions.
+
+    Example
+    -------
+    with batch_invalidation():
+        for record in records:
+            record.save()
+    '''
+    if not hasattr(_BATCHES, 'stack'):
+        _BATCHES.stack = []
+    batch = InvalidationBatch()
+    _BATCHES.stack.append(batch)
+    try:
+        yield batch
+    finally:
+        _BATCHES.stack.pop()
+        _invalidate(batch.version_keys, batch.index_keys)
+
+
+def invalidate_model_caches(*model_classes):
+    '''Invalidate all cached responses depending on the models.
+
+    Call this after writes which bypass model signals and can not be
+    narrowed down to instances, such as `QuerySet.update()`.
+    '''
+    _invalidate(
+        build_model_index_keys(model_classes, build_key_for_model_version),
+        build_model_index_keys(model_classes))
+
+
+def invalidate_versions(version_keys):
+    '''Bump versions which cached values depend on, once the current
+    `batch_invalidation()` block or transaction ends.'''
+    _invalidate(set(version_keys), set())
+
+
+def invalidate_instance_caches(model_cls, instance_ids, created=False):
+    '''Invalidate cached responses affected by writes of the instances.
+
+    Responses containing the instances are evicted, list responses of the
+    model are evicted only if the instances are newly created.
+    '''
+    index_keys = build_model_index_keys(
+        [model_cls], build_key_for_related_index)
+    if created:
+        index_keys.update(build_model_index_keys(
+            [model_cls], build_key_for_list_index))
+    index_keys.update(
+        build_key_for_instance_inverted_index(
+            instance_id, model_cls._meta.app_label,
+            model_cls._meta.model_name)
+        for instance_id in instance_ids
+    )
+    _invalidate(
+        build_model_index_keys([model_cls], build_key_for_model_version),
+        index_keys)
+
+
+def invalidate_caches_on_model_change(sender, instance, created=False, **__):
+    '''Invalidate caches related to the saved or deleted instance.'''
+    invalidate_instance_caches(sender, [instance.pk], created)
+
+
+def invalidate_caches_on_m2m_change(sender, action, **__):
+    '''Invalidate caches related to the changed M2M relationship.'''
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_model_caches(sender)
@@ -0,0 +1,165 @@
+'''Warm up caches of high-traffic endpoints in the background.'''
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.db import connections
+from django.urls import resolve, reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from drf_cache import (
+    WARMUP_CONCURRENCY, WARMUP_LOCK_KEY, WARMUP_LOCK_TIMEOUT,
+    WARMUP_MAX_USERS, WARMUP_URL_SCHEME
+)
+from infra.utils import prod_logger
+
+
+def recent_users(limit=WARMUP_MAX_USERS, **filters):
+    '''Return identity template of users who logged in recently.
+
+    Parameters
+    ----------
+    limit: int
+        The maximum number of users.
+    filters: dict
+        Lookups to filter users, such as `groups__name__endswith='管理员'`.
+    '''
+    def get_users():
+        return (
+            get_user_model().objects.filter(**filters)
+            .exclude(last_login=None)
+            .order_by('-last_login')
+            .distinct()[:limit]
+        )
+    return get_users
+
+
+class WarmupRegistry:
+    '''Registry of requests and callables whose caches should be warmed up.
+
+    Requests are sent in process as if they were sent by the users returned
+    by their identity templates, to the scheme and host of real requests
+    (the settings `DRF_CACHE_WARMUP_URL_SCHEME` and `DRF_CACHE_WARMUP_HOST`,
+    or `WARMUP_URL_SCHEME` and the domain of the current site), so cache
+    keys match the ones of real requests. Cached requests are cheap cache
+    hits.
+
+    Warm-ups run periodically, and after invalidations unless they are
+    registered with `after_invalidation=False`, e.g. responses depending on
+    models which change all the time would be warmed up over and over.
+    '''
+    def __init__(self):
+        self.requests = []
+        self.callables = []
+
+    # pylint: disable=too-many-arguments
+    def register_request(self, url_name, args=(), query=None, users=None,
+                         after_invalidation=True):
+        '''Register a GET request to warm up.
+
+        Parameters
+        ----------
+        url_name: str
+            The name of the URL pattern, such as `campusevent-list`.
+        args: tuple
+            Arguments of the URL pattern. Default: ()
+        query: dict
+            Query parameters of the request. Default: None
+        users: callable
+            Identity template, returns users sending the request, None for
+            anonymous requests. Default: None
+        after_invalidation: bool
+            Whether to warm up the request after invalidations, otherwise it
+            is only warmed up periodically. Default: True
+        '''
+        self.requests.append(
+            (url_name, tuple(args), query or {}, users, after_invalidation))
+
+    def register_callable(self, func, *args, after_invalidation=True):
+        '''Register a callable which populates its caches when called.'''
+        self.callables.append((func, args, after_invalidation))
+
+    def get_jobs(self, after_invalidation=False):
+        '''Return callables running each warm-up, only the ones warmed up
+        after invalidations if after_invalidation is True.'''
+        # Views register their requests once URLs are loaded, which might
+        # not happen yet in Celery workers.
+        import_module(settings.ROOT_URLCONF)
+        jobs = [partial(func, *args)
+                for func, args, enabled in self.callables
+                if enabled or not after_invalidation]
+        for url_name, args, query, users, enabled in self.requests:
+            if after_invalidation and not enabled:
+                continue
+            for user in users() if users is not None else [None]:
+                jobs.append(partial(
+                    self._send_request, url_name, args, query, user))
+        return jobs
+
+    @staticmethod
+    def _send_request(url_name, args, query, user):
+        '''Send GET request to the view, return the status code.'''
+        path = reverse(url_name, args=args)
+        host = getattr(settings, 'DRF_CACHE_WARMUP_HOST', None) or (
+            Site.objects.get_current().domain)
+        scheme = getattr(settings, 'DRF_CACHE_WARMUP_URL_SCHEME',
+                         WARMUP_URL_SCHEME)
+        request = APIRequestFactory().get(
+            path, query, HTTP_HOST=host, secure=scheme == 'https')
+        if user is not None:
+            force_authenticate(request, user)
+        match = resolve(path)
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+        return response.status_code
+
+    @staticmethod
+    def _run(job):
+        try:
+            job()
+            return True
+        except Exception as exc:  # pylint: disable=W0703
+            msg = f'缓存预热失败：{exc}'
+            prod_logger.warning(msg)
+            return False
+
+    def _run_in_thread(self, job):
+        try:
+            return self._run(job)
+        finally:
+            # Connections are opened per thread.
+            connections.close_all()
+
+    def warm_up(self, max_workers=WARMUP_CONCURRENCY,
+                after_invalidation=False):
+        '''Run all warm-ups with limited concurrency, only the ones warmed up
+        after invalidations if after_invalidation is True.
+
+        Only one warm-up runs at a time among all processes, and at most
+        `max_workers` requests are sent concurrently, so warm-ups can't
+        starve real traffic.
+
+        Returns
+        -------
+        count: int
+            The number of succeeded warm-ups, None if another warm-up is
+            running.
+        '''
+        if not cache.add(WARMUP_LOCK_KEY, True, WARMUP_LOCK_TIMEOUT):
+            return None
+        try:
+            jobs = self.get_jobs(after_invalidation)
+            if max_workers <= 1:
+                return sum(map(self._run, jobs))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                return sum(executor.map(self._run_in_thread, jobs))
+        finally:
+            cache.delete(WARMUP_LOCK_KEY)
+
+
+warmup_registry = WarmupRegistry()  # pylint: disable=invalid-name
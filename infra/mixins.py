@@ -35,6 +35,26 @@ class MultiSerializerActionClassMixin:
         return super().get_serializer_class()
 
 
+class PrefetchObjectPermissionsMixin:
+    '''Prefetch object permissions of the requester for objects of the list
+    page in one query per permission table.
+
+    Permission classes and serializers check object permissions with the
+    checker cached on the user instance (see `User.object_permission_checker`),
+    so checks of objects on the page don't query per object.
+    '''
+    request = None
+
+    def paginate_queryset(self, queryset):
+        '''Prefetch object permissions for the page.'''
+        page = super().paginate_queryset(queryset)
+        prefetch = getattr(self.request.user, 'prefetch_object_permissions',
+                           None)
+        if page and prefetch is not None:
+            prefetch(page)
+        return page
+
+
 class HumanReadableValidationErrorMixin:
     '''Convert field name into human-readable labels in validation errors.
     {
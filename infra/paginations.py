@@ -1,5 +1,14 @@
 '''Provide pagination classes for infra module.'''
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
 from rest_framework import pagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 from infra.utils import positive_int
 from infra.exceptions import BadRequest
@@ -39,3 +48,102 @@ class LimitOffsetPagination(pagination.LimitOffsetPagination):
                 pass
 
         return self.default_limit
+
+
+class KeysetPagination(pagination.BasePagination):
+    '''
+    Paginate querysets by values of the ordering fields of the last object
+    on the previous page instead of offsets, so deep pages are read as fast
+    as the first one by the index on the ordering fields, and objects are
+    never counted.
+
+    Values of `ordering` must be unique together, so the last field is
+    usually the primary key. The first page is requested with an empty
+    cursor, the cursor of the next page is built into `next`.
+    '''
+    # pylint: disable=W0223
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = 10
+    max_page_size = 200
+    ordering = ('-time', '-id')
+
+    def __init__(self):
+        self.request = None
+        self.next_position = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        '''Return objects after the position of the cursor.'''
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.build_position_filter(position))
+        page = list(queryset[:page_size + 1])
+        self.next_position = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_position = [
+                getattr(page[-1], x.lstrip('-')) for x in self.ordering]
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_page_size(self, request):
+        '''Get page size from query params, or the default one.'''
+        try:
+            return positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True, cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def build_position_filter(self, position):
+        '''Return the filter of objects after the position, such as
+        `time < t OR (time = t AND id < i)` for descending time and id.'''
+        condition = Q()
+        for idx in reversed(range(len(self.ordering))):
+            name = self.ordering[idx].lstrip('-')
+            lookup = 'lt' if self.ordering[idx].startswith('-') else 'gt'
+            after = Q(**{f'{name}__{lookup}': position[idx]})
+            if idx + 1 < len(self.ordering):
+                after |= Q(**{name: position[idx]}) & condition
+            condition = after
+        return condition
+
+    def decode_cursor(self, request, model):
+        '''Return the position of the cursor, or None for the first
+        page.'''
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError()
+            return [
+                model._meta.get_field(name.lstrip('-')).to_python(value)
+                for name, value in zip(self.ordering, values)
+            ]
+        except (binascii.Error, TypeError, ValueError, ValidationError):
+            raise BadRequest('无效的分页游标')
+
+    def encode_cursor(self, position):
+        '''Encode the position into a cursor, values which are not JSON
+        serializable (such as datetimes) are encoded as strings in full
+        precision.'''
+        return base64.urlsafe_b64encode(json.dumps(
+            position, default=str).encode()).decode()
+
+    def get_next_link(self):
+        '''Return the url of the next page, None if this is the last.'''
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.encode_cursor(self.next_position))
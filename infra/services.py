@@ -22,8 +22,8 @@ class NotificationService:  # pylint: disable=R0903
     '''Provide services for Notification.'''
     @classmethod
     def _get_notification_robot(cls):
-        robot = User.objects.get(username='notification-robot')
-        return robot
+        from auth.registry import well_known_objects
+        return well_known_objects.get().get_notification_robot()
 
     @staticmethod
     def mark_user_notifications_as_read(user):
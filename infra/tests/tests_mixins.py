@@ -2,7 +2,9 @@
 from unittest.mock import Mock
 from django.test import TestCase
 
-from infra.mixins import MultiSerializerActionClassMixin
+from infra.mixins import (
+    MultiSerializerActionClassMixin, PrefetchObjectPermissionsMixin,
+)
 
 
 class TestMultiSerializerActionClassMixin(TestCase):
@@ -36,3 +38,37 @@ class TestMultiSerializerActionClassMixin(TestCase):
             serializer_class,
             self.viewset.serializer_action_classes['retrieve']
         )
+
+
+class TestPrefetchObjectPermissionsMixin(TestCase):
+    '''Unit tests for PrefetchObjectPermissionsMixin.'''
+    def setUp(self):
+        # pylint: disable=missing-docstring
+        class ViewSet:
+            paginate_queryset = Mock()
+
+        class MyViewSet(PrefetchObjectPermissionsMixin, ViewSet):
+            pass
+
+        self.viewset = MyViewSet()
+        self.viewset.request = Mock()
+        self.mocked_paginate_queryset = ViewSet.paginate_queryset
+
+    def test_prefetch_page(self):
+        '''Should prefetch object permissions for the page.'''
+        page = [Mock(), Mock()]
+        self.mocked_paginate_queryset.return_value = page
+
+        self.assertIs(self.viewset.paginate_queryset(Mock()), page)
+
+        self.viewset.request.user.prefetch_object_permissions\
+            .assert_called_once_with(page)
+
+    def test_skip_without_page(self):
+        '''Should not prefetch if the list is not paginated.'''
+        self.mocked_paginate_queryset.return_value = None
+
+        self.assertIsNone(self.viewset.paginate_queryset(Mock()))
+
+        self.viewset.request.user.prefetch_object_permissions\
+            .assert_not_called()
@@ -2,9 +2,14 @@
 from unittest.mock import patch, Mock
 
 from django.test import TestCase
+from django.utils.timezone import now
+from model_mommy import mommy
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
 
 import infra.paginations as paginations
 import infra.exceptions as exceptions
+from auth.models import User
 
 
 class TestLimitOffsetPagination(TestCase):
@@ -71,3 +76,55 @@ class TestLimitOffsetPagination(TestCase):
         res = self.pagination.get_limit(request)
 
         self.assertIsNone(res)
+
+
+class TestKeysetPagination(TestCase):
+    '''Unit tests for KeysetPagination.'''
+    def setUp(self):
+        self.pagination = paginations.KeysetPagination()
+        self.pagination.ordering = ('-date_joined', '-id')
+        date_joined = now()
+        # Users joined at the same time are ordered by ids.
+        self.users = [mommy.make(User, date_joined=date_joined)
+                      for _ in range(3)]
+        self.users.append(mommy.make(
+            User, date_joined=date_joined.replace(year=2018)))
+
+    def paginate(self, **params):
+        '''Return the page and the cursor of the next page.'''
+        request = Request(APIRequestFactory().get('/users/', params))
+        page = self.pagination.paginate_queryset(
+            User.objects.filter(id__in=[x.id for x in self.users]), request)
+        next_link = self.pagination.get_next_link()
+        if next_link is None:
+            return page, None
+        return page, Request(APIRequestFactory().get(
+            next_link)).query_params['cursor']
+
+    def test_paginate_queryset(self):
+        '''Should return pages in order without overlaps.'''
+        pages = []
+        page, cursor = self.paginate(cursor='', limit=3)
+        pages.append(page)
+        while cursor is not None:
+            page, cursor = self.paginate(cursor=cursor, limit=3)
+            pages.append(page)
+
+        self.assertEqual(pages, [
+            self.users[2::-1], self.users[3:],
+        ])
+
+    def test_get_paginated_response(self):
+        '''Should not count objects.'''
+        self.paginate(limit=10)
+
+        response = self.pagination.get_paginated_response([])
+
+        self.assertEqual(response.data, {'next': None, 'results': []})
+
+    def test_invalid_cursor(self):
+        '''Should raise BadRequest if the cursor is invalid.'''
+        for cursor in ('invalid', self.pagination.encode_cursor(['x', 1]),
+                       self.pagination.encode_cursor([1])):
+            with self.assertRaises(exceptions.BadRequest):
+                self.paginate(cursor=cursor)
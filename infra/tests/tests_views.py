@@ -2,6 +2,7 @@
 from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
 from django.urls import reverse
 from django.utils.timezone import now
 from model_mommy import mommy
@@ -18,6 +19,8 @@ class TestNotificationViewSet(APITestCase):
     def setUpTestData(cls):
         cls.user = mommy.make(get_user_model())
         assign_perm('infra.view_notification', cls.user)
+        mommy.make(Group, name='个人权限').permissions.add(
+            Permission.objects.get(codename='view_notification'))
 
     def test_list_notification(self):
         '''notification list should be accessed by GET request.'''
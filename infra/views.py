@@ -1,15 +1,15 @@
 '''Provide API views for infra module.'''
 from django.utils.timezone import now
-from django.core.cache import cache
 from rest_framework import viewsets, decorators, status
 from rest_framework.response import Response
-from rest_framework_guardian import filters
 
+import auth.filters
 import auth.permissions
 import infra.models
 import infra.serializers
 from infra.services import NotificationService
 from drf_cache.mixins import DRFCacheMixin
+from drf_cache.utils import invalidate_model_caches
 
 
 class NotificationViewSet(DRFCacheMixin, viewsets.ReadOnlyModelViewSet):
@@ -20,7 +20,9 @@ class NotificationViewSet(DRFCacheMixin, viewsets.ReadOnlyModelViewSet):
         .all().order_by('-time')
     )
     serializer_class = infra.serializers.NotificationSerializer
-    filter_backends = (filters.DjangoObjectPermissionsFilter,)
+    filter_backends = (auth.filters.RowScopeFilter,)
+    row_scope_owner_fields = ('recipient',)
+    row_scope_department_fields = ('recipient__department',)
     permission_classes = (
         auth.permissions.DjangoObjectPermissions,
     )
@@ -29,6 +31,7 @@ class NotificationViewSet(DRFCacheMixin, viewsets.ReadOnlyModelViewSet):
         'unread': ['%(app_label)s.view_%(model_name)s'],
         'mark_all_as_read': ['%(app_label)s.view_%(model_name)s'],
     }
+    cache_volatile_actions = ('read', 'unread')
 
     def _get_read_status_filtered_notifications(self, request, is_read):
         '''Return filtered notifications based on read status.'''
@@ -72,5 +75,5 @@ class NotificationViewSet(DRFCacheMixin, viewsets.ReadOnlyModelViewSet):
         '''Mark all notifications as read for user.'''
         count = NotificationService.mark_user_notifications_as_read(
             request.user)
-        cache.clear()
+        invalidate_model_caches(infra.models.Notification)
         return Response({'count': count}, status=status.HTTP_201_CREATED)
@@ -0,0 +1,85 @@
+'''Compare formats of cached DRF responses on a 200-row records page.'''
+# pylint: disable=wrong-import-position,ungrouped-imports,invalid-name
+# pylint: disable=missing-docstring
+import sys
+import os
+import pickle
+import timeit
+from collections import OrderedDict
+from datetime import datetime
+
+import django
+
+sys.path.insert(0, os.path.abspath('.'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TMSFTT.settings_dev')
+django.setup()
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from drf_cache.utils import build_etag, dump_response, load_response
+
+ROWS = 200
+REPEAT = 1000
+
+
+def build_record(index):
+    '''Build data shaped like ReadOnlyRecordSerializer output.'''
+    time = datetime(2019, 10, 1, 8, 0, index % 60).isoformat()
+    return OrderedDict([
+        ('id', index),
+        ('create_time', time),
+        ('update_time', time),
+        ('campus_event', OrderedDict([
+            ('id', index // 10),
+            ('name', f'教学沙龙第{index // 10}期'),
+            ('time', time),
+            ('location', '大连理工大学主校区'),
+            ('num_hours', 2.0),
+            ('program', 1),
+        ])),
+        ('off_campus_event', None),
+        ('user', {
+            'department_str': '电子信息与电气工程学部',
+            'username': f'{10000 + index}',
+            'first_name': '张三',
+        }),
+        ('status', 1),
+        ('contents', [index * 3, index * 3 + 1]),
+        ('attachments', [index]),
+        ('status_str', '已提交'),
+        ('feedback', None),
+        ('role', 0),
+        ('role_str', '参与'),
+        ('allow_actions_from_user', True),
+        ('allow_actions_from_admin', False),
+    ])
+
+
+def build_response():
+    '''Render a paginated response as DRFCacheMixin used to cache it.'''
+    data = OrderedDict([
+        ('count', ROWS * 5),
+        ('next', 'http://testserver/api/records/?limit=200&offset=200'),
+        ('previous', None),
+        ('results', [build_record(index) for index in range(ROWS)]),
+    ])
+    response = Response(data)
+    response.accepted_renderer = JSONRenderer()
+    response.accepted_media_type = 'application/json'
+    response.renderer_context = {}
+    response.render()
+    response['ETag'] = build_etag(response.content)
+    return response
+
+
+def benchmark(name, payload, load):
+    seconds = timeit.timeit(lambda: load(payload), number=REPEAT)
+    print(f'{name:<20}{len(payload):>12}{seconds / REPEAT * 1e6:>16.1f}')
+
+
+page = build_response()
+print(f'{"format":<20}{"bytes":>12}{"hit latency(us)":>16}')
+benchmark('pickled Response', pickle.dumps(page), pickle.loads)
+benchmark('rendered entry', pickle.dumps(dump_response(page)),
+          lambda x: load_response(pickle.loads(x)))
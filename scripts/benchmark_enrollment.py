@@ -0,0 +1,107 @@
+'''Enroll many users concurrently into one popular campus event, and compare
+the conditional update with locking the event for the whole enrollment.
+
+Run it against a local MySQL (settings_dev), e.g.:
+
+    python scripts/benchmark_enrollment.py --users 500 --seats 200
+'''
+# pylint: disable=wrong-import-position,ungrouped-imports,invalid-name
+# pylint: disable=missing-docstring
+import argparse
+import logging
+import sys
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import django
+
+sys.path.insert(0, os.path.abspath('.'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TMSFTT.settings_dev')
+django.setup()
+# Keep logs of each enrollment out of the results.
+logging.disable(logging.INFO)
+
+from django.contrib.auth.models import Group
+from django.db import connection, transaction
+from django.utils.timezone import now
+from model_mommy import mommy
+
+from auth.models import User
+from auth.services import PermissionService
+from infra.exceptions import BadRequest
+from training_event.models import CampusEvent, Enrollment
+from training_event.services import EnrollmentService
+
+
+def enroll_with_lock(enrollment_data):
+    '''The previous enrollment, locking the event until permissions are
+    assigned.'''
+    with transaction.atomic():
+        event = CampusEvent.objects.select_for_update().get(
+            id=enrollment_data['campus_event'].id)
+        if now() > event.deadline:
+            raise BadRequest('报名时间已过')
+        if event.num_enrolled >= event.num_participants:
+            raise BadRequest('报名人数已满')
+        enrollment = Enrollment.objects.create(**enrollment_data)
+        event.num_enrolled += 1
+        event.save()
+        PermissionService.assign_object_permissions(
+            enrollment_data['user'], enrollment)
+        return enrollment
+
+
+def run(name, enroll, users, seats, concurrency):
+    event = mommy.make(CampusEvent, num_participants=seats, num_enrolled=0,
+                       deadline=now() + timedelta(days=1), reviewed=True)
+
+    def enroll_user(user):
+        try:
+            enroll({'campus_event': event, 'user': user})
+            return True
+        except BadRequest:
+            return False
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        accepted = sum(executor.map(enroll_user, users))
+    seconds = time.perf_counter() - start
+
+    event.refresh_from_db()
+    num_enrollments = Enrollment.objects.filter(campus_event=event).count()
+    print(f'{name:<20}{len(users) / seconds:>14.1f}{accepted:>10}'
+          f'{event.num_enrolled:>14}{num_enrollments:>13}')
+    assert accepted == num_enrollments == event.num_enrolled <= seats, (
+        'overbooked or drifted')
+    Enrollment.objects.filter(campus_event=event).delete()
+    event.delete()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--seats', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    # Permissions of enrollments are templated by the personal group.
+    Group.objects.get_or_create(name='个人权限')
+    users = [mommy.make(User, username=f'benchmark-enrollment-{idx}')
+             for idx in range(args.users)]
+    print(f'{"path":<20}{"enrolls/s":>14}{"accepted":>10}'
+          f'{"num_enrolled":>14}{"enrollments":>13}')
+    try:
+        for name, enroll in (
+                ('select_for_update', enroll_with_lock),
+                ('conditional update', EnrollmentService.create_enrollment)):
+            run(name, enroll, users, args.seats, args.concurrency)
+    finally:
+        User.objects.filter(id__in=[x.id for x in users]).delete()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,26 @@
 '''Define how our app behave under different configs.'''
 from django.apps import AppConfig
+from django.db.models import signals
 
 
 class TrainingEventConfig(AppConfig):
     '''Basic config for our app.'''
     name = 'training_event'
     verbose_name = '培训活动'
+
+    def ready(self):
+        '''Drop cached enrollments of users once they enroll or unenroll.'''
+        from training_event.models import Enrollment
+        from training_event.user_enrollments import (
+            invalidate_user_enrollments_on_enrollment_change,
+        )
+        signals.post_save.connect(
+            invalidate_user_enrollments_on_enrollment_change,
+            sender=Enrollment,
+            dispatch_uid=(
+                'training_event_invalidate_user_enrollments_post_save'))
+        signals.post_delete.connect(
+            invalidate_user_enrollments_on_enrollment_change,
+            sender=Enrollment,
+            dispatch_uid=(
+                'training_event_invalidate_user_enrollments_post_delete'))
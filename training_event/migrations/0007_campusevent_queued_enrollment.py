@@ -0,0 +1,18 @@
+# Generated by Django 2.2 on 2026-10-18 04:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training_event', '0006_auto_20190613_1439'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campusevent',
+            name='queued_enrollment',
+            field=models.BooleanField(default=False, verbose_name='是否排队报名'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2 on 2026-10-18 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('training_event', '0007_campusevent_queued_enrollment'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='campusevent',
+            index=models.Index(fields=['reviewed', 'deadline', 'time'], name='training_ev_reviewe_382fae_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='campusevent',
+            index=models.Index(fields=['reviewed', 'time'], name='training_ev_reviewe_c39522_idx'),
+        ),
+    ]
@@ -39,6 +39,13 @@ class CampusEvent(AbstractEvent):
             ('delete_campusevent', '允许删除校内培训活动'),
             ('review_campusevent', '允许审核校内培训活动'),
         )
+        # Events open for enrollment are filtered by reviewed and deadline,
+        # events in a time window (and pages of keyset pagination) by time,
+        # id is appended to secondary indexes by InnoDB.
+        indexes = [
+            models.Index(fields=['reviewed', 'deadline', 'time']),
+            models.Index(fields=['reviewed', 'time']),
+        ]
 
     program = models.ForeignKey(Program, verbose_name='培训项目',
                                 on_delete=models.PROTECT)
@@ -48,6 +55,10 @@ class CampusEvent(AbstractEvent):
     description = models.TextField(verbose_name='活动描述', default='')
     reviewed = models.BooleanField(
         verbose_name='是否已由校级管理员审核确认', default=False)
+    # Seats of popular events are allocated from a queue in the cache, see
+    # `SeatReservationService`.
+    queued_enrollment = models.BooleanField(
+        verbose_name='是否排队报名', default=False)
 
 
 class OffCampusEvent(AbstractEvent):
@@ -1,19 +1,26 @@
 '''Define how to serialize our models.'''
 import smtplib
+from datetime import timedelta
 
 from django.utils.timezone import now
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
 from django.core.mail import send_mass_mail
 from rest_framework import serializers
 
+from auth.models import Department
+from auth.registry import well_known_objects
 import training_event.models
 from training_event.services import EnrollmentService, CampusEventService
+from training_event.user_enrollments import get_user_enrollment_ids
 from infra.mixins import HumanReadableValidationErrorMixin
 from infra.utils import prod_logger
 from infra.services import NotificationService, SOAPSMSService
 from training_program.serializers import ReadOnlyProgramSerializer
 
 User = get_user_model()
+# Enough for a month view with leading and trailing weeks.
+CALENDAR_MAX_WINDOW = timedelta(days=42)
 
 
 class EventCoefficientSerializer(HumanReadableValidationErrorMixin,
@@ -61,37 +68,20 @@ class ReadOnlyCampusEventSerializer(HumanReadableValidationErrorMixin,
 
     def get_enrolled(self, obj):
         '''Get event enrollments status.'''
-        key = 'enrolled_cache'
-        user = self.context['request'].user
-        if key not in self.context:
-            if not isinstance(self.instance, list):
-                instances = [self.instance]
-            else:
-                instances = self.instance
-            res = EnrollmentService.get_user_enrollment_status(
-                instances, user
-            )
-            self.context[key] = res
-        else:
-            res = self.context[key]
-        return res.get(obj.id, None)
+        return self.get_enrollment_id(obj) is not None
 
     def get_enrollment_id(self, obj):
-        '''Get event enrollments id.'''
-        key = 'enrollment_cache'
-        user = self.context['request'].user
+        '''Get id of the enrollment of the user, which is annotated by
+        `EnrollmentService.annotate_user_enrollment_id()`, or read from
+        cached enrollments of the user for events which are not
+        annotated.'''
+        if hasattr(obj, 'user_enrollment_id'):
+            return obj.user_enrollment_id
+        key = 'user_enrollment_ids'
         if key not in self.context:
-            if not isinstance(self.instance, list):
-                instances = [self.instance]
-            else:
-                instances = self.instance
-            res = EnrollmentService.get_user_enrollment_id(
-                instances, user
-            )
-            self.context[key] = res
-        else:
-            res = self.context[key]
-        return res.get(obj.id, None)
+            self.context[key] = get_user_enrollment_ids(
+                self.context['request'].user)
+        return self.context[key].get(obj.id)
 
 
 class BasicReadOnlyCampusEventSerializer(ReadOnlyCampusEventSerializer):
@@ -103,6 +93,23 @@ class BasicReadOnlyCampusEventSerializer(ReadOnlyCampusEventSerializer):
                   'deadline', 'description')
 
 
+class CalendarParametersSerializer(HumanReadableValidationErrorMixin,
+                                   serializers.Serializer):
+    '''Serialize parameters for events in a time window, the window is
+    [start, end).'''
+    # pylint: disable=W0223
+    start = serializers.DateTimeField(label='起始时间')
+    end = serializers.DateTimeField(label='截止时间')
+
+    def validate(self, data):
+        if data['end'] <= data['start']:
+            raise serializers.ValidationError('截止时间应晚于起始时间')
+        if data['end'] - data['start'] > CALENDAR_MAX_WINDOW:
+            raise serializers.ValidationError(
+                f'查询时间跨度不能超过{CALENDAR_MAX_WINDOW.days}天')
+        return data
+
+
 class CampusEventSerializer(HumanReadableValidationErrorMixin,
                             serializers.ModelSerializer):
     '''Indicate how to serializer Campus Event instance.'''
@@ -147,7 +154,8 @@ class CampusEventSerializer(HumanReadableValidationErrorMixin,
         if self.context['request'].user.is_school_admin:
             validated_data['reviewed'] = True
         else:
-            school_admin = User.objects.get(id=10977)
+            school_admin = (
+                well_known_objects.get().get_school_admin_reviewer())
             mails = []
             smses = []
             msg = (
@@ -245,6 +253,49 @@ class EnrollmentSerailizer(HumanReadableValidationErrorMixin,
         return data
 
 
+class BulkEnrollmentSerializer(HumanReadableValidationErrorMixin,
+                               serializers.Serializer):
+    '''Serialize parameters for enrolling many users at once, users are
+    given by their ids, a group or a department (with its subdepartments).'''
+    # pylint: disable=W0223
+    campus_event = serializers.PrimaryKeyRelatedField(
+        label='培训活动',
+        queryset=training_event.models.CampusEvent.objects.all())
+    users = serializers.ListField(
+        label='用户', child=serializers.IntegerField(), required=False,
+        allow_empty=False)
+    group = serializers.PrimaryKeyRelatedField(
+        label='用户组', queryset=Group.objects.all(), required=False)
+    department = serializers.PrimaryKeyRelatedField(
+        label='部门', queryset=Department.objects.all(), required=False)
+
+    def validate(self, data):
+        if not self.context['request'].user.is_school_admin:
+            raise serializers.ValidationError('您没有权限为用户报名该活动')
+        if not data['campus_event'].reviewed:
+            raise serializers.ValidationError('不能报名未经审核的培训活动')
+        sources = [x for x in ('users', 'group', 'department') if x in data]
+        if len(sources) != 1:
+            raise serializers.ValidationError('请指定用户、用户组或部门中的一项')
+        if 'group' in data:
+            data['users'] = list(data['group'].user_set.order_by(
+                'id').values_list('id', flat=True))
+        elif 'department' in data:
+            data['users'] = list(User.objects.filter(
+                department__in=data['department'].get_descendants(),
+            ).order_by('id').values_list('id', flat=True))
+        return data
+
+
+class CancelWaitlistSerializer(HumanReadableValidationErrorMixin,
+                               serializers.Serializer):
+    '''Serialize parameters for leaving the waitlist of a campus event.'''
+    # pylint: disable=W0223
+    campus_event = serializers.PrimaryKeyRelatedField(
+        label='培训活动',
+        queryset=training_event.models.CampusEvent.objects.all())
+
+
 class EnrollmentReadOnlySerailizer(HumanReadableValidationErrorMixin,
                                    serializers.ModelSerializer):
     '''To serializer enrollment instance.'''
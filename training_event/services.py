@@ -1,11 +1,23 @@
 '''Provide services of training event module.'''
 import re
-from django.db import transaction
-from django.utils.timezone import now
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.timezone import localtime, now
+from django_redis import get_redis_connection
 from infra.utils import prod_logger
 from infra.exceptions import BadRequest
 from training_event.models import CampusEvent, Enrollment, EventCoefficient
+from training_event.user_enrollments import invalidate_user_enrollments
+from auth.models import User
 from auth.services import PermissionService
+from drf_cache.utils import invalidate_instance_caches, invalidate_model_caches
+
+RESERVATION_KEY_PREFIX = 'TRAINING_EVENT:RESERVATION:'
+RESERVATION_BATCH_SIZE = 200
 
 
 class CampusEventService:
@@ -107,15 +119,69 @@ class CampusEventService:
             prod_logger.info(msg)
             return event
 
+    @staticmethod
+    def group_events_by_day(events):
+        '''Group campus events by local dates of their time.
+
+        Parameters
+        ----------
+        events: iterable
+            Campus events ordered by time.
+
+        Returns
+        -------
+        events_by_day: OrderedDict
+            Lists of events keyed by dates, dates without events are
+            omitted.
+        '''
+        events_by_day = OrderedDict()
+        for event in events:
+            events_by_day.setdefault(
+                localtime(event.time).date(), []).append(event)
+        return events_by_day
+
 
 class EnrollmentService:
     '''Provide services for Enrollment.'''
     @staticmethod
-    def create_enrollment(enrollment_data):
+    def reserve_seat(event_id):
+        '''Take a seat of the campus event with a single conditional update,
+        which only locks the row of the event while updating it.
+
+        Raises
+        ------
+        BadRequest
+            If the deadline has passed or there are no more seats.
+        '''
+        reserved = CampusEvent.objects.filter(
+            id=event_id, deadline__gte=now(),
+            num_enrolled__lt=F('num_participants'),
+        ).update(num_enrolled=F('num_enrolled') + 1)
+        if not reserved:
+            deadline = CampusEvent.objects.filter(id=event_id).values_list(
+                'deadline', flat=True).first()
+            if deadline is None:
+                raise BadRequest('未找到对应培训活动')
+            if now() > deadline:
+                raise BadRequest('报名时间已过')
+            raise BadRequest('报名人数已满')
+        invalidate_instance_caches(CampusEvent, [event_id])
+
+    @staticmethod
+    def release_seat(event_id):
+        '''Give back a seat of the campus event.'''
+        CampusEvent.objects.filter(id=event_id, num_enrolled__gt=0).update(
+            num_enrolled=F('num_enrolled') - 1)
+        invalidate_instance_caches(CampusEvent, [event_id])
+
+    @classmethod
+    def create_enrollment(cls, enrollment_data):
         '''Create a enrollment for specific campus event.
 
         This action is atomic, will fail if there are no more heads counts for
-        the campus event or duplicated enrollments are created.
+        the campus event or duplicated enrollments are created. The seat is
+        reserved by a conditional update instead of locking the event for
+        the whole enrollment.
 
         Parametsers
         ----------
@@ -128,25 +194,118 @@ class EnrollmentService:
         enrollment: Enrollment
         '''
         with transaction.atomic():
-            # Lock the event until the end of the transaction
-            event = CampusEvent.objects.select_for_update().get(
-                id=enrollment_data['campus_event'].id)
-            if now() > event.deadline:
-                raise BadRequest('报名时间已过')
-            if event.num_enrolled >= event.num_participants:
-                raise BadRequest('报名人数已满')
-
-            enrollment = Enrollment.objects.create(**enrollment_data)
-            # Update the number of enrolled participants
-            event.num_enrolled += 1
-            event.save()
+            cls.reserve_seat(enrollment_data['campus_event'].id)
+            try:
+                enrollment = Enrollment.objects.create(**enrollment_data)
+            except IntegrityError:
+                raise BadRequest('您已报名，请勿重复报名')
             PermissionService.assign_object_permissions(
                 enrollment_data['user'], enrollment)
-
-            return enrollment
+        return enrollment
 
     @staticmethod
-    def delete_enrollment(instance):
+    def insert_enrollments(event_id, enroll_methods):
+        '''Create enrollments of users who have not enrolled in the campus
+        event with a bulk insert, and count them in the number of enrolled
+        participants of the event with a single update.
+
+        Parameters
+        ----------
+        event_id: int
+            Id of the campus event.
+        enroll_methods: dict
+            Enroll methods keyed by ids of users.
+
+        Returns
+        -------
+        enrollments: list
+            Created enrollments, with their users.
+        '''
+        Enrollment.objects.bulk_create([
+            Enrollment(campus_event_id=event_id, user_id=user_id,
+                       enroll_method=enroll_method)
+            for user_id, enroll_method in enroll_methods.items()
+        ])
+        CampusEvent.objects.filter(id=event_id).update(
+            num_enrolled=F('num_enrolled') + len(enroll_methods))
+        invalidate_user_enrollments(enroll_methods)
+        return list(Enrollment.objects.filter(
+            campus_event_id=event_id, user_id__in=list(enroll_methods),
+        ).select_related('user'))
+
+    @classmethod
+    def bulk_create_enrollments(cls, event_id, user_ids,
+                                enroll_method=Enrollment.ENROLL_METHOD_IMPORT):
+        '''Enroll many users in the campus event at once.
+
+        The event is locked once to check its remaining seats, users are
+        enrolled in order until the seats run out. Enrollments and their
+        permissions are written with bulk queries in one transaction.
+
+        Parameters
+        ----------
+        event_id: int
+            Id of the campus event.
+        user_ids: list
+            Ids of users to enroll.
+        enroll_method: int
+            Default: Enrollment.ENROLL_METHOD_IMPORT
+
+        Returns
+        -------
+        results: list
+            The status of each user in the order of user_ids, which is
+            enrolled, already_enrolled, full (no more seats) or not_found.
+
+        Raises
+        ------
+        BadRequest
+            If the event is not found, its deadline has passed, or its seats
+            are allocated from a queue.
+        '''
+        user_ids = list(OrderedDict.fromkeys(user_ids))
+        with transaction.atomic():
+            event = CampusEvent.objects.select_for_update().filter(
+                id=event_id).first()
+            if event is None:
+                raise BadRequest('未找到对应培训活动')
+            if now() > event.deadline:
+                raise BadRequest('报名时间已过')
+            if event.queued_enrollment:
+                raise BadRequest('该培训活动排队报名，不能批量报名')
+            existing = set(User.objects.filter(
+                id__in=user_ids).values_list('id', flat=True))
+            enrolled = set(Enrollment.objects.filter(
+                campus_event_id=event_id, user_id__in=user_ids,
+            ).values_list('user_id', flat=True))
+            candidates = [x for x in user_ids
+                          if x in existing and x not in enrolled]
+            accepted = candidates[
+                :max(event.num_participants - event.num_enrolled, 0)]
+            if accepted:
+                enrollments = cls.insert_enrollments(
+                    event_id, dict.fromkeys(accepted, enroll_method))
+                PermissionService.bulk_assign_object_permissions(
+                    (enrollment.user, enrollment)
+                    for enrollment in enrollments)
+                invalidate_model_caches(CampusEvent, Enrollment)
+        accepted = set(accepted)
+        statuses = {
+            user_id: (
+                'not_found' if user_id not in existing
+                else 'already_enrolled' if user_id in enrolled
+                else 'enrolled' if user_id in accepted
+                else 'full'
+            ) for user_id in user_ids
+        }
+        msg = (f'批量报名了培训活动{event.name}({event.id})，'
+               f'成功{len(accepted)}人，共{len(user_ids)}人')
+        prod_logger.info(msg)
+        return [{'user': user_id, 'status': statuses[user_id]}
+                for user_id in user_ids]
+
+    @classmethod
+    def delete_enrollment(cls, instance):
         """Provide services for delete enrollments.
         Parameters
         ----------
@@ -154,13 +313,59 @@ class EnrollmentService:
             删除的enrollment对象
         """
         with transaction.atomic():
-            # Lock the event until the end of the transaction
-            event = CampusEvent.objects.select_for_update().get(
-                id=instance.campus_event_id
-            )
-            event.num_enrolled -= 1
-            event.save()
-            instance.delete()
+            deleted, _ = Enrollment.objects.filter(id=instance.id).delete()
+            if deleted:
+                cls.release_seat(instance.campus_event_id)
+        if deleted and instance.campus_event.queued_enrollment:
+            SeatReservationService.release(instance)
+
+    @staticmethod
+    def reconcile_num_enrolled(event_ids=None):
+        '''Set numbers of enrolled participants of campus events to counts
+        of their enrollments, in case they drift.
+
+        Parameters
+        ----------
+        event_ids: list
+            Ids of events to reconcile, all events if None. Default: None
+
+        Returns
+        -------
+        num_fixed: int
+            The number of events whose numbers are fixed.
+        '''
+        events = CampusEvent.objects.all()
+        if event_ids is not None:
+            events = events.filter(id__in=event_ids)
+        counts = Enrollment.objects.filter(
+            campus_event=OuterRef('pk'),
+        ).order_by().values('campus_event').annotate(
+            count=Count('id')).values('count')
+        drifted = events.annotate(
+            count=Coalesce(Subquery(counts), 0),
+        ).exclude(num_enrolled=F('count'))
+        num_fixed = 0
+        for event_id, num_enrolled, count in drifted.values_list(
+                'id', 'num_enrolled', 'count'):
+            # Only fix the number if no enrollment is made meanwhile.
+            num_fixed += CampusEvent.objects.filter(
+                id=event_id, num_enrolled=num_enrolled,
+            ).update(num_enrolled=count)
+        if num_fixed:
+            invalidate_model_caches(CampusEvent)
+            msg = f'修正了{num_fixed}个校内培训活动的报名人数'
+            prod_logger.warning(msg)
+        return num_fixed
+
+    @staticmethod
+    def annotate_user_enrollment_id(events, user):
+        '''Annotate campus events with ids of enrollments of the user as
+        `user_enrollment_id`, which is None if the user has not enrolled, so
+        enrollments of a page of events are read with the page.'''
+        return events.annotate(user_enrollment_id=Subquery(
+            Enrollment.objects.filter(
+                campus_event=OuterRef('pk'), user_id=user.id,
+            ).values('id')[:1]))
 
     @staticmethod
     def get_user_enrollment_status(events, user):
@@ -235,3 +440,376 @@ class EnrollmentService:
             campus_event_id=event_id).select_related(
                 'user__department', 'campus_event'
             )
+
+
+def _get_redis_client():
+    '''Return the raw redis client if the cache is backed by django-redis,
+    so queues can be pushed and popped atomically with redis lists.'''
+    try:
+        return get_redis_connection('default')
+    except NotImplementedError:
+        return None
+
+
+class SeatReservationService:
+    '''Allocate seats of campus events with queued enrollment from the
+    cache, so the burst of enrollments when a popular event opens does not
+    wait for the database.
+
+    Remaining seats of an event are an atomic counter in the cache, which is
+    initialized from the event and reservations not written yet. Accepted
+    reservations are queued and written to enrollments in batches by the
+    `write_reservations` task, others are appended to the waitlist of the
+    event, which is promoted as seats are released by deleted enrollments.
+    Writes never exceed the seats of events, reservations which can never
+    be written are moved to a dead-letter queue.
+    '''
+    STATUS_RESERVED = 'reserved'
+    STATUS_WAITLISTED = 'waitlisted'
+
+    @staticmethod
+    def _build_key(name, *args):
+        return RESERVATION_KEY_PREFIX + ':'.join(
+            [name] + [str(arg) for arg in args])
+
+    @staticmethod
+    def _get_timeout(event):
+        '''Keep reservations of the event until a day after its deadline.'''
+        remaining = event.deadline + timedelta(days=1) - now()
+        return max(int(remaining.total_seconds()), 1)
+
+    @staticmethod
+    def _push(key, items, timeout=None, front=False):
+        '''Append items to the queue, or prepend them in order if front is
+        True, return the length of the queue.'''
+        client = _get_redis_client()
+        if client is not None:
+            raw_key = cache.make_key(key)
+            pipeline = client.pipeline()
+            if front:
+                pipeline.lpush(raw_key, *[
+                    cache.client.encode(x) for x in reversed(items)])
+            else:
+                pipeline.rpush(raw_key, *[
+                    cache.client.encode(x) for x in items])
+            if timeout is not None:
+                pipeline.expire(raw_key, timeout)
+            return pipeline.execute()[0]
+        queue = cache.get(key, [])
+        queue = list(items) + queue if front else queue + list(items)
+        cache.set(key, queue, timeout)
+        return len(queue)
+
+    @staticmethod
+    def _pop(key, count):
+        '''Remove at most count items from the head of the queue, and
+        return them.'''
+        client = _get_redis_client()
+        if client is not None:
+            raw_key = cache.make_key(key)
+            pipeline = client.pipeline()
+            pipeline.lrange(raw_key, 0, count - 1)
+            pipeline.ltrim(raw_key, count, -1)
+            return [cache.client.decode(x) for x in pipeline.execute()[0]]
+        queue = cache.get(key, [])
+        if queue:
+            cache.set(key, queue[count:], None)
+        return queue[:count]
+
+    @staticmethod
+    def _remove(key, predicate):
+        '''Remove items matching the predicate from the queue, return the
+        number of items removed.'''
+        client = _get_redis_client()
+        if client is not None:
+            raw_key = cache.make_key(key)
+            matched = [x for x in client.lrange(raw_key, 0, -1)
+                       if predicate(cache.client.decode(x))]
+            pipeline = client.pipeline()
+            for raw_item in matched:
+                pipeline.lrem(raw_key, 1, raw_item)
+            return sum(pipeline.execute())
+        queue = cache.get(key, [])
+        kept = [x for x in queue if not predicate(x)]
+        cache.set(key, kept, None)
+        return len(queue) - len(kept)
+
+    @staticmethod
+    def _read(key):
+        '''Return all items of the queue.'''
+        client = _get_redis_client()
+        if client is not None:
+            return [cache.client.decode(x)
+                    for x in client.lrange(cache.make_key(key), 0, -1)]
+        return cache.get(key, [])
+
+    @classmethod
+    def _queue_writes(cls, items):
+        # pylint: disable=cyclic-import
+        from training_event.tasks import write_reservations
+        cls._push(cls._build_key('PENDING'), items)
+        write_reservations.delay()
+
+    @classmethod
+    def _init_seats(cls, event, timeout):
+        '''Initialize the counter of remaining seats of the event if it is
+        missing, e.g. evicted.
+
+        Reservations which are queued but not written are not counted in
+        num_enrolled, they are counted after reading num_enrolled, so
+        reservations written meanwhile are counted in neither and the
+        counter is never too low. Writes are capped by seats anyway.
+        '''
+        seats_key = cls._build_key('SEATS', event.id)
+        if cache.get(seats_key) is not None:
+            return
+        num_enrolled = CampusEvent.objects.filter(id=event.id).values_list(
+            'num_enrolled', flat=True).first() or 0
+        num_pending = sum(1 for x in cls._read(cls._build_key('PENDING'))
+                          if x[0] == event.id)
+        cache.add(seats_key,
+                  event.num_participants - num_enrolled - num_pending,
+                  timeout)
+
+    @classmethod
+    def reserve(cls, enrollment_data):
+        '''Reserve a seat of the campus event for the user, or put the user
+        on the waitlist of the event if there are no more seats.
+
+        Parameters
+        ----------
+        enrollment_data: dict
+            Validated data of the enrollment, with the campus event and the
+            user.
+
+        Returns
+        -------
+        result: dict
+            The status of the reservation, with the position on the waitlist
+            if the user is waitlisted.
+
+        Raises
+        ------
+        BadRequest
+            If the deadline has passed, or the user has enrolled or reserved
+            a seat.
+        '''
+        event = enrollment_data['campus_event']
+        user = enrollment_data['user']
+        if now() > event.deadline:
+            raise BadRequest('报名时间已过')
+        if Enrollment.objects.filter(campus_event_id=event.id,
+                                     user_id=user.id).exists():
+            raise BadRequest('您已报名，请勿重复报名')
+        timeout = cls._get_timeout(event)
+        user_key = cls._build_key('USER', event.id, user.id)
+        if not cache.add(user_key, True, timeout):
+            raise BadRequest('您已报名，请勿重复报名')
+        item = (event.id, user.id, enrollment_data.get(
+            'enroll_method', Enrollment.ENROLL_METHOD_WEB))
+        try:
+            if cls._take_seat(event, timeout):
+                cls._queue_writes([item])
+                return {'status': cls.STATUS_RESERVED}
+            position = cls._push(cls._build_key('WAITLIST', event.id),
+                                 [item], timeout)
+        except Exception:
+            # Let the user reserve again.
+            cache.delete(user_key)
+            raise
+        msg = f'用户{user}进入了培训活动{event.name}({event.id})的候补队列'
+        prod_logger.info(msg)
+        return {'status': cls.STATUS_WAITLISTED, 'position': position}
+
+    @classmethod
+    def _take_seat(cls, event, timeout):
+        '''Take a remaining seat of the event, return whether there was one.
+
+        The counter is initialized again and decremented once more if it
+        expired or was evicted after it was initialized.
+        '''
+        seats_key = cls._build_key('SEATS', event.id)
+        cls._init_seats(event, timeout)
+        try:
+            remaining = cache.decr(seats_key)
+        except ValueError:
+            cls._init_seats(event, timeout)
+            remaining = cache.decr(seats_key)
+        if remaining >= 0:
+            return True
+        try:
+            cache.incr(seats_key)
+        except ValueError:
+            # The counter is initialized from the event again.
+            pass
+        return False
+
+    @classmethod
+    def cancel(cls, event_id, user_id):
+        '''Remove the user from the waitlist of the event, so the user can
+        reserve a seat again.
+
+        Raises
+        ------
+        BadRequest
+            If the user is not on the waitlist.
+        '''
+        if not cls._remove(cls._build_key('WAITLIST', event_id),
+                           lambda item: item[1] == user_id):
+            raise BadRequest('您不在该培训活动的候补队列中')
+        cache.delete(cls._build_key('USER', event_id, user_id))
+
+    @classmethod
+    def _release_seat(cls, event_id):
+        '''Give a seat of the event to the head of the waitlist, or back to
+        the remaining seats if nobody is waiting, return the promoted
+        reservation or None.'''
+        promoted = cls._pop(cls._build_key('WAITLIST', event_id), 1)
+        if promoted:
+            cls._queue_writes(promoted)
+            return promoted[0]
+        try:
+            cache.incr(cls._build_key('SEATS', event_id))
+        except ValueError:
+            # The counter is initialized from the event again.
+            pass
+        return None
+
+    @classmethod
+    def release(cls, enrollment):
+        '''Release the seat of the deleted enrollment to the head of the
+        waitlist, or back to the remaining seats if nobody is waiting.
+
+        Returns
+        -------
+        user_id: int
+            Id of the promoted user, None if nobody is waiting.
+        '''
+        event_id = enrollment.campus_event_id
+        cache.delete(cls._build_key('USER', event_id, enrollment.user_id))
+        promoted = cls._release_seat(event_id)
+        return None if promoted is None else promoted[1]
+
+    @classmethod
+    def _discard(cls, items):
+        '''Move reservations which can never be written to the dead-letter
+        queue, and release their seats.'''
+        cls._push(cls._build_key('DEAD'), items)
+        for event_id, user_id, _ in items:
+            cache.delete(cls._build_key('USER', event_id, user_id))
+            cls._release_seat(event_id)
+        msg = f'{len(items)}条排队报名记录无法写入，已移入死信队列: {items}'
+        prod_logger.warning(msg)
+
+    @classmethod
+    def write_reservations(cls, batch_size=RESERVATION_BATCH_SIZE):
+        '''Write queued reservations to enrollments, batch by batch.
+
+        Batches which fail with integrity errors are written again one
+        reservation at a time, reservations still failing are discarded.
+        Batches failing otherwise are queued again for the next run.
+
+        Returns
+        -------
+        num_written: int
+            The number of enrollments created.
+        '''
+        pending_key = cls._build_key('PENDING')
+        num_written = 0
+        while True:
+            items = cls._pop(pending_key, batch_size)
+            if not items:
+                return num_written
+            try:
+                num_written += cls._write_batch(items)
+                continue
+            except IntegrityError:
+                pass
+            except Exception:
+                cls._push(pending_key, items)
+                raise
+            for idx, item in enumerate(items):
+                try:
+                    num_written += cls._write_batch([item])
+                except IntegrityError:
+                    cls._discard([item])
+                except Exception:
+                    cls._push(pending_key, items[idx:])
+                    raise
+
+    @staticmethod
+    def _accept_reservations(event, event_id, methods, user_ids,
+                             items_by_status):
+        '''Return enroll methods of reservations of the event which can be
+        written, keyed by ids of users, and sort out the others into
+        items_by_status.'''
+        enrolled = set(Enrollment.objects.filter(
+            campus_event_id=event_id, user_id__in=list(methods),
+        ).values_list('user_id', flat=True))
+        remaining = 0 if event is None else (
+            event.num_participants - event.num_enrolled)
+        accepted = OrderedDict()
+        for user_id, enroll_method in methods.items():
+            item = (event_id, user_id, enroll_method)
+            if event is None or user_id not in user_ids:
+                items_by_status['discarded'].append(item)
+            elif user_id in enrolled:
+                items_by_status['enrolled'].append(item)
+            elif len(accepted) < remaining:
+                accepted[user_id] = enroll_method
+            else:
+                items_by_status['overflowed'].append(item)
+        return accepted
+
+    @classmethod
+    def _return_to_waitlists(cls, items):
+        '''Put reservations beyond remaining seats back to the head of
+        waitlists of their events.'''
+        for event_id in {x[0] for x in items}:
+            cls._push(cls._build_key('WAITLIST', event_id),
+                      [x for x in items if x[0] == event_id], front=True)
+        msg = f'{len(items)}条排队报名记录超出剩余名额，已退回候补队列'
+        prod_logger.warning(msg)
+
+    @classmethod
+    def _write_batch(cls, items):
+        '''Create enrollments of reservations and assign their permissions
+        in one transaction.
+
+        Reservations of users who have enrolled give their seats back.
+        Reservations beyond remaining seats of events (if counters of seats
+        were too high) go back to the head of waitlists, and reservations of
+        deleted events or users are discarded.
+        '''
+        methods_by_event = OrderedDict()
+        for event_id, user_id, enroll_method in items:
+            methods_by_event.setdefault(event_id, OrderedDict())[
+                user_id] = enroll_method
+        enrollments = []
+        items_by_status = defaultdict(list)
+        with transaction.atomic():
+            events = CampusEvent.objects.select_for_update().in_bulk(
+                list(methods_by_event))
+            user_ids = set(User.objects.filter(
+                id__in={x[1] for x in items}).values_list('id', flat=True))
+            for event_id, methods in methods_by_event.items():
+                accepted = cls._accept_reservations(
+                    events.get(event_id), event_id, methods, user_ids,
+                    items_by_status)
+                if accepted:
+                    enrollments.extend(EnrollmentService.insert_enrollments(
+                        event_id, accepted))
+            PermissionService.bulk_assign_object_permissions(
+                (enrollment.user, enrollment) for enrollment in enrollments)
+            if enrollments:
+                invalidate_model_caches(CampusEvent, Enrollment)
+        for event_id, _, _ in items_by_status['enrolled']:
+            cls._release_seat(event_id)
+        if items_by_status['overflowed']:
+            cls._return_to_waitlists(items_by_status['overflowed'])
+        if items_by_status['discarded']:
+            cls._discard(items_by_status['discarded'])
+        if enrollments:
+            msg = f'写入了{len(enrollments)}条排队报名记录'
+            prod_logger.info(msg)
+        return len(enrollments)
@@ -0,0 +1,17 @@
+'''Celery tasks.'''
+from celery import shared_task
+
+from training_event.services import EnrollmentService, SeatReservationService
+
+
+@shared_task
+def reconcile_num_enrolled():
+    '''Fix numbers of enrolled participants of campus events which drift
+    from counts of their enrollments.'''
+    return EnrollmentService.reconcile_num_enrolled()
+
+
+@shared_task
+def write_reservations():
+    '''Write seats reserved from the cache to enrollments.'''
+    return SeatReservationService.write_reservations()
@@ -1,16 +1,24 @@
 '''Unit tests for training_event services.'''
+from unittest.mock import patch
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import IntegrityError
 from django.utils.timezone import now
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.http import HttpRequest
 from model_mommy import mommy
 from infra.exceptions import BadRequest
 from training_event.models import CampusEvent, Enrollment, EventCoefficient
-from training_event.services import EnrollmentService, CampusEventService
+from training_event.services import (
+    EnrollmentService, CampusEventService, SeatReservationService,
+    RESERVATION_KEY_PREFIX,
+)
 from training_program.models import Program
 from auth.models import Department
+from auth.permission_templates import permission_templates
 from auth.utils import assign_perm
+from drf_cache.tests.tests_utils import LOCMEM_CACHES
 
 User = get_user_model()
 
@@ -127,6 +135,102 @@ class TestEnrollmentService(TestCase):
 
         self.assertEqual(count, 1)
 
+    def test_create_enrollment_reserve_seat(self):
+        '''Should take a seat of the event.'''
+        CampusEvent.objects.filter(id=self.event.id).update(
+            num_participants=1, deadline=now().replace(year=2028))
+
+        EnrollmentService.create_enrollment(self.data)
+
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.num_enrolled, 1)
+        with self.assertRaisesMessage(BadRequest, '报名人数已满'):
+            EnrollmentService.create_enrollment(
+                {'campus_event': self.event, 'user': mommy.make(User)})
+
+    @patch('training_event.services.PermissionService'
+           '.assign_object_permissions')
+    def test_create_enrollment_permissions_failed(self, mocked_assign):
+        '''Should roll back the enrollment and the seat if permissions can
+        not be assigned.'''
+        CampusEvent.objects.filter(id=self.event.id).update(
+            num_participants=10, deadline=now().replace(year=2028))
+        mocked_assign.side_effect = Group.DoesNotExist()
+
+        with self.assertRaises(Group.DoesNotExist):
+            EnrollmentService.create_enrollment(self.data)
+
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.num_enrolled, 0)
+        self.assertFalse(Enrollment.objects.exists())
+
+    def test_create_enrollment_duplicated(self):
+        '''Should give back the seat if the enrollment is duplicated.'''
+        CampusEvent.objects.filter(id=self.event.id).update(
+            num_participants=10, deadline=now().replace(year=2028))
+        EnrollmentService.create_enrollment(self.data)
+
+        with self.assertRaisesMessage(BadRequest, '您已报名，请勿重复报名'):
+            EnrollmentService.create_enrollment(self.data)
+
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.num_enrolled, 1)
+
+    def test_bulk_create_enrollments(self):
+        '''Should enroll users until the seats run out, and report the
+        result of each user.'''
+        CampusEvent.objects.filter(id=self.event.id).update(
+            num_participants=3, num_enrolled=1,
+            deadline=now().replace(year=now().year + 1))
+        users = [mommy.make(User) for _ in range(3)]
+        mommy.make(Enrollment, campus_event=self.event, user=users[0])
+
+        results = EnrollmentService.bulk_create_enrollments(
+            self.event.id, [users[0].id, -1, users[1].id, users[2].id,
+                            users[1].id])
+
+        self.assertEqual(results, [
+            {'user': users[0].id, 'status': 'already_enrolled'},
+            {'user': -1, 'status': 'not_found'},
+            {'user': users[1].id, 'status': 'enrolled'},
+            {'user': users[2].id, 'status': 'enrolled'},
+        ])
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.num_enrolled, 3)
+        enrollment = Enrollment.objects.get(user=users[1])
+        self.assertEqual(enrollment.enroll_method,
+                         Enrollment.ENROLL_METHOD_IMPORT)
+        self.assertTrue(users[1].has_perm(
+            'training_event.delete_enrollment', enrollment))
+        results = EnrollmentService.bulk_create_enrollments(
+            self.event.id, [self.user.id])
+        self.assertEqual(results, [{'user': self.user.id, 'status': 'full'}])
+
+    def test_bulk_create_enrollments_event_expired(self):
+        '''Should raise BadRequest if event expired.'''
+        self.event.deadline = now().replace(year=2018)
+        self.event.save()
+
+        with self.assertRaisesMessage(BadRequest, '报名时间已过'):
+            EnrollmentService.bulk_create_enrollments(
+                self.event.id, [self.user.id])
+
+    def test_reconcile_num_enrolled(self):
+        '''Should set numbers of enrolled participants to counts of
+        enrollments.'''
+        events = [mommy.make(CampusEvent, num_enrolled=3) for _ in range(2)]
+        for user in [mommy.make(User) for _ in range(3)]:
+            mommy.make(Enrollment, user=user, campus_event=events[0])
+
+        num_fixed = EnrollmentService.reconcile_num_enrolled(
+            [x.id for x in events])
+
+        self.assertEqual(num_fixed, 1)
+        self.assertEqual(
+            list(CampusEvent.objects.filter(id__in=[x.id for x in events])
+                 .order_by('id').values_list('num_enrolled', flat=True)),
+            [3, 0])
+
     def test_get_user_enrollment_status(self):
         '''Should get user enrollment status.'''
         events = [mommy.make(CampusEvent) for _ in range(10)]
@@ -166,6 +270,8 @@ class TestEnrollmentService(TestCase):
                                 user=self.user, campus_event=self.event)
         EnrollmentService.delete_enrollment(enrollment)
         self.assertEqual(Enrollment.objects.count(), 0)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.num_enrolled, 1)
 
     def test_get_enrollments(self):
         '''Should get matched enrollments'''
@@ -178,3 +284,233 @@ class TestEnrollmentService(TestCase):
         count = EnrollmentService.get_enrollments(
             1, context={'user': user}).count()
         self.assertEqual(count, 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+@patch('training_event.tasks.write_reservations')
+class TestSeatReservationService(TestCase):
+    '''Test services provided by SeatReservationService.'''
+    def setUp(self):
+        cache.clear()
+        self.event = mommy.make(
+            CampusEvent, num_participants=2, num_enrolled=1,
+            deadline=now().replace(year=now().year + 1),
+            queued_enrollment=True)
+        self.users = [mommy.make(User) for _ in range(3)]
+        group = mommy.make(Group, name='个人权限')
+        assign_perm('training_event.delete_enrollment', group)
+
+    def tearDown(self):
+        # Templates are kept in the process across the cache settings.
+        permission_templates.clear()
+
+    def reserve(self, user):
+        '''Reserve a seat of the event for the user.'''
+        return SeatReservationService.reserve(
+            {'campus_event': self.event, 'user': user})
+
+    def test_reserve(self, mocked_task):
+        '''Should reserve remaining seats, and waitlist others.'''
+        results = [self.reserve(user) for user in self.users]
+
+        self.assertEqual(results, [
+            {'status': 'reserved'},
+            {'status': 'waitlisted', 'position': 1},
+            {'status': 'waitlisted', 'position': 2},
+        ])
+        mocked_task.delay.assert_called_once_with()
+        self.assertFalse(Enrollment.objects.exists())
+
+    def test_reserve_duplicated(self, _):
+        '''Should raise BadRequest if the user has reserved a seat.'''
+        self.reserve(self.users[0])
+
+        with self.assertRaisesMessage(BadRequest, '您已报名，请勿重复报名'):
+            self.reserve(self.users[0])
+
+    def test_reserve_event_expired(self, _):
+        '''Should raise BadRequest if event expired.'''
+        self.event.deadline = now().replace(year=2018)
+
+        with self.assertRaisesMessage(BadRequest, '报名时间已过'):
+            self.reserve(self.users[0])
+
+    def test_reserve_enrolled(self, _):
+        '''Should raise BadRequest without taking a seat if the user has
+        enrolled.'''
+        mommy.make(Enrollment, campus_event=self.event, user=self.users[0])
+
+        with self.assertRaisesMessage(BadRequest, '您已报名，请勿重复报名'):
+            self.reserve(self.users[0])
+        self.assertEqual(self.reserve(self.users[1]), {'status': 'reserved'})
+
+    def test_reserve_seats_evicted(self, _):
+        '''Should count pending reservations when the counter of seats is
+        initialized again.'''
+        self.reserve(self.users[0])
+        cache.delete(f'{RESERVATION_KEY_PREFIX}SEATS:{self.event.id}')
+
+        self.assertEqual(self.reserve(self.users[1]),
+                         {'status': 'waitlisted', 'position': 1})
+
+    def test_reserve_seats_expired(self, _):
+        '''Should initialize the counter of seats again if it expired before
+        it was decremented.'''
+        decr = cache.decr
+
+        def expire_and_decr(key, *args, **kwargs):
+            if mocked_decr.call_count == 1:
+                cache.delete(key)
+            return decr(key, *args, **kwargs)
+
+        with patch.object(cache, 'decr',
+                          side_effect=expire_and_decr) as mocked_decr:
+            result = self.reserve(self.users[0])
+
+        self.assertEqual(result, {'status': 'reserved'})
+        self.assertEqual(mocked_decr.call_count, 2)
+
+    def test_reserve_failed(self, _):
+        '''Should let the user reserve again if the reservation failed.'''
+        with patch.object(cache, 'decr', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                self.reserve(self.users[0])
+
+        self.assertEqual(self.reserve(self.users[0]), {'status': 'reserved'})
+
+    def test_cancel(self, _):
+        '''Should remove the user from the waitlist, so the user can
+        reserve again.'''
+        for user in self.users:
+            self.reserve(user)
+
+        SeatReservationService.cancel(self.event.id, self.users[1].id)
+
+        self.assertEqual(self.reserve(self.users[1]),
+                         {'status': 'waitlisted', 'position': 2})
+
+    def test_cancel_not_waitlisted(self, _):
+        '''Should raise BadRequest if the user is not waitlisted.'''
+        self.reserve(self.users[0])
+
+        with self.assertRaisesMessage(BadRequest, '您不在该培训活动的候补队列中'):
+            SeatReservationService.cancel(self.event.id, self.users[0].id)
+
+    def test_write_reservations(self, _):
+        '''Should write reserved seats to enrollments in batches.'''
+        self.event.num_participants = 4
+        self.event.save()
+        for user in self.users:
+            self.reserve(user)
+
+        num_written = SeatReservationService.write_reservations(batch_size=2)
+
+        self.assertEqual(num_written, 3)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.num_enrolled, 4)
+        for user in self.users:
+            enrollment = Enrollment.objects.get(user=user)
+            self.assertTrue(user.has_perm(
+                'training_event.delete_enrollment', enrollment))
+        self.assertEqual(SeatReservationService.write_reservations(), 0)
+
+    def test_write_reservations_enrolled(self, _):
+        '''Should skip reservations which are already enrolled.'''
+        self.reserve(self.users[0])
+        mommy.make(Enrollment, campus_event=self.event, user=self.users[0])
+
+        self.assertEqual(SeatReservationService.write_reservations(), 0)
+
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.num_enrolled, 1)
+        self.assertEqual(self.reserve(self.users[1]), {'status': 'reserved'})
+
+    def test_write_reservations_overbooked(self, _):
+        '''Should put reservations beyond remaining seats back to the head
+        of the waitlist.'''
+        self.reserve(self.users[0])
+        CampusEvent.objects.filter(id=self.event.id).update(num_enrolled=2)
+
+        self.assertEqual(SeatReservationService.write_reservations(), 0)
+
+        self.assertFalse(Enrollment.objects.exists())
+        SeatReservationService.cancel(self.event.id, self.users[0].id)
+
+    def test_write_reservations_user_deleted(self, _):
+        '''Should discard reservations of deleted users, and release their
+        seats.'''
+        self.reserve(self.users[0])
+        user_id = self.users[0].id
+        self.users[0].delete()
+
+        self.assertEqual(SeatReservationService.write_reservations(), 0)
+
+        self.assertEqual(cache.get(f'{RESERVATION_KEY_PREFIX}DEAD'), [(
+            self.event.id, user_id, Enrollment.ENROLL_METHOD_WEB)])
+        self.assertEqual(self.reserve(self.users[1]), {'status': 'reserved'})
+
+    def test_write_reservations_integrity_error(self, _):
+        '''Should write reservations of failed batches one at a time, and
+        discard ones still failing.'''
+        self.event.num_participants = 4
+        self.event.save()
+        for user in self.users[:2]:
+            self.reserve(user)
+        insert_enrollments = EnrollmentService.insert_enrollments
+
+        def insert(event_id, enroll_methods):
+            if self.users[0].id in enroll_methods:
+                raise IntegrityError()
+            return insert_enrollments(event_id, enroll_methods)
+
+        with patch.object(EnrollmentService, 'insert_enrollments',
+                          side_effect=insert):
+            self.assertEqual(SeatReservationService.write_reservations(), 1)
+
+        self.assertTrue(Enrollment.objects.filter(user=self.users[1]).exists())
+        self.assertEqual(cache.get(f'{RESERVATION_KEY_PREFIX}DEAD'), [(
+            self.event.id, self.users[0].id, Enrollment.ENROLL_METHOD_WEB)])
+
+    @patch('training_event.services.PermissionService'
+           '.bulk_assign_object_permissions')
+    def test_write_reservations_permissions_failed(self, mocked_assign, _):
+        '''Should roll back enrollments and queue reservations again if
+        permissions failed to be assigned.'''
+        self.reserve(self.users[0])
+        mocked_assign.side_effect = Group.DoesNotExist()
+
+        with self.assertRaises(Group.DoesNotExist):
+            SeatReservationService.write_reservations()
+
+        self.assertFalse(Enrollment.objects.exists())
+        mocked_assign.side_effect = None
+        self.assertEqual(SeatReservationService.write_reservations(), 1)
+
+    def test_promote_waitlist(self, mocked_task):
+        '''Should promote the head of the waitlist when an enrollment is
+        deleted.'''
+        for user in self.users:
+            self.reserve(user)
+        SeatReservationService.write_reservations()
+        enrollment = Enrollment.objects.get(user=self.users[0])
+
+        EnrollmentService.delete_enrollment(enrollment)
+        SeatReservationService.write_reservations()
+
+        self.assertEqual(mocked_task.delay.call_count, 2)
+        self.assertTrue(Enrollment.objects.filter(
+            campus_event=self.event, user=self.users[1]).exists())
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.num_enrolled, 2)
+        self.assertEqual(self.reserve(self.users[0]),
+                         {'status': 'waitlisted', 'position': 2})
+
+    def test_release_seat(self, _):
+        '''Should give back the seat if nobody is waiting.'''
+        self.reserve(self.users[0])
+        SeatReservationService.write_reservations()
+
+        EnrollmentService.delete_enrollment(
+            Enrollment.objects.get(user=self.users[0]))
+
+        self.assertEqual(self.reserve(self.users[1]), {'status': 'reserved'})
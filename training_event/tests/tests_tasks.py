@@ -0,0 +1,18 @@
+'''Unit tests for Celery tasks.'''
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from training_event.tasks import reconcile_num_enrolled
+
+
+class TestReconcileNumEnrolled(TestCase):
+    '''Unit tests for reconcile_num_enrolled().'''
+    @patch('training_event.tasks.EnrollmentService')
+    def test_reconcile_num_enrolled(self, mocked_service):
+        '''Should reconcile numbers of all events.'''
+        mocked_service.reconcile_num_enrolled.return_value = 2
+
+        self.assertEqual(reconcile_num_enrolled(), 2)
+
+        mocked_service.reconcile_num_enrolled.assert_called_with()
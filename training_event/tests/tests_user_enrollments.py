@@ -0,0 +1,68 @@
+'''Unit tests for cached enrollments of users.'''
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils.timezone import now
+from model_mommy import mommy
+
+from auth.models import User
+from drf_cache.tests.tests_utils import LOCMEM_CACHES, run_commit_hooks
+from training_event.models import CampusEvent, Enrollment
+from training_event.services import EnrollmentService
+from training_event.user_enrollments import get_user_enrollment_ids
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TestUserEnrollments(TestCase):
+    '''Unit tests for get_user_enrollment_ids().'''
+    def setUp(self):
+        cache.clear()
+        self.user = mommy.make(User)
+        self.events = [
+            mommy.make(CampusEvent, num_participants=10,
+                       deadline=now().replace(year=now().year + 1))
+            for _ in range(2)
+        ]
+        self.enrollment = mommy.make(Enrollment, user=self.user,
+                                     campus_event=self.events[0])
+        run_commit_hooks()
+
+    def test_cached(self):
+        '''Should read cached enrollments without queries.'''
+        expected = {self.events[0].id: self.enrollment.id}
+        self.assertEqual(get_user_enrollment_ids(self.user), expected)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_enrollment_ids(self.user.id), expected)
+
+    def test_invalidated_on_enroll(self):
+        '''Should drop cached enrollments once the user enrolls.'''
+        get_user_enrollment_ids(self.user)
+
+        enrollment = mommy.make(Enrollment, user=self.user,
+                                campus_event=self.events[1])
+        run_commit_hooks()
+
+        self.assertEqual(get_user_enrollment_ids(self.user), {
+            self.events[0].id: self.enrollment.id,
+            self.events[1].id: enrollment.id,
+        })
+
+    def test_invalidated_on_bulk_enroll(self):
+        '''Should drop cached enrollments once the user is enrolled in
+        bulk.'''
+        get_user_enrollment_ids(self.user)
+
+        EnrollmentService.insert_enrollments(
+            self.events[1].id, {self.user.id: Enrollment.ENROLL_METHOD_IMPORT})
+        run_commit_hooks()
+
+        self.assertIn(self.events[1].id, get_user_enrollment_ids(self.user))
+
+    def test_invalidated_on_unenroll(self):
+        '''Should drop cached enrollments once the user unenrolls.'''
+        get_user_enrollment_ids(self.user)
+
+        EnrollmentService.delete_enrollment(self.enrollment)
+        run_commit_hooks()
+
+        self.assertEqual(get_user_enrollment_ids(self.user), {})
@@ -1,9 +1,10 @@
 '''Unit tests for training_event views.'''
+from datetime import timedelta
 from unittest.mock import patch
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.urls import reverse
-from django.utils.timezone import now
+from django.utils.timezone import localtime, now
 from model_mommy import mommy
 from rest_framework import status
 from rest_framework.test import APITestCase
@@ -108,6 +109,83 @@ class TestCampusEventViewSet(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_list_campus_event_enrolled(self):
+        '''Should mark events which the user has enrolled in.'''
+        events = [mommy.make(training_event.models.CampusEvent)
+                  for _ in range(2)]
+        for event in events:
+            PermissionService.assign_object_permissions(self.user, event)
+        enrollment = mommy.make(training_event.models.Enrollment,
+                                user=self.user, campus_event=events[0])
+        url = reverse('campusevent-list')
+
+        response = self.client.get(url, {'limit': 10})
+
+        results = {x['id']: x for x in response.data['results']}
+        self.assertEqual(
+            (results[events[0].id]['enrolled'],
+             results[events[0].id]['enrollment_id']),
+            (True, enrollment.id))
+        self.assertEqual(
+            (results[events[1].id]['enrolled'],
+             results[events[1].id]['enrollment_id']),
+            (False, None))
+
+    def test_list_campus_event_keyset(self):
+        '''Should paginate events by keyset if the cursor is given.'''
+        events = [mommy.make(training_event.models.CampusEvent,
+                             time=now().replace(year=2019, month=month))
+                  for month in (1, 2, 3)]
+        for event in events:
+            PermissionService.assign_object_permissions(self.user, event)
+        url = reverse('campusevent-list')
+
+        response = self.client.get(url, {'cursor': '', 'limit': 2})
+
+        self.assertNotIn('count', response.data)
+        self.assertEqual([x['id'] for x in response.data['results']],
+                         [events[2].id, events[1].id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([x['id'] for x in response.data['results']],
+                         [events[0].id])
+        self.assertIsNone(response.data['next'])
+
+    def test_calendar(self):
+        '''Should group events in the window by days.'''
+        start = now().replace(year=2019, month=6, day=1, hour=0)
+        events = [
+            mommy.make(training_event.models.CampusEvent,
+                       time=start + timedelta(days=days, hours=hours))
+            for days, hours in ((0, 10), (0, 8), (2, 9), (30, 0))
+        ]
+        for event in events:
+            PermissionService.assign_object_permissions(self.user, event)
+        url = reverse('campusevent-calendar')
+
+        response = self.client.get(url, {
+            'start': start.isoformat(),
+            'end': (start + timedelta(days=30)).isoformat(),
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(x['date'], [event['id'] for event in x['events']])
+             for x in response.data],
+            [(localtime(events[1].time).date(), [events[1].id, events[0].id]),
+             (localtime(events[2].time).date(), [events[2].id])])
+
+    def test_calendar_invalid_window(self):
+        '''Should not query events in windows which are too long.'''
+        start = now()
+        url = reverse('campusevent-calendar')
+
+        response = self.client.get(url, {
+            'start': start.isoformat(),
+            'end': (start + timedelta(days=90)).isoformat(),
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_delete_campus_event(self):
         '''CampusEvent should be deleted by DELETE request.'''
         campus_event = mommy.make(training_event.models.CampusEvent)
@@ -262,6 +340,81 @@ class TestEnrollmentViewSet(APITestCase):
         obj = training_event.models.Enrollment.objects.get()
         self.assertEqual(obj.campus_event.pk, campus_event.pk)
 
+    @patch('training_event.views.SeatReservationService.reserve')
+    def test_create_queued_enrollment(self, mocked_reserve):
+        '''Should reserve a seat for events with queued enrollment.'''
+        mocked_reserve.return_value = {'status': 'waitlisted', 'position': 1}
+        campus_event = mommy.make(
+            training_event.models.CampusEvent,
+            deadline=now().replace(year=now().year + 1),
+            reviewed=True, queued_enrollment=True,
+        )
+        url = reverse('enrollment-list')
+
+        response = self.client.post(url, {'campus_event': campus_event.pk},
+                                    format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data, mocked_reserve.return_value)
+        self.assertFalse(training_event.models.Enrollment.objects.exists())
+
+    @patch('training_event.views.SeatReservationService.cancel')
+    def test_cancel_waitlist(self, mocked_cancel):
+        '''Should remove the user from the waitlist by POST request.'''
+        campus_event = mommy.make(training_event.models.CampusEvent)
+        url = reverse('enrollment-cancel-waitlist')
+
+        response = self.client.post(url, {'campus_event': campus_event.pk},
+                                    format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        mocked_cancel.assert_called_once_with(campus_event.id, self.user.id)
+
+    def test_bulk_enroll(self):
+        '''Should enroll users of a department by POST request.'''
+        admin = mommy.make(User, is_staff=True)
+        admin.groups.add(self.group)
+        self.client.force_authenticate(admin)
+        department = mommy.make(auth.models.Department)
+        users = [mommy.make(User, department=department) for _ in range(2)]
+        campus_event = mommy.make(
+            training_event.models.CampusEvent, num_participants=10,
+            deadline=now().replace(year=now().year + 1), reviewed=True)
+        url = reverse('enrollment-bulk-enroll')
+        data = {'campus_event': campus_event.pk, 'department': department.pk}
+
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, [
+            {'user': user.id, 'status': 'enrolled'} for user in users])
+
+    def test_bulk_enroll_without_users(self):
+        '''Should require exactly one of users, group and department.'''
+        admin = mommy.make(User, is_staff=True)
+        admin.groups.add(self.group)
+        self.client.force_authenticate(admin)
+        campus_event = mommy.make(training_event.models.CampusEvent,
+                                  reviewed=True)
+        url = reverse('enrollment-bulk-enroll')
+
+        response = self.client.post(url, {'campus_event': campus_event.pk},
+                                    format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_enroll_not_admin(self):
+        '''Should not enroll users if the user is not a school admin.'''
+        campus_event = mommy.make(training_event.models.CampusEvent,
+                                  reviewed=True)
+        url = reverse('enrollment-bulk-enroll')
+        data = {'campus_event': campus_event.pk, 'users': [self.user.id]}
+
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(training_event.models.Enrollment.objects.exists())
+
     def test_delete_enrollment(self):
         '''Enrollment should be deleted by DELETE request.'''
         user = mommy.make(User)
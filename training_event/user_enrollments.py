@@ -0,0 +1,62 @@
+'''Enrollments of users cached in the shared cache, so events read outside
+of `CampusEventViewSet` are marked as enrolled without querying the
+database for each page.'''
+from django.core.cache import cache
+
+from drf_cache.local import LocalCache
+from drf_cache.utils import invalidate_versions
+from training_event.models import Enrollment
+
+USER_ENROLLMENTS_KEY_PREFIX = 'TRAINING_EVENT:USER_ENROLLMENTS:'
+USER_ENROLLMENTS_VERSION_KEY_PREFIX = (
+    'TRAINING_EVENT:USER_ENROLLMENTS_VERSION:')
+USER_ENROLLMENTS_TIMEOUT = 10 * 60
+
+
+def build_key_for_user_enrollments_version(user_id):
+    '''Construct cache key for the version of enrollments of the user, which
+    is bumped after the user enrolls or unenrolls.'''
+    return f'{USER_ENROLLMENTS_VERSION_KEY_PREFIX}{user_id}'
+
+
+def get_user_enrollment_ids(user):
+    '''Return ids of enrollments of the user keyed by ids of their events.
+
+    Enrollments are cached under the version of enrollments of the user, so
+    enrollments read before changes commit are never read again. They are
+    read from the database if the shared cache does not keep versions.
+
+    Parameters
+    ----------
+    user: User or int
+        The user or id of the user.
+    '''
+    user_id = getattr(user, 'pk', user)
+    version_key = build_key_for_user_enrollments_version(user_id)
+    versions = LocalCache.get_versions([version_key])
+
+    def load():
+        return dict(Enrollment.objects.filter(user_id=user_id).values_list(
+            'campus_event_id', 'id'))
+
+    if versions is None:
+        return load()
+    key = f'{USER_ENROLLMENTS_KEY_PREFIX}{user_id}:{versions[version_key]}'
+    enrollment_ids = cache.get(key)
+    if enrollment_ids is None:
+        enrollment_ids = load()
+        cache.set(key, enrollment_ids, USER_ENROLLMENTS_TIMEOUT)
+    return enrollment_ids
+
+
+def invalidate_user_enrollments(user_ids):
+    '''Drop cached enrollments of users once the current transaction
+    commits.'''
+    invalidate_versions(
+        build_key_for_user_enrollments_version(x) for x in user_ids)
+
+
+def invalidate_user_enrollments_on_enrollment_change(instance, **_):
+    '''Drop cached enrollments of the user whose enrollment is saved or
+    deleted.'''
+    invalidate_user_enrollments([instance.user_id])
@@ -1,28 +1,39 @@
 '''Provide API views for training_event module.'''
 import django_filters
-from django.core.cache import cache
 from rest_framework import mixins, viewsets, views, status, decorators
 from rest_framework.response import Response
 from rest_framework_guardian import filters
 
 import auth.permissions
-from training_event.services import EnrollmentService, CampusEventService
+from training_event.services import (
+    EnrollmentService, CampusEventService, SeatReservationService,
+)
 from training_event.models import (
     CampusEvent, OffCampusEvent, Enrollment, EventCoefficient
 )
 from training_event.serializers import (
     ReadOnlyCampusEventSerializer, CampusEventSerializer,
     OffCampusEventSerializer, EnrollmentSerailizer,
-    EnrollmentReadOnlySerailizer,
+    EnrollmentReadOnlySerailizer, BulkEnrollmentSerializer,
+    CalendarParametersSerializer, CancelWaitlistSerializer,
 )
 import training_event.serializers
 import training_event.filters
-from infra.mixins import MultiSerializerActionClassMixin
+from infra.mixins import (
+    MultiSerializerActionClassMixin, PrefetchObjectPermissionsMixin,
+)
+from infra.paginations import KeysetPagination
+from drf_cache.local import LocalCache
 from drf_cache.mixins import DRFCacheMixin
+from drf_cache.warmup import recent_users
+
+# Choices are small and read on every page, keep them in process.
+CHOICES_CACHE = LocalCache(max_entries=16, max_bytes=64 * 1024)
 
 
 class CampusEventViewSet(DRFCacheMixin,
                          MultiSerializerActionClassMixin,
+                         PrefetchObjectPermissionsMixin,
                          viewsets.ModelViewSet):
     '''Create API views for CampusEvent.'''
     queryset = (
@@ -47,7 +58,55 @@ class CampusEventViewSet(DRFCacheMixin,
     )
     perms_map = {
         'review_event': ['%(app_label)s.review_%(model_name)s'],
+        'calendar': ['%(app_label)s.view_%(model_name)s'],
     }
+    cache_dependencies = ('training_event.enrollment',)
+    # Lists are ordered by time, which can be changed.
+    cache_volatile_actions = ('list',)
+    # Events are evicted on every enrollment, only warm them up
+    # periodically.
+    cache_warmup = (
+        {'url_name': 'campusevent-list', 'users': recent_users(),
+         'after_invalidation': False},
+    )
+
+    @property
+    def paginator(self):
+        '''Paginate events by keyset on (time, id) if the cursor is given,
+        even if it is empty for the first page.'''
+        if not hasattr(self, '_paginator'):
+            # pylint: disable=W0201
+            if KeysetPagination.cursor_query_param in (
+                    self.request.query_params):
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def get_queryset(self):
+        '''Annotate events with enrollments of the user for reading.'''
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve', 'calendar'):
+            queryset = EnrollmentService.annotate_user_enrollment_id(
+                queryset, self.request.user)
+        return queryset
+
+    @decorators.action(methods=['GET'], detail=False, url_path='calendar')
+    def calendar(self, request):
+        '''Return events in the window [start, end) grouped by days.'''
+        params = CalendarParametersSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        events = self.filter_queryset(self.get_queryset()).filter(
+            time__gte=params.validated_data['start'],
+            time__lt=params.validated_data['end'],
+        ).order_by('time', 'id')
+        events_by_day = CampusEventService.group_events_by_day(events)
+        return Response([
+            {
+                'date': date,
+                'events': self.get_serializer(day_events, many=True).data,
+            } for date, day_events in events_by_day.items()
+        ])
 
     @decorators.action(methods=['POST'], detail=True,
                        url_path='review-event')
@@ -84,12 +143,52 @@ class EnrollmentViewSet(DRFCacheMixin,
     filter_fields = ('campus_event',)
     perms_map = {
         'event_enrollments': ['training_event.view_enrollment'],
+        'bulk_enroll': ['training_event.add_enrollment'],
+        'cancel_waitlist': ['training_event.add_enrollment'],
     }
+    cache_dependencies = ('tmsftt_auth.user', 'tmsftt_auth.department')
+
+    def create(self, request, *args, **kwargs):
+        '''Enroll the user, or reserve a seat for the user if the event
+        allocates seats from a queue, in which case the enrollment is
+        created later and the status of the reservation is returned.'''
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        if serializer.validated_data['campus_event'].queued_enrollment:
+            result = SeatReservationService.reserve(serializer.validated_data)
+            return Response(result, status=status.HTTP_202_ACCEPTED)
+        self.perform_create(serializer)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED,
+                        headers=headers)
 
     def perform_destroy(self, instance):
         '''Use service to change num_enrolled and delete enrollment.'''
         EnrollmentService.delete_enrollment(instance)
 
+    @decorators.action(methods=['POST'], detail=False,
+                       url_path='bulk-enroll')
+    def bulk_enroll(self, request):
+        '''Enroll many users in the campus event at once, and return the
+        result of each user.'''
+        serializer = BulkEnrollmentSerializer(
+            data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        results = EnrollmentService.bulk_create_enrollments(
+            serializer.validated_data['campus_event'].id,
+            serializer.validated_data['users'])
+        return Response(results, status=status.HTTP_201_CREATED)
+
+    @decorators.action(methods=['POST'], detail=False,
+                       url_path='cancel-waitlist')
+    def cancel_waitlist(self, request):
+        '''Remove the user from the waitlist of the campus event.'''
+        serializer = CancelWaitlistSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        SeatReservationService.cancel(
+            serializer.validated_data['campus_event'].id, request.user.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @decorators.action(methods=['GET'], detail=False,
                        url_path='event-enrollments')
     def event_enrollments(self, request):
@@ -105,16 +204,13 @@ class RoundChoicesView(views.APIView):
     '''Create API view for get round choices of event coefficient.'''
     def get(self, request, format=None):  # pylint: disable=redefined-builtin
         '''define how to get round choices.'''
-        cache_key = 'round-choices'
-        round_choices = cache.get(cache_key)
-        if round_choices is None:
-            round_choices = [
+        round_choices = CHOICES_CACHE.get_or_set(
+            'round-choices', lambda: [
                 {
                     'type': round_type,
                     'name': name,
                 } for round_type, name in EventCoefficient.ROUND_CHOICES
-            ]
-            cache.set(cache_key, round_choices, 10 * 60)
+            ], 10 * 60)
         return Response(round_choices, status=status.HTTP_200_OK)
 
 
@@ -122,14 +218,11 @@ class RoleChoicesView(views.APIView):
     '''Create API view for get choices of roles.'''
     def get(self, request, format=None):  # pylint: disable=redefined-builtin
         '''define how to get role choices.'''
-        cache_key = 'role-choices'
-        role_choices = cache.get(cache_key)
-        if role_choices is None:
-            role_choices = [
+        role_choices = CHOICES_CACHE.get_or_set(
+            'role-choices', lambda: [
                 {
                     'role': role,
                     'role_str': role_str,
                 } for role, role_str in EventCoefficient.ROLE_CHOICES
-            ]
-            cache.set(cache_key, role_choices, 10 * 60)
+            ], 10 * 60)
         return Response(role_choices, status=status.HTTP_200_OK)
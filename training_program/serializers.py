@@ -2,7 +2,7 @@
 from rest_framework import serializers
 
 from infra.mixins import HumanReadableValidationErrorMixin
-from auth.models import Department
+from auth.registry import well_known_objects
 from training_program.models import Program
 from training_program.services import ProgramService
 
@@ -26,7 +26,7 @@ class ProgramSerializer(HumanReadableValidationErrorMixin,
         '''Forbid illegal create of department.'''
         # Override department for school admin.
         if self.context['request'].user.is_school_admin:
-            department = Department.objects.get(name='大连理工大学')
+            department = well_known_objects.get().get_school_department()
         if self.instance is not None:
             if department.id != self.instance.department.id:
                 raise serializers.ValidationError('不可以修改培训项目的院系')
@@ -6,7 +6,6 @@ from django.db import transaction
 from training_program.models import Program
 from infra.utils import prod_logger
 from infra.exceptions import BadRequest
-from auth.models import Department
 from auth.services import PermissionService, DepartmentService
 
 
@@ -88,8 +87,7 @@ class ProgramService:
             map(lambda x: x.replace('-管理员', '')[0: -7], admin_departments))
         top_departments = {
             x['id']: x['name'] for x in
-            DepartmentService.get_top_level_departments()
-            .union(Department.objects.filter(name='大连理工大学'))
+            DepartmentService.get_top_level_departments(include_school=True)
             .values('id', 'name')
         }
         programs = Program.objects.filter(
@@ -1,6 +1,5 @@
 '''Provide API views for training_program module.'''
 import django_filters
-from django.core.cache import cache
 from rest_framework.decorators import action
 from rest_framework import views, viewsets, status
 from rest_framework.response import Response
@@ -12,8 +11,12 @@ import training_program.models
 import training_program.serializers
 from training_program.services import ProgramService
 from infra.mixins import MultiSerializerActionClassMixin
+from drf_cache.local import LocalCache
 from drf_cache.mixins import DRFCacheMixin
 
+# Choices are small and read on every page, keep them in process.
+CHOICES_CACHE = LocalCache(max_entries=16, max_bytes=64 * 1024)
+
 
 class ProgramViewSet(DRFCacheMixin,
                      MultiSerializerActionClassMixin,
@@ -39,6 +42,8 @@ class ProgramViewSet(DRFCacheMixin,
     perms_map = {
         'get_group_programs': ['%(app_label)s.view_%(model_name)s']
     }
+    cache_dependencies = ('tmsftt_auth.department',)
+    cache_volatile_actions = ('get_group_programs',)
 
     @action(detail=False, url_path='group-programs', url_name='group')
     def get_group_programs(self, request):
@@ -52,15 +57,12 @@ class ProgramCategoryView(views.APIView):
     '''get program categories from background.'''
     def get(self, request, format=None):  # pylint: disable=redefined-builtin
         '''define how to get program categories'''
-        cache_key = 'program-categories'
-        program_categories = cache.get(cache_key)
-        if program_categories is None:
-            program_categories = [
+        program_categories = CHOICES_CACHE.get_or_set(
+            'program-categories', lambda: [
                 {
                     'type': program_type,
                     'name': program_type_name,
                 } for program_type, program_type_name in (
                     training_program.models.Program.PROGRAM_CATEGORY_CHOICES)
-            ]
-            cache.set(cache_key, program_categories, 10 * 60)
+            ], 10 * 60)
         return Response(program_categories, status=status.HTTP_200_OK)
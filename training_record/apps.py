@@ -1,8 +1,20 @@
 '''Define how our app behave under different configs.'''
 from django.apps import AppConfig
+from django.db.models import signals
 
 
 class TrainingRecordConfig(AppConfig):
     '''Basic config for our app.'''
     name = 'training_record'
     verbose_name = '培训记录'
+
+    def ready(self):
+        '''Drop cached records of users once fields of users rendered along
+        with records are changed.'''
+        from django.contrib.auth import get_user_model
+        from training_record.services import (
+            invalidate_record_caches_on_user_change
+        )
+        signals.post_save.connect(
+            invalidate_record_caches_on_user_change, sender=get_user_model(),
+            dispatch_uid='training_record_invalidate_caches_user_post_save')
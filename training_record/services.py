@@ -9,6 +9,7 @@ from django.contrib.auth import get_user_model
 from django.utils.timezone import now, localtime
 from django.core.mail import send_mass_mail
 
+from auth.registry import well_known_objects
 from auth.services import PermissionService
 from infra.utils import prod_logger
 from infra.services import (
@@ -16,6 +17,7 @@ from infra.services import (
     SOAPMSGService,
     SOAPSMSService)
 from infra.exceptions import BadRequest
+from drf_cache.utils import invalidate_instance_caches
 from training_record.models import (
     Record, RecordContent, RecordAttachment,
     CampusEventFeedback, StatusChangeLog
@@ -26,6 +28,11 @@ from tiny_url.services import TinyURLService
 
 
 User = get_user_model()
+# Fields of users rendered along with their records.
+RECORD_USER_FIELDS = frozenset((
+    'username', 'first_name', 'cell_phone_number', 'email',
+    'technical_title', 'department', 'department_id',
+))
 
 
 class RecordService:
@@ -79,23 +86,21 @@ class RecordService:
                 user=user,
                 event_coefficient=event_coefficient,
             )
-            PermissionService.assign_object_permissions(user, record)
+            created_objects = [record]
 
             for content in contents:
-                record_content = RecordContent.objects.create(
+                created_objects.append(RecordContent.objects.create(
                     record=record,
                     **content
-                )
-                PermissionService.assign_object_permissions(
-                    user, record_content)
+                ))
 
             for attachment in attachments:
-                record_attachment = RecordAttachment.objects.create(
+                created_objects.append(RecordAttachment.objects.create(
                     record=record,
                     path=attachment,
-                )
-                PermissionService.assign_object_permissions(
-                    user, record_attachment)
+                ))
+            PermissionService.bulk_assign_object_permissions(
+                (user, x) for x in created_objects)
             msg = (f'用户{user}创建了其参加'
                    + f'{off_campus_event.name}'
                    + f'({off_campus_event.id})活动的培训记录')
@@ -169,13 +174,10 @@ class RecordService:
             record.event_coefficient.save()
 
             # add attachments
-            for attachment in attachments:
-                record_attachment = RecordAttachment.objects.create(
-                    record=record,
-                    path=attachment,
-                )
-                PermissionService.assign_object_permissions(
-                    user, record_attachment)
+            created_objects = [
+                RecordAttachment.objects.create(record=record, path=attachment)
+                for attachment in attachments
+            ]
 
             if RecordAttachment.objects.filter(record=record).count() > 3:
                 raise BadRequest('最多允许上传3个附件')
@@ -184,12 +186,12 @@ class RecordService:
             # they have been changed or not.
             record.contents.all().delete()
             for content in contents:
-                record_content = RecordContent.objects.create(
+                created_objects.append(RecordContent.objects.create(
                     record=record,
                     **content
-                )
-                PermissionService.assign_object_permissions(
-                    user, record_content)
+                ))
+            PermissionService.bulk_assign_object_permissions(
+                (user, x) for x in created_objects)
             # reset status
             pre_status = record.status
             record.status = Record.STATUS_SUBMITTED
@@ -304,7 +306,6 @@ class RecordService:
                         raise BadRequest('第{}行，已经存在用户名为{}的用户参加该活动的培训记录'.format(
                             index + 1, username))
 
-                    PermissionService.assign_object_permissions(user, record)
                     records.add(record)
 
                     msg = (f'管理员{admin}创建了用户{user}参加'
@@ -340,6 +341,9 @@ class RecordService:
                     }
                     msges.append(msg_info)
 
+                PermissionService.bulk_assign_object_permissions(
+                    (x.user, x) for x in records)
+
         except Exception as exc:
             if isinstance(exc, (BadRequest, IntegrityError)):
                 raise
@@ -424,7 +428,8 @@ class RecordService:
             NotificationService.send_system_notification(record.user, msg)
 
             if is_approved:
-                school_admin = User.objects.get(id=10977)
+                school_admin = (
+                    well_known_objects.get().get_school_admin_reviewer())
                 msg = (
                     '有新的培训记录需要审核'
                 )
@@ -542,6 +547,24 @@ class RecordService:
 
         return list(events)
 
+    @staticmethod
+    def invalidate_caches_of_users(user_ids):
+        '''Evict cached responses containing records of the users.'''
+        record_ids = list(Record.objects.filter(
+            user_id__in=user_ids).values_list('id', flat=True))
+        if record_ids:
+            invalidate_instance_caches(Record, record_ids)
+
+
+def invalidate_record_caches_on_user_change(instance, update_fields=None,
+                                            **_):
+    '''Evict cached responses containing records of the saved user. Saves of
+    fields not rendered along with records, such as `last_login`, are
+    ignored.'''
+    if update_fields is not None and not RECORD_USER_FIELDS & update_fields:
+        return
+    RecordService.invalidate_caches_of_users([instance.pk])
+
 
 class CampusEventFeedbackService:
     '''Provide services for CampusEventFeedback.'''
@@ -6,7 +6,10 @@ from unittest.mock import patch, PropertyMock
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from model_mommy import mommy
 from rest_framework import status
@@ -15,6 +18,8 @@ from rest_framework.test import APITestCase
 from auth.utils import assign_perm
 from auth.services import PermissionService
 from auth.models import Department
+from auth.permission_templates import permission_templates
+from drf_cache.tests.tests_utils import LOCMEM_CACHES, run_commit_hooks
 import training_record.models
 from training_record.models import (
     Record, RecordContent, CampusEventFeedback)
@@ -82,6 +87,59 @@ class TestRecordViewSet(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_list_record_moved_onto_cached_page(self):
+        '''Should evict cached pages if a record is moved onto them.'''
+        cache.clear()
+        # Templates are kept in the process across the cache settings.
+        self.addCleanup(permission_templates.clear)
+        records = [mommy.make(
+            Record, user=self.user, status=Record.STATUS_SUBMITTED,
+            off_campus_event=mommy.make(training_event.models.OffCampusEvent),
+        ) for _ in range(2)]
+        for record in records:
+            PermissionService.assign_object_permissions(self.user, record)
+        run_commit_hooks()
+        url = reverse('record-list')
+        response = self.client.get(url, {'limit': 1})
+        self.assertEqual(response.json()['results'][0]['id'], records[1].id)
+
+        records[0].status = Record.STATUS_FEEDBACK_REQUIRED
+        records[0].save()
+        run_commit_hooks()
+        response = self.client.get(url, {'limit': 1})
+
+        self.assertEqual(response.json()['results'][0]['id'], records[0].id)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_retrieve_record_user_changed(self):
+        '''Should keep cached records if fields of the user not rendered are
+        changed, and evict them once rendered fields are changed.'''
+        cache.clear()
+        self.addCleanup(permission_templates.clear)
+        record = mommy.make(
+            Record, user=self.user, status=Record.STATUS_SUBMITTED,
+            off_campus_event=mommy.make(training_event.models.OffCampusEvent))
+        PermissionService.assign_object_permissions(self.user, record)
+        run_commit_hooks()
+        url = reverse('record-detail', args=(record.pk,))
+        self.client.get(url)
+
+        user = User.objects.get(pk=self.user.pk)
+        user.save(update_fields=['last_login'])
+        run_commit_hooks()
+        with patch('training_record.views.RecordViewSet.retrieve') as retrieve:
+            response = self.client.get(url)
+        retrieve.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        user.first_name = '张三'
+        user.save(update_fields=['first_name'])
+        run_commit_hooks()
+        response = self.client.get(url)
+
+        self.assertEqual(response.json()['user']['first_name'], '张三')
+
     def test_list_reviewed_record(self):
         '''should return records which are already reviewed.'''
         url = reverse('record-reviewed')
@@ -99,6 +157,64 @@ class TestRecordViewSet(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), 3)
 
+    def test_list_record_with_constant_queries(self):
+        '''Should read roles of the requester once per page.'''
+        url = reverse('record-list')
+        admin_group = mommy.make(Group, name='创新创业学院-1-管理员')
+        self.user.groups.add(admin_group)
+
+        def count_queries():
+            # Authenticate as a fresh instance as in a real request.
+            self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, {'limit': 50})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(response.data['results']), len(context)
+
+        for _ in range(5):
+            record = mommy.make(
+                Record, user=self.user, status=Record.STATUS_SUBMITTED,
+                off_campus_event=mommy.make(
+                    training_event.models.OffCampusEvent))
+            PermissionService.assign_object_permissions(self.user, record)
+        num_results, num_queries = count_queries()
+        for _ in range(15):
+            record = mommy.make(
+                Record, user=self.user, status=Record.STATUS_SUBMITTED,
+                off_campus_event=mommy.make(
+                    training_event.models.OffCampusEvent))
+            PermissionService.assign_object_permissions(self.user, record)
+        more_results, more_queries = count_queries()
+
+        self.assertEqual((num_results, more_results), (5, 20))
+        self.assertEqual(num_queries, more_queries)
+
+    def test_list_record_prefetch_object_permissions(self):
+        '''Should prefetch object permissions of the page with constant
+        queries, so later checks of objects on the page don't query.'''
+        url = reverse('record-list')
+
+        def list_records(num_records):
+            for _ in range(num_records):
+                record = mommy.make(
+                    Record, user=self.user, status=Record.STATUS_SUBMITTED,
+                    off_campus_event=mommy.make(
+                        training_event.models.OffCampusEvent))
+                PermissionService.assign_object_permissions(self.user, record)
+            user = User.objects.get(pk=self.user.pk)
+            self.client.force_authenticate(user)
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, {'limit': 50})
+            records = list(Record.objects.filter(
+                id__in=[x['id'] for x in response.data['results']]))
+            with self.assertNumQueries(0):
+                for record in records:
+                    self.assertTrue(user.has_perm(
+                        'training_record.change_record', record))
+            return len(context)
+
+        self.assertEqual(list_records(2), list_records(10))
+
     @patch('training_record.views.RecordViewSet.paginate_queryset')
     def test_return_full_if_no_pagination(self, mocked_paginate):
         '''should return full page if no pagination is required.'''
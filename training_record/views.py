@@ -3,8 +3,8 @@ import django_filters
 from django.db.models import Q
 from rest_framework import viewsets, status, decorators, mixins
 from rest_framework.response import Response
-from rest_framework_guardian import filters
 
+import auth.filters
 import auth.permissions
 from auth.models import User
 import training_record.models
@@ -20,7 +20,9 @@ from training_record.serializers import (CampusEventFeedbackSerializer,
                                          ReadOnlyRecordSerializer)
 from training_event.serializers import CampusEventSerializer
 from training_event.models import CampusEvent
-from infra.mixins import MultiSerializerActionClassMixin
+from infra.mixins import (
+    MultiSerializerActionClassMixin, PrefetchObjectPermissionsMixin,
+)
 from infra.exceptions import BadRequest
 from drf_cache.mixins import DRFCacheMixin
 
@@ -28,10 +30,12 @@ from drf_cache.mixins import DRFCacheMixin
 # pylint: disable=C0103
 class RecordViewSet(DRFCacheMixin,
                     MultiSerializerActionClassMixin,
+                    PrefetchObjectPermissionsMixin,
                     viewsets.ModelViewSet):
     '''Create API views for Record.'''
     queryset = (
         training_record.models.Record.objects.all()
+        .select_related('user__department')
         .select_related('campus_event__program__department')
         .select_related('off_campus_event')
         .select_related('event_coefficient')
@@ -63,8 +67,22 @@ class RecordViewSet(DRFCacheMixin,
         'list_records_by_event': ['%(app_label)s.view_%(model_name)s'],
         'get_recent_events': ['%(app_label)s.view_%(model_name)s'],
     }
-    filter_backends = (filters.DjangoObjectPermissionsFilter,
+    # Records of users are evicted explicitly once fields of users rendered
+    # by `ReadOnlyRecordSerializer.get_user()` are changed, see
+    # `invalidate_record_caches_on_user_change()`.
+    cache_dependencies = (
+        'tmsftt_auth.department', 'training_event.enrollment',
+    )
+    # Lists are ordered by status, updating a record might move it onto
+    # any page of the list.
+    cache_volatile_actions = (
+        'list', 'list_records_by_event', 'reviewed',
+        'list_records_for_review', 'get_recent_events',
+    )
+    filter_backends = (auth.filters.RowScopeFilter,
                        django_filters.rest_framework.DjangoFilterBackend,)
+    row_scope_owner_fields = ('user',)
+    row_scope_department_fields = ('user__department',)
     permission_classes = (
         auth.permissions.DjangoObjectPermissions,
     )
@@ -243,8 +261,10 @@ class RecordContentViewSet(DRFCacheMixin,
     queryset = training_record.models.RecordContent.objects.all()
     serializer_class = training_record.serializers.RecordContentSerializer
     filter_class = training_record.filters.RecordContentFilter
-    filter_backends = (filters.DjangoObjectPermissionsFilter,
+    filter_backends = (auth.filters.RowScopeFilter,
                        django_filters.rest_framework.DjangoFilterBackend,)
+    row_scope_owner_fields = ('record__user',)
+    row_scope_department_fields = ('record__user__department',)
     permission_classes = (
         auth.permissions.DjangoObjectPermissions,
     )
@@ -258,8 +278,10 @@ class RecordAttachmentViewSet(DRFCacheMixin,
     queryset = training_record.models.RecordAttachment.objects.all()
     serializer_class = training_record.serializers.RecordAttachmentSerializer
     filter_class = training_record.filters.RecordAttachmentFilter
-    filter_backends = (filters.DjangoObjectPermissionsFilter,
+    filter_backends = (auth.filters.RowScopeFilter,
                        django_filters.rest_framework.DjangoFilterBackend,)
+    row_scope_owner_fields = ('record__user',)
+    row_scope_department_fields = ('record__user__department',)
     permission_classes = (
         auth.permissions.DjangoObjectPermissions,
     )
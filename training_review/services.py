@@ -40,8 +40,6 @@ class ReviewNoteService:
             review_note = ReviewNote.objects.create(user=user,
                                                     record=record,
                                                     content=content)
-            PermissionService.assign_object_permissions(
-                user, review_note)
-            PermissionService.assign_object_permissions(
-                record.user, review_note)
+            PermissionService.bulk_assign_object_permissions([
+                (user, review_note), (record.user, review_note)])
             return review_note
@@ -1,18 +1,20 @@
 '''Provide API views for training_review module.'''
 import django_filters
 from rest_framework import viewsets, mixins
-from rest_framework_guardian import filters
 
+import auth.filters
 import auth.permissions
 import training_review.models
 import training_review.serializers
 import training_review.filters
+from infra.mixins import PrefetchObjectPermissionsMixin
 from drf_cache.mixins import DRFCacheMixin
 
 
 class ReviewNoteViewSet(DRFCacheMixin,
                         mixins.CreateModelMixin,
                         mixins.ListModelMixin,
+                        PrefetchObjectPermissionsMixin,
                         viewsets.GenericViewSet):
     '''Create API views for ReviewNote.'''
     queryset = (
@@ -22,8 +24,11 @@ class ReviewNoteViewSet(DRFCacheMixin,
     )
     serializer_class = training_review.serializers.ReviewNoteSerializer
     filter_class = training_review.filters.ReviewNoteFilter
-    filter_backends = (filters.DjangoObjectPermissionsFilter,
+    filter_backends = (auth.filters.RowScopeFilter,
                        django_filters.rest_framework.DjangoFilterBackend,)
+    row_scope_owner_fields = ('user', 'record__user')
+    row_scope_department_fields = ('user__department',
+                                   'record__user__department')
     permission_classes = (
         auth.permissions.DjangoObjectPermissions,
     )